@@ -1,4 +1,6 @@
-from flask import Flask
+import time
+
+from flask import Flask, g
 from flask_sqlalchemy import SQLAlchemy
 from flask_jwt_extended import JWTManager
 from flask_cors import CORS
@@ -13,6 +15,8 @@ def create_app(config_class=Config):
     app.config.from_object(config_class)
     
     # 初始化扩展
+    from app.services.db_pool import engine_options
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config)
     db.init_app(app)
     jwt.init_app(app)
     
@@ -21,7 +25,8 @@ def create_app(config_class=Config):
         r"*": {
             "origins": "*",  # 允许所有域名访问
             "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-            "allow_headers": ["Content-Type", "Authorization", "X-Requested-With"]
+            "allow_headers": ["Content-Type", "Authorization", "X-Requested-With", "If-None-Match"],
+            "expose_headers": ["ETag"]
         }
     })
     
@@ -43,17 +48,56 @@ def create_app(config_class=Config):
     from app.repository import bp as repository_bp
     app.register_blueprint(repository_bp, url_prefix='/repository')
     
-    # 在应用上下文中导入 User 模型
-    with app.app_context():
-        from app.models import User
-        
-        @jwt.user_identity_loader
-        def user_identity_lookup(user):
-            return str(user.id)  # 返回字符串类型的用户 ID
-        
-        @jwt.user_lookup_loader
-        def user_lookup_callback(_jwt_header, jwt_data):
-            identity = jwt_data["sub"]  # identity 是字符串类型的用户 ID
-            return User.query.get(int(identity))  # 将字符串转换为整数后查询用户
+    from app.search import bp as search_bp
+    app.register_blueprint(search_bp, url_prefix='/search')
+    
+    from app.ops import bp as ops_bp
+    app.register_blueprint(ops_bp, url_prefix='/ops')
+    
+    # 健康检查和指标接口不带前缀：/health、/health/ready、/metrics
+    from app.monitor import bp as monitor_bp
+    app.register_blueprint(monitor_bp)
+    
+    # 注册运维命令行工具
+    from app.commands import register_commands
+    register_commands(app)
+    
+    # 启动知识库文件的后台导入任务调度（每个 worker 进程一个）
+    if app.config.get('INGESTION_ENABLED', True):
+        from app.services.ingestion import init_ingestion
+        init_ingestion(app)
+    
+    # 回答消息的后写日志（每个 worker 进程一个），启动后重放已退出进程遗留的日志
+    if app.config.get('MESSAGE_JOURNAL_ENABLED', True):
+        from app.services.message_journal import init_message_journal
+        init_message_journal(app)
+    
+    # 请求耗时和各组件状态指标，由 /metrics 导出
+    if app.config.get('METRICS_ENABLED', True):
+        from app.services.metrics import init_metrics, observe_request
+        init_metrics(app)
+
+        @app.before_request
+        def start_request_timer():
+            g.request_started = time.perf_counter()
+
+        @app.after_request
+        def record_request(response):
+            observe_request(response)
+            return response
+    
+    from app.services.identity import load_identity
+
+    @jwt.user_identity_loader
+    def user_identity_lookup(user):
+        # 登录时传入 User，刷新令牌时传入的已经是字符串类型的用户 ID
+        return str(getattr(user, 'id', user))
+
+    @jwt.user_lookup_loader
+    def user_lookup_callback(_jwt_header, jwt_data):
+        # 每个请求只调用一次，结果保存在请求上下文中，处理函数通过 current_user 取用；
+        # 跨请求由进程内的 TTL 缓存复用，缓存命中时不查询数据库
+        identity = jwt_data["sub"]  # identity 是字符串类型的用户 ID
+        return load_identity(int(identity), app.config)
     
     return app
\ No newline at end of file
@@ -1,28 +1,91 @@
-from flask import Blueprint, request, current_app, Response, stream_with_context
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask import Blueprint, request, current_app, Response, g, stream_with_context
+from flask_jwt_extended import jwt_required, current_user
 from langchain_core.messages import AIMessage
+from sqlalchemy import or_
+from sqlalchemy.orm import load_only
+import threading
 import time
+import uuid
 
 from app import db
-from app.models import Chat, Message, Model, User
+from app.models import Chat, Message, Repository
 from app.services.chat_service import ChatService
+from app.services.checkpointer import get_checkpointer
+from app.services.message_journal import get_message_journal
+from app.services.metrics import add_timing, observe_chat_turn
+from app.services.model_catalog import get_model_catalog
+from app.services.prompt_assembler import estimate_tokens
+from app.services.sse import get_stream_registry, iter_frames, parse_event_id
+from common.pagination import decode_cursor, encode_cursor, parse_limit
 from common.result import Result
 import json
 
 bp = Blueprint('chat', __name__)
 
+def _keyset_page(query, model, limit, cursor=None, descending=False):
+    """按 (created_at, id) 做键集分页，返回 (本页记录, 下一页游标)
+
+    游标之后的记录直接从 (所属外键, created_at, id) 组合索引上定位，翻到第几页耗时都一样。
+    """
+    if cursor:
+        created_at, row_id = decode_cursor(cursor)
+        # 单独的 created_at 范围条件让数据库直接在索引上定位起点，OR 只用来处理时间相同的记录
+        if descending:
+            query = query.filter(model.created_at <= created_at,
+                                 or_(model.created_at < created_at, model.id < row_id))
+        else:
+            query = query.filter(model.created_at >= created_at,
+                                 or_(model.created_at > created_at, model.id > row_id))
+    if descending:
+        query = query.order_by(model.created_at.desc(), model.id.desc())
+    else:
+        query = query.order_by(model.created_at.asc(), model.id.asc())
+    rows = query.limit(limit + 1).all()
+    next_cursor = encode_cursor(rows[limit - 1].created_at, rows[limit - 1].id) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+
+def _chat_dict(chat):
+    return {
+        'id': chat.id,
+        'title': chat.title,
+        'created_at': chat.created_at.isoformat()
+    }
+
+
+def _message_dict(msg):
+    return {
+        'id': msg.id,
+        'role': msg.role,
+        'content': msg.content,
+        'created_at': msg.created_at.isoformat()
+    }
+
+
 @bp.route('/chats', methods=['GET'])
 @jwt_required()
 def get_chats():
+    """会话列表，按创建时间倒序
+
+    不带参数时返回全部会话（兼容旧客户端）；带 limit 或 cursor 时分页返回
+    {items, next_cursor, has_more}，下一页把 next_cursor 作为 cursor 传回。
+    """
     try:
-        user_id = get_jwt_identity()
-        user = User.query.get_or_404(int(user_id))
-        chats = Chat.query.filter_by(user_id=user.id).order_by(Chat.created_at.desc()).all()
-        return Result.success(data=[{
-            'id': chat.id,
-            'title': chat.title,
-            'created_at': chat.created_at.isoformat()
-        } for chat in chats]).to_json()
+        user = current_user
+        query = Chat.query.filter_by(user_id=user.id).options(load_only(Chat.id, Chat.title, Chat.created_at))
+        if 'limit' not in request.args and 'cursor' not in request.args:
+            chats = query.order_by(Chat.created_at.desc(), Chat.id.desc()).all()
+            return Result.success(data=[_chat_dict(chat) for chat in chats]).to_json()
+        try:
+            limit = parse_limit(request.args.get('limit'))
+            chats, next_cursor = _keyset_page(query, Chat, limit, request.args.get('cursor'), descending=True)
+        except ValueError as e:
+            return Result.bad_request(message=str(e)).to_json()
+        return Result.success(data={
+            'items': [_chat_dict(chat) for chat in chats],
+            'next_cursor': next_cursor,
+            'has_more': next_cursor is not None
+        }).to_json()
     except Exception as e:
         return Result.error(message=str(e)).to_json()
 
@@ -30,8 +93,7 @@ def get_chats():
 @jwt_required()
 def create_chat():
     try:
-        user_id = get_jwt_identity()
-        user = User.query.get_or_404(int(user_id))
+        user = current_user
         data = request.json
         title = data.get('title', '新会话')
         
@@ -50,118 +112,406 @@ def create_chat():
 @bp.route('/chats/<int:chat_id>/messages', methods=['GET'])
 @jwt_required()
 def get_messages(chat_id):
+    """会话消息，items 总是按时间正序排列
+
+    不带参数时返回全部消息（兼容旧客户端）。分页参数：
+      - latest=N：最新的 N 条，聊天页打开时先加载这一页
+      - before=游标&limit=N：比游标更早的 N 条，向上滚动加载历史
+      - after=游标&limit=N 或只传 limit：从最早的消息开始向后翻页
+    分页时返回 {items, next_cursor, has_more}，next_cursor 沿同一方向继续翻页。
+    """
     try:
-        user_id = get_jwt_identity()
-        user = User.query.get_or_404(int(user_id))
+        user = current_user
         chat = Chat.query.filter_by(id=chat_id, user_id=user.id).first_or_404()
-        messages = Message.query.filter_by(chat_id=chat_id).order_by(Message.created_at.asc()).all()
-        return Result.success(data=[{
-            'id': msg.id,
-            'role': msg.role,
-            'content': msg.content,
-            'created_at': msg.created_at.isoformat()
-        } for msg in messages]).to_json()
+        _sync_journal(chat_id)
+        query = Message.query.filter_by(chat_id=chat_id)
+        args = request.args
+        if not any(key in args for key in ('latest', 'before', 'after', 'limit')):
+            messages = query.order_by(Message.created_at.asc(), Message.id.asc()).all()
+            return Result.success(data=[_message_dict(msg) for msg in messages]).to_json()
+        try:
+            if 'latest' in args or 'before' in args:
+                limit = parse_limit(args.get('latest') or args.get('limit'), default=50)
+                messages, next_cursor = _keyset_page(query, Message, limit, args.get('before'), descending=True)
+                messages.reverse()
+            else:
+                limit = parse_limit(args.get('limit'), default=50)
+                messages, next_cursor = _keyset_page(query, Message, limit, args.get('after'))
+        except ValueError as e:
+            return Result.bad_request(message=str(e)).to_json()
+        return Result.success(data={
+            'items': [_message_dict(msg) for msg in messages],
+            'next_cursor': next_cursor,
+            'has_more': next_cursor is not None
+        }).to_json()
     except Exception as e:
         return Result.error(message=str(e)).to_json()
 
 
+def _sync_journal(chat_id):
+    """读取会话消息前，把消息日志中该会话尚未写库的回答写入数据库（读己之写）"""
+    journal = get_message_journal()
+    if journal is not None:
+        journal.sync_chat(chat_id)
+
+
+def _start_turn(chat_id):
+    """校验请求参数并保存用户消息，创建本轮回答的流
+
+    Returns:
+        (turn, None)；请求无效时返回 (None, 错误响应)。
+    """
+    # 本轮各阶段的耗时（秒），回答结束后由 _record_turn 记入指标；
+    # 鉴权（JWT 校验和用户身份加载）在进入处理函数之前完成
+    timings = {}
+    started = stage = time.perf_counter()
+    if g.get('request_started') is not None:
+        started = g.request_started
+        timings['auth'] = stage - started
+
+    def mark(name):
+        nonlocal stage
+        now = time.perf_counter()
+        add_timing(timings, name, now - stage)
+        stage = now
+
+    user = current_user
+    chat = Chat.query.filter_by(id=chat_id, user_id=user.id).first_or_404()
+
+    data = request.json
+    content = data.get('content')
+    model_id = data.get('model_id')
+    repository_id = data.get('repository_id') or None
+
+    print(f"请求参数: content={content}, model_id={model_id}, repository_id={repository_id}")
+
+    if not content:
+        return None, Result.bad_request(message="消息内容不能为空").to_json()
+    if not model_id:
+        return None, Result.bad_request(message="请选择模型").to_json()
+
+    # 查询模型信息（进程内的模型目录缓存，不查询模型表）
+    model = get_model_catalog(current_app.config).find(model_id)
+    if model is None:
+        return None, Result.not_found(message="模型不存在").to_json()
+    print(f"使用模型: {model.name}")
+
+    # 上一轮回答可能还在消息日志中，先写库，保证它的 ID 排在本轮用户消息之前
+    _sync_journal(chat_id)
+    mark('db_read')
+
+    # 会话的第一个问题不依赖上下文；之后的追问（例如“展开说说第二点”）的回答取决于历史和摘要
+    standalone = not chat.titled and not chat.summary
+
+    # 保存用户消息，第一条消息同时设置标题，在同一个事务中提交
+    try:
+        user_message = Message(chat_id=chat_id, role='user', content=content)
+        db.session.add(user_message)
+        if not chat.titled:
+            # 使用消息内容的前8个字作为标题
+            chat.title = content[:8] + '...' if len(content) > 8 else content
+            chat.titled = True
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        print(f"保存用户消息错误: {str(e)}")
+        return None, Result.error(message="保存消息失败，请稍后重试").to_json()
+    mark('persistence')
+
+    # 使用 LangChain 处理聊天，传入知识库ID
+    chat_service = ChatService(model.name, repository_id)
+    print("ChatService 创建成功，开始流式处理...")
+    mark('model_setup')
+
+    # 开启答案缓存时，知识库问答先查找语义相近的已有回答。缓存键不包含会话上下文，
+    # 只有会话的第一个问题查找和写入缓存，追问总是由模型结合上下文回答
+    cached_answer = None
+    content_version = None
+    sources = []
+    usage = {'prompt_tokens': 0}
+    if repository_id and standalone and current_app.config.get('ANSWER_CACHE_ENABLED'):
+        content_version = db.session.query(Repository.content_version).filter_by(id=repository_id).scalar() or 0
+        mark('db_read')
+        cached_answer = chat_service.cached_answer(content, content_version)
+        mark('query_embedding')
+    if cached_answer is not None:
+        print("命中答案缓存")
+        stream_response = chat_service.replay_answer(cached_answer)
+    else:
+        stream_response = chat_service.chat_stream(chat_id, content,
+                                                   before_message_id=user_message.id,
+                                                   summary=chat.summary,
+                                                   summary_until_id=chat.summary_until_id,
+                                                   sources=sources,
+                                                   timings=timings,
+                                                   usage=usage)
+    # 流式输出之前的读写到此全部完成：结束事务并把连接归还连接池，
+    # 之后回答生成期间不再访问数据库，回答结束后由 _save_reply 用短事务写入
+    summary, summary_until_id = chat.summary, chat.summary_until_id
+    db.session.commit()
+    # 包括加载历史消息窗口
+    mark('db_read')
+    return {
+        'chat_id': chat_id,
+        'summary': summary,
+        'summary_until_id': summary_until_id,
+        'content': content,
+        'chat_service': chat_service,
+        'stream': stream_response,
+        'sources': sources,
+        'cached_answer': cached_answer,
+        'content_version': content_version,
+        'model_name': model.name,
+        'started': started,
+        'timings': timings,
+        'usage': usage,
+    }, None
+
+
+def _error_message(e: Exception) -> str:
+    print(f"请求异常：{str(e)}")
+    if type(e).__name__ == "BadRequestError":
+        return "请求异常，请稍后重试"
+    return ""
+
+
+def _save_reply(turn, full_content: str, completed: bool):
+    """流式传输完成后保存AI回复，返回消息 ID
+
+    开启消息日志时回答追加到日志后由后台线程批量写库，此时还没有消息 ID，返回 None；
+    否则直接写库。每次写入都是一个短事务，提交后连接立即归还连接池；
+    会话摘要在后台线程中更新，流式响应和 SSE 的 done 事件不等待摘要生成。
+    """
+    if not full_content or full_content.startswith("错误:"):
+        return None
+    chat_service = turn['chat_service']
+    message_id = None
+    started = time.perf_counter()
+    try:
+        journal = get_message_journal()
+        if journal is not None:
+            journal.append(turn['chat_id'], 'assistant', full_content)
+            print(f"AI回复已写入消息日志，内容长度: {len(full_content)}")
+        else:
+            # 保存AI消息到数据库
+            ai_message = Message(chat_id=turn['chat_id'], role='assistant', content=full_content)
+            db.session.add(ai_message)
+            db.session.flush()
+            message_id = ai_message.id
+            db.session.commit()
+            print(f"AI回复已保存到数据库，内容长度: {len(full_content)}")
+        add_timing(turn['timings'], 'persistence', time.perf_counter() - started)
+    except Exception as save_error:
+        print(f"保存AI回复到数据库时出错: {str(save_error)}")
+        db.session.rollback()
+        return None
+
+    # 完整生成的回答写入答案缓存
+    if completed and turn['content_version'] is not None and turn['cached_answer'] is None:
+        chat_service.remember_answer(turn['content'], full_content, turn['content_version'])
+
+    # 历史超出预算时增量更新会话摘要，下一轮直接使用；需要调用模型，放到后台线程，不推迟响应结束
+    threading.Thread(target=_update_summary, args=(current_app._get_current_object(), turn),
+                     name=f"summary-{turn['chat_id']}", daemon=True).start()
+    return message_id
+
+
+def _update_summary(app, turn):
+    """在后台线程中把超出预算的历史并入会话摘要"""
+    with app.app_context():
+        updated = turn['chat_service'].summarize_history(turn['chat_id'], turn['summary'],
+                                                          turn['summary_until_id'])
+        if not updated:
+            return
+        try:
+            # 只在摘要没有被同一会话的其他回答更新过时写入
+            Chat.query.filter_by(id=turn['chat_id'], summary_until_id=turn['summary_until_id']).update(
+                {'summary': updated[0], 'summary_until_id': updated[1]}, synchronize_session=False)
+            db.session.commit()
+        except Exception as save_error:
+            print(f"保存会话摘要时出错: {str(save_error)}")
+            db.session.rollback()
+
+
+def _record_turn(turn, full_content: str, completed: bool, first_token_at: float = None,
+                 last_token_at: float = None):
+    """回答结束后记录本轮各阶段耗时、回答结果和 token 数
+
+    首 token 耗时从请求到达算起（包含鉴权、读库和检索），生成耗时为首个到最后一个 token 之间的时间。
+    """
+    if not current_app.config.get('METRICS_ENABLED', True):
+        return
+    try:
+        timings = turn['timings']
+        if first_token_at is not None:
+            add_timing(timings, 'ttft', first_token_at - turn['started'])
+            add_timing(timings, 'generation', last_token_at - first_token_at)
+        observe_chat_turn(turn['model_name'], timings, completed and bool(full_content),
+                          turn['usage']['prompt_tokens'], estimate_tokens(full_content))
+    except Exception as e:
+        print(f"记录聊天指标时出错: {str(e)}")
+
+
 @bp.route('/chats/<int:chat_id>/messages/stream', methods=['POST'])
 @jwt_required()
 def send_message_stream(chat_id):
     """流式聊天接口"""
     try:
         print(f"开始处理流式聊天请求，chat_id: {chat_id}")
-        user_id = get_jwt_identity()
-        user = User.query.get_or_404(int(user_id))
-        chat = Chat.query.filter_by(id=chat_id, user_id=user.id).first_or_404()
-        
-        data = request.json
-        content = data.get('content')
-        model_id = data.get('model_id')
-        repository_id = data.get('repository_id') or None
-        
-        print(f"请求参数: content={content}, model_id={model_id}, repository_id={repository_id}")
-        
-        if not content:
-            return Result.bad_request(message="消息内容不能为空").to_json()
-        if not model_id:
-            return Result.bad_request(message="请选择模型").to_json()
-            
-        # 查询模型信息
-        model = Model.query.get_or_404(model_id)
-        print(f"使用模型: {model.name}")
-        
-        # 检查是否是第一条消息
-        is_first_message = Message.query.filter_by(chat_id=chat_id).count() == 0
-        
-        # 保存用户消息
-        try:
-            user_message = Message(chat_id=chat_id, role='user', content=content)
-            db.session.add(user_message)
-            db.session.commit()
-            
-            # 如果是第一条消息，使用消息内容的前8个字作为标题
-            if is_first_message:
-                chat.title = content[:8] + '...' if len(content) > 8 else content
-                db.session.commit()
-        except Exception as e:
-            db.session.rollback()
-            print(f"保存用户消息错误: {str(e)}")
-            return Result.error(message="保存消息失败，请稍后重试").to_json()
-        
-        # 使用 LangChain 处理聊天，传入知识库ID
-        chat_service = ChatService(model.name, repository_id)
-        print("ChatService 创建成功，开始流式处理...")
-        stream_response = chat_service.chat_stream(chat_id, content)
+        turn, error = _start_turn(chat_id)
+        if error is not None:
+            return error
         print("开始生成流式响应...")
         
         def generate():
             full_content = ""  # 用于收集完整的AI回复
+            completed = False
+            first_token_at = last_token_at = None
             try:
-                for chunk in stream_response:
+                for chunk in turn['stream']:
                     message = chunk[0]
                     if isinstance(message, AIMessage):  # Filter to just model responses
                         print(message.content, end="")
+                        last_token_at = time.perf_counter()
+                        if first_token_at is None:
+                            first_token_at = last_token_at
                         full_content += message.content  # 累积内容
                         yield message.content
+                completed = True
             except Exception as e:
-                error_type = type(e).__name__  # 获取异常类型（如 "ValueError"）
-                error_message = ""
-                print(f"请求异常：{str(e)}")
-                if error_type == "BadRequestError":
-                    error_message = "请求异常，请稍后重试"
-                yield error_message
+                yield _error_message(e)
             finally:
-                # 流式传输完成后，保存AI回复到数据库
-                if full_content and not full_content.startswith("错误:"):
-                    try:
-                        # 保存AI消息到数据库
-                        ai_message = Message(chat_id=chat_id, role='assistant', content=full_content)
-                        db.session.add(ai_message)
-                        db.session.commit()
-                        print(f"AI回复已保存到数据库，内容长度: {len(full_content)}")
-                    except Exception as save_error:
-                        print(f"保存AI回复到数据库时出错: {str(save_error)}")
-                        db.session.rollback()
+                _save_reply(turn, full_content, completed)
+                _record_turn(turn, full_content, completed, first_token_at, last_token_at)
                 
         return Response(stream_with_context(generate()), content_type='text/plain')
     except Exception as e:
         print(f"流式聊天接口错误: {str(e)}")
         return Result.error(message=str(e)).to_json()
 
+
+def _produce_events(app, turn, buffer, started: float):
+    """在后台线程中运行模型，把原始 token 写入事件缓冲
+
+    生成与响应连接解耦：客户端断开后回答仍会生成完并保存，重连时可按 Last-Event-ID 续传。
+    """
+    with app.app_context():
+        full_content = ""
+        completed = False
+        first_token_at = last_token_at = None
+        sources_sent = False
+        message_id = None
+        try:
+            for chunk in turn['stream']:
+                message = chunk[0]
+                if isinstance(message, dict) and message.get('type') == 'error':
+                    buffer.append('error', {'message': message.get('content', '')})
+                    continue
+                if not isinstance(message, AIMessage) or not message.content:
+                    continue
+                if not sources_sent:
+                    # 检索在模型输出之前完成，首个 token 之前先发送来源
+                    sources_sent = True
+                    if turn['sources']:
+                        buffer.append('sources', {'sources': turn['sources']})
+                last_token_at = time.perf_counter()
+                if first_token_at is None:
+                    first_token_at = last_token_at
+                full_content += message.content
+                buffer.append('token', message.content)
+            completed = True
+        except Exception as e:
+            buffer.append('error', {'message': _error_message(e) or "生成回答失败，请稍后重试"})
+        finally:
+            message_id = _save_reply(turn, full_content, completed)
+            _record_turn(turn, full_content, completed, first_token_at, last_token_at)
+            finished = time.perf_counter()
+            buffer.append('done', {
+                'message_id': message_id,
+                'completed': completed,
+                'answer_cache': 'hit' if turn['cached_answer'] is not None else 'miss',
+                'usage': {
+                    'chars': len(full_content),
+                    'tokens': estimate_tokens(full_content),
+                    'ttft_ms': round((first_token_at - started) * 1000, 1) if first_token_at else None,
+                    'duration_ms': round((finished - started) * 1000, 1),
+                },
+            })
+            buffer.close()
+
+
+def _sse_response(buffer, after_seq: int = 0):
+    config = current_app.config
+    frames = iter_frames(buffer, after_seq,
+                         coalesce_chars=int(config.get('SSE_COALESCE_CHARS', 32)),
+                         coalesce_delay=float(config.get('SSE_COALESCE_MS', 50)) / 1000,
+                         heartbeat=float(config.get('SSE_HEARTBEAT_SECONDS', 15)))
+    response = Response(frames, content_type='text/event-stream; charset=utf-8')
+    # 禁止浏览器和反向代理缓存或缓冲事件流
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@bp.route('/chats/<int:chat_id>/messages/sse', methods=['POST'])
+@jwt_required()
+def send_message_sse(chat_id):
+    """SSE 聊天接口
+
+    事件类型：sources（检索来源）、token（合并后的回答片段）、error、done（消息 ID 和用量；回答经消息日志写入时消息 ID 为 null）。
+    每个事件带 “<stream_id>:<序号>” 格式的 ID，断线后可通过 GET 同一地址续传。
+    """
+    try:
+        started = time.perf_counter()
+        print(f"开始处理 SSE 聊天请求，chat_id: {chat_id}")
+        turn, error = _start_turn(chat_id)
+        if error is not None:
+            return error
+
+        buffer = get_stream_registry(current_app.config).create(uuid.uuid4().hex, chat_id)
+        threading.Thread(target=_produce_events,
+                         args=(current_app._get_current_object(), turn, buffer, started),
+                         name=f"sse-{buffer.stream_id[:8]}", daemon=True).start()
+        return _sse_response(buffer)
+    except Exception as e:
+        print(f"SSE 聊天接口错误: {str(e)}")
+        return Result.error(message=str(e)).to_json()
+
+
+@bp.route('/chats/<int:chat_id>/messages/sse', methods=['GET'])
+@jwt_required()
+def resume_message_sse(chat_id):
+    """按 Last-Event-ID 续传 SSE 事件（请求头或 last_event_id 参数）"""
+    try:
+        user = current_user
+        Chat.query.filter_by(id=chat_id, user_id=user.id).first_or_404()
+
+        last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+        stream_id, seq = parse_event_id(last_event_id)
+        buffer = get_stream_registry(current_app.config).get(stream_id) if stream_id else None
+        if buffer is None or buffer.chat_id != chat_id:
+            # 事件缓冲只保存在生成回答的 worker 进程中，过期或不在本进程时由客户端重新拉取消息列表
+            return Result.not_found(message="事件流不存在或已过期").to_json()
+        return _sse_response(buffer, seq)
+    except Exception as e:
+        print(f"SSE 续传接口错误: {str(e)}")
+        return Result.error(message=str(e)).to_json()
+
 @bp.route('/chats/<int:chat_id>', methods=['DELETE'])
 @jwt_required()
 def delete_chat(chat_id):
     try:
-        user_id = get_jwt_identity()
-        user = User.query.get_or_404(int(user_id))
+        user = current_user
         chat = Chat.query.filter_by(id=chat_id, user_id=user.id).first_or_404()
+        # 消息日志中该会话的回答先写库，避免删除后再被写入
+        _sync_journal(chat_id)
         
         # 删除会话相关的所有消息
         Message.query.filter_by(chat_id=chat_id).delete()
         # 删除会话
         db.session.delete(chat)
         db.session.commit()
+        get_checkpointer(current_app.config).invalidate(chat_id)
         
         return Result.success().to_json()
     except Exception as e:
@@ -0,0 +1,19 @@
+import json
+
+import click
+from flask import current_app
+
+
+def register_commands(app):
+    """注册运维命令行工具（flask --app run <命令>）"""
+
+    @app.cli.command('vector-gc')
+    @click.option('--apply', is_flag=True, help='实际删除和压缩；默认只输出报告，不做修改')
+    @click.option('--batch-size', default=500, show_default=True, help='每批扫描、删除的块数')
+    @click.option('--no-vacuum', is_flag=True, help='不清理预写日志、不执行 VACUUM')
+    def vector_gc(apply, batch_size, no_vacuum):
+        """对账知识库文件清单与 Chroma，清理孤立的向量并压缩向量库"""
+        from app.services.vector_gc import VectorGC
+
+        report = VectorGC(current_app.config, batch_size=batch_size, apply=apply).run(vacuum=not no_vacuum)
+        click.echo(json.dumps(report, ensure_ascii=False, indent=2))
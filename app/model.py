@@ -1,21 +1,27 @@
-from flask import Blueprint, request
+from flask import Blueprint, request, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from app import db
 from app.models import Model, User
 from common.result import Result
+from app.services.model_catalog import bump_catalog_version, get_model_catalog
+from app.services.model_pool import get_model_pool
 
 bp = Blueprint('model', __name__)
 
 @bp.route('/models', methods=['GET'])
 @jwt_required()
 def get_models():
+    """启用的模型列表，支持 If-None-Match 协商缓存：目录未变化时返回 304，不带响应体"""
     try:
-        models = Model.query.filter_by(is_active=True).all()
-        return Result.success(data=[{
-            'id': model.id,
-            'name': model.name,
-            'description': model.description
-        } for model in models]).to_json()
+        models, etag = get_model_catalog(current_app.config).active()
+        if request.if_none_match.contains(etag):
+            response = current_app.response_class(status=304)
+        else:
+            response = Result.success(data=models).to_json()
+        response.set_etag(etag)
+        # 客户端可以保存列表，但每次使用前都要带上 ETag 重新验证
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
     except Exception as e:
         return Result.error(message=str(e)).to_json()
 
@@ -33,7 +39,9 @@ def create_model():
             is_active=data.get('is_active', True)
         )
         db.session.add(model)
+        bump_catalog_version()
         db.session.commit()
+        get_model_catalog(current_app.config).invalidate()
         return Result.success(data={
             'id': model.id,
             'name': model.name,
@@ -55,6 +63,7 @@ def update_model(model_id):
         if not data:
             return Result.bad_request(message="缺少更新数据").to_json()
         
+        old_name = model.name
         if 'name' in data:
             model.name = data['name']
         if 'description' in data:
@@ -62,7 +71,11 @@ def update_model(model_id):
         if 'is_active' in data:
             model.is_active = data['is_active']
         
+        bump_catalog_version()
         db.session.commit()
+        # 模型记录变化后丢弃旧的客户端，下次使用时按新配置重建；其他 worker 由模型目录发现版本变化后丢弃
+        get_model_pool().invalidate(old_name)
+        get_model_catalog(current_app.config).invalidate()
         return Result.success(data={
             'id': model.id,
             'name': model.name,
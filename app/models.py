@@ -16,6 +16,9 @@ class Chat(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     title = db.Column(db.String(100), nullable=False)
+    summary = db.Column(db.Text, nullable=True)  # 早期对话的滚动摘要
+    summary_until_id = db.Column(db.Integer, default=0)  # 已并入摘要的最后一条消息ID
+    titled = db.Column(db.Boolean, nullable=False, default=False)  # 是否已按第一条消息设置标题
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
 
 class Message(db.Model):
@@ -25,6 +28,7 @@ class Message(db.Model):
     role = db.Column(db.String(20), nullable=False)
     content = db.Column(db.Text, nullable=False)
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    journal_key = db.Column(db.String(32), unique=True, nullable=True)  # 经消息日志写入时的条目键，重放时去重
 
 class Model(db.Model):
     __tablename__ = 'model'
@@ -34,6 +38,11 @@ class Model(db.Model):
     is_active = db.Column(db.Integer, default=1)
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
 
+class CacheVersion(db.Model):
+    __tablename__ = 'cache_version'
+    name = db.Column(db.String(50), primary_key=True)  # 缓存名，例如 model
+    version = db.Column(db.Integer, nullable=False, default=0)  # 对应的表每次写入时递增
+
 class Repository(db.Model):
     __tablename__ = 'repository'
     id = db.Column(db.Integer, primary_key=True)
@@ -41,6 +50,7 @@ class Repository(db.Model):
     remark = db.Column(db.String(255))
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
     user_id = db.Column(db.Integer, nullable=False)
+    content_version = db.Column(db.Integer, default=0)  # 文件增删时递增，用于答案缓存失效
     files = db.relationship('RepositoryFile', backref='repository', lazy=True)
 
 class RepositoryFile(db.Model):
@@ -52,4 +62,23 @@ class RepositoryFile(db.Model):
     size = db.Column(db.Integer, nullable=False)  # 文件大小（字节）
     type = db.Column(db.Integer, nullable=False)  # 1: 文本, 2: PDF, 3: Word, 4: 其他
     file_id = db.Column(db.String(255), nullable=False) # 文件向量id
-    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
\ No newline at end of file
+    content_hash = db.Column(db.String(64), nullable=True)  # 文件内容的 SHA-256，用于去重
+    # 知识库文件清单：块数和导入状态与向量库保持同步，列表、统计不再扫描向量库
+    chunk_count = db.Column(db.Integer, default=0)
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued/ingesting/ready/failed
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+class IngestionJob(db.Model):
+    __tablename__ = 'ingestion_job'
+    id = db.Column(db.Integer, primary_key=True)
+    repository_id = db.Column(db.Integer, nullable=False)
+    repository_file_id = db.Column(db.Integer, nullable=False)
+    file_id = db.Column(db.String(255), nullable=False)  # 文件向量id
+    file_path = db.Column(db.String(512), nullable=False)
+    file_type = db.Column(db.Integer, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued/parsing/embedding/done/failed
+    total_chunks = db.Column(db.Integer, default=0)
+    processed_chunks = db.Column(db.Integer, default=0)
+    attempts = db.Column(db.Integer, default=0)
+    error = db.Column(db.String(1000), nullable=True)
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
@@ -0,0 +1,52 @@
+import hmac
+from functools import wraps
+
+from flask import Blueprint, Response, current_app, request
+
+from app.services.health import readiness
+from app.services.metrics import REGISTRY
+from common.result import Result
+
+bp = Blueprint('monitor', __name__)
+
+
+@bp.route('/health', methods=['GET'])
+@bp.route('/health/live', methods=['GET'])
+def liveness():
+    """存活检查：进程能处理请求即返回，不访问任何依赖（Dockerfile 的 HEALTHCHECK 使用）"""
+    return Result.success(data={'status': 'ok'}).to_json()
+
+
+@bp.route('/health/ready', methods=['GET'])
+def ready():
+    """就绪检查：数据库、Chroma 和模型服务都可用时返回 200，否则返回 HTTP 503
+
+    各项检查并发执行，总耗时不超过 HEALTH_CHECK_TIMEOUT，结果缓存 HEALTH_READY_CACHE_SECONDS 秒。
+    与其他接口不同，这里用 HTTP 状态码表示结果，负载均衡器和容器编排只看状态码。
+    """
+    result = readiness(current_app._get_current_object())
+    if result['ready']:
+        return Result.success(data=result).to_json()
+    response = Result.error(message="服务未就绪", code=503, data=result).to_json()
+    response.status_code = 503
+    return response
+
+
+def metrics_token_required(view):
+    """运维接口的访问控制：配置了 METRICS_TOKEN 时需要携带 Authorization: Bearer <METRICS_TOKEN>"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        token = current_app.config.get('METRICS_TOKEN')
+        if token:
+            supplied = request.headers.get('Authorization', '')
+            if not hmac.compare_digest(supplied.encode(), f"Bearer {token}".encode()):
+                return Response("unauthorized\n", status=401, content_type='text/plain; charset=utf-8')
+        return view(*args, **kwargs)
+    return wrapper
+
+
+@bp.route('/metrics', methods=['GET'])
+@metrics_token_required
+def metrics():
+    """Prometheus 文本格式的指标，gunicorn 多 worker 时合并所有 worker 的数据"""
+    return Response(REGISTRY.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
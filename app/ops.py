@@ -0,0 +1,17 @@
+from flask import Blueprint
+
+from app.monitor import metrics_token_required
+from app.services.db_pool import get_pool_metrics
+from common.result import Result
+
+bp = Blueprint('ops', __name__)
+
+
+@bp.route('/db-pool', methods=['GET'])
+@metrics_token_required
+def db_pool_stats():
+    """当前 worker 进程的数据库连接池统计：取连接次数、等待与占用时长、超时次数和当前占用数
+
+    与 /metrics 一样只供内网访问，配置了 METRICS_TOKEN 时需要携带 Bearer 令牌。
+    """
+    return Result.success(data=get_pool_metrics().stats()).to_json()
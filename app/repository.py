@@ -1,11 +1,18 @@
 from flask import Blueprint, request, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
+import hashlib
 import os
+import uuid
 from werkzeug.utils import secure_filename
 from app import db
-from app.models import Repository, RepositoryFile
+from app.models import Repository, RepositoryFile, IngestionJob
 from common.result import Result
 from app.services.chat_service import ChatService
+from app.services.vector_store_cache import get_vector_store_cache
+from app.services.answer_cache import get_answer_cache
+from app.services.lexical_index import get_lexical_indexes
+from app.services.ingestion import ACTIVE_STATUSES, IngestionManager, get_ingestion_manager
+from app.services.search import match_condition, parse_terms
 
 bp = Blueprint('repository', __name__)
 
@@ -24,6 +31,24 @@ def get_file_type(filename):
     ext = filename.rsplit('.', 1)[1].lower()
     return ALLOWED_EXTENSIONS.get(ext, 1)  # 默认为其他类型
 
+def save_upload(file, file_path, chunk_size=1024 * 1024):
+    """分块把上传的文件写入磁盘，同时计算内容的 SHA-256，返回 (内容哈希, 文件大小)"""
+    digest = hashlib.sha256()
+    size = 0
+    with open(file_path, 'wb') as f:
+        while True:
+            block = file.stream.read(chunk_size)
+            if not block:
+                break
+            digest.update(block)
+            f.write(block)
+            size += len(block)
+    return digest.hexdigest(), size
+
+def physical_path(file_url):
+    """文件记录中的 URL 对应的磁盘路径"""
+    return os.path.join(current_app.static_folder, file_url.lstrip('/static/'))
+
 @bp.route('/repositories', methods=['POST'])
 @jwt_required()
 def create_repository():
@@ -81,43 +106,93 @@ def upload_file(repository_id):
         if not allowed_file(file.filename):
             return Result.bad_request(message="不支持的文件类型").to_json()
         
-        # 生成安全的文件名
-        filename = file.filename
-        filename = f"{repository_id}_{filename}"  # 添加知识库ID前缀避免文件名冲突
-        
         # 确保上传目录存在
         upload_dir = os.path.join(current_app.static_folder, 'repository_files')
         os.makedirs(upload_dir, exist_ok=True)
-        
-        # 保存文件
+
+        # 边写入边计算内容哈希，先写到临时文件，确认不是重复内容后再放到最终位置
+        temp_path = os.path.join(upload_dir, f"{repository_id}_{uuid.uuid4().hex}.part")
+        try:
+            content_hash, file_size = save_upload(file, temp_path)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+        # 文件名带知识库ID和内容哈希前缀：同名不同内容的文件不会互相覆盖，
+        # 同一个 URL 始终对应同一份内容，删除时按 URL 统计引用才可靠
+        filename = f"{repository_id}_{content_hash[:16]}_{file.filename}"
         file_path = os.path.join(upload_dir, filename)
-        file.save(file_path)
-        
-        # 获取文件大小
-        file_size = os.path.getsize(file_path)
-        
+
         # 获取文件类型
         file_type = get_file_type(filename)
 
         print(f"file_type {file_type}")
 
-        cs = ChatService(repository_id=repository_id)
-        file_id = cs.load_documents(file_path, file_type)
+        # 同一知识库中已有相同内容的文件时，复用它的向量（共享 file_id），不再解析和向量化
+        existing = RepositoryFile.query.filter_by(repository_id=repository_id, content_hash=content_hash) \
+            .order_by(RepositoryFile.id).first()
+        ready = False
+        job = None
+        if existing is not None:
+            os.remove(temp_path)
+            file_url = existing.file
+            file_path = physical_path(existing.file)
+            ready = existing.status == 'ready'
+            if not ready:
+                # 相同内容仍在导入中时挂到已有的任务上，同一个 file_id 只有一个任务在运行
+                job = IngestionJob.query.filter(
+                    IngestionJob.repository_id == repository_id,
+                    IngestionJob.file_id == existing.file_id,
+                    IngestionJob.status.in_(('queued',) + ACTIVE_STATUSES)
+                ).order_by(IngestionJob.id).first()
+            print(f"文件内容与已有文件 {existing.id} 相同，复用向量 {existing.file_id}")
+        else:
+            os.replace(temp_path, file_path)
+            file_url = f"/static/repository_files/{filename}"
 
-        if file_id is None:
-            return Result.error("文件类型暂不支持").to_json()
-        
-        # 保存文件记录到数据库
+        # 保存文件记录和导入任务，解析与向量化由后台任务完成
         repository_file = RepositoryFile(
             repository_id=repository_id,
-            file=f"/static/repository_files/{filename}",
+            file=file_url,
             name=name,  # 使用URL参数中的name
             size=file_size,  # 保存文件大小
-            file_id=file_id,
+            file_id=existing.file_id if existing is not None else str(uuid.uuid4()),
+            content_hash=content_hash,
+            chunk_count=existing.chunk_count if ready else 0,
+            status='ready' if ready else existing.status if job is not None else 'queued',
             type=file_type
         )
         db.session.add(repository_file)
+        db.session.flush()
+        # 相同内容已导入完成时直接记为完成；导入失败的则重新排队，已写入的块会被跳过。
+        # 任务完成或失败时按 file_id 更新所有共享向量的文件记录
+        attached = job is not None
+        if not attached:
+            job = IngestionJob(
+                repository_id=repository_id,
+                repository_file_id=repository_file.id,
+                file_id=repository_file.file_id,
+                file_path=file_path,
+                file_type=file_type,
+                status='done' if ready else 'queued',
+                total_chunks=repository_file.chunk_count,
+                processed_chunks=repository_file.chunk_count
+            )
+            db.session.add(job)
         db.session.commit()
+        if attached:
+            # 共用的任务可能在本次提交前已经结束，此时它没有更新到这条新记录
+            db.session.refresh(job)
+            if job.status in ('done', 'failed'):
+                repository_file.status = 'ready' if job.status == 'done' else 'failed'
+                repository_file.chunk_count = job.total_chunks if job.status == 'done' else 0
+                db.session.commit()
+
+        if not ready:
+            manager = get_ingestion_manager()
+            if manager is not None:
+                manager.notify()
 
         return Result.success(data={
             'id': repository_file.id,
@@ -125,13 +200,59 @@ def upload_file(repository_id):
             'name': repository_file.name,
             'size': repository_file.size,  # 添加文件大小
             'type': repository_file.type,
-            'created_at': repository_file.created_at.isoformat()
+            'created_at': repository_file.created_at.isoformat(),
+            'content_hash': repository_file.content_hash,
+            'chunk_count': repository_file.chunk_count,
+            'job_id': job.id,
+            'status': job.status
         }).to_json()
         
     except Exception as e:
         db.session.rollback()
         return Result.error(message=str(e)).to_json()
 
+def job_to_dict(job):
+    return {
+        'id': job.id,
+        'repository_id': job.repository_id,
+        'file_id': job.repository_file_id,
+        'status': job.status,
+        'total_chunks': job.total_chunks,
+        'processed_chunks': job.processed_chunks,
+        'attempts': job.attempts,
+        'error': job.error,
+        'created_at': job.created_at.isoformat(),
+        'updated_at': job.updated_at.isoformat() if job.updated_at else None
+    }
+
+@bp.route('/repositories/<int:repository_id>/jobs/<int:job_id>', methods=['GET'])
+@jwt_required()
+def get_job(repository_id, job_id):
+    """获取文件导入任务状态"""
+    try:
+        job = IngestionJob.query.filter_by(id=job_id, repository_id=repository_id).first_or_404()
+        return Result.success(data=job_to_dict(job)).to_json()
+    except Exception as e:
+        return Result.error(message=str(e)).to_json()
+
+@bp.route('/repositories/<int:repository_id>/jobs/<int:job_id>/retry', methods=['POST'])
+@jwt_required()
+def retry_job(repository_id, job_id):
+    """重试失败的文件导入任务"""
+    try:
+        job = IngestionJob.query.filter_by(id=job_id, repository_id=repository_id).first_or_404()
+        if not IngestionManager.retry(job):
+            return Result.bad_request(message="只能重试失败的任务").to_json()
+        db.session.commit()
+
+        manager = get_ingestion_manager()
+        if manager is not None:
+            manager.notify()
+        return Result.success(data=job_to_dict(job)).to_json()
+    except Exception as e:
+        db.session.rollback()
+        return Result.error(message=str(e)).to_json()
+
 @bp.route('/repositories', methods=['GET'])
 @jwt_required()
 def get_repositories():
@@ -145,19 +266,30 @@ def get_repositories():
         # 构建查询
         query = Repository.query.filter_by(user_id=user_id)
         
-        # 如果有关键字，添加模糊查询条件
-        if keyword:
-            query = query.filter(
-                Repository.name.contains(keyword) | 
-                Repository.remark.contains(keyword)
-            )
+        # 如果有关键字，按名称和备注的全文索引过滤（MySQL 之外或关键字过短时退回模糊查询）
+        terms = parse_terms(keyword)
+        if terms:
+            condition, _ = match_condition([Repository.name, Repository.remark], terms, current_app.config)
+            query = query.filter(condition)
         
         repositories = query.order_by(Repository.created_at.desc()).all()
+
+        # 文件数和块数从文件清单聚合，不访问向量库
+        stats = {}
+        if repositories:
+            stats = {row.repository_id: row for row in db.session.query(
+                RepositoryFile.repository_id,
+                db.func.count(RepositoryFile.id).label('file_count'),
+                db.func.coalesce(db.func.sum(RepositoryFile.chunk_count), 0).label('chunk_count'),
+            ).filter(RepositoryFile.repository_id.in_([repo.id for repo in repositories]))
+             .group_by(RepositoryFile.repository_id)}
         
         return Result.success(data=[{
             'id': repo.id,
             'name': repo.name,
             'remark': repo.remark,
+            'file_count': stats[repo.id].file_count if repo.id in stats else 0,
+            'chunk_count': int(stats[repo.id].chunk_count) if repo.id in stats else 0,
             'created_at': repo.created_at.isoformat()
         } for repo in repositories]).to_json()
     except Exception as e:
@@ -178,6 +310,9 @@ def get_repository_files(repository_id):
             'name': file.name,
             'size': file.size,  # 添加文件大小
             'type': file.type,
+            'content_hash': file.content_hash,
+            'chunk_count': file.chunk_count or 0,
+            'status': file.status,
             'created_at': file.created_at.isoformat()
         } for file in files]).to_json()
     except Exception as e:
@@ -197,17 +332,34 @@ def delete_file(repository_id, file_id):
         # 检查文件是否存在
         file = RepositoryFile.query.filter_by(id=file_id, repository_id=repository_id).first_or_404()
         
-        # 删除物理文件
-        file_path = os.path.join(current_app.static_folder, file.file.lstrip('/static/'))
-        if os.path.exists(file_path):
-            os.remove(file_path)
-
-        cs = ChatService(repository_id=repository_id)
-        cs.delete_documents(file_id=file_id)
+        # 内容相同的文件共享物理文件和向量，只有最后一个引用被删除时才真正删除
+        others = RepositoryFile.query.filter(RepositoryFile.repository_id == repository_id,
+                                             RepositoryFile.id != file.id)
+        file_released = others.filter(RepositoryFile.file == file.file).count() == 0
+        remaining = others.filter(RepositoryFile.file_id == file.file_id).order_by(RepositoryFile.id).first()
+        vectors_released = remaining is None
+        file_url, vector_file_id = file.file, file.file_id
         
-        # 删除数据库记录
+        # 删除数据库记录；共享向量的其他文件还在时，把任务转给其中一条记录
+        jobs = IngestionJob.query.filter_by(repository_file_id=file.id)
+        if vectors_released:
+            jobs.delete()
+        else:
+            jobs.update({'repository_file_id': remaining.id}, synchronize_session=False)
         db.session.delete(file)
+        if vectors_released:
+            repository.content_version = (repository.content_version or 0) + 1
         db.session.commit()
+
+        # 数据库提交后再删除向量、索引和物理文件；中途失败留下的数据由 flask vector-gc 清理
+        if vectors_released:
+            cs = ChatService(repository_id=repository_id)
+            cs.delete_documents(file_id=vector_file_id)
+            get_answer_cache(current_app.config).invalidate_repository(repository_id)
+        if file_released:
+            file_path = physical_path(file_url)
+            if os.path.exists(file_path):
+                os.remove(file_path)
         
         return Result.success().to_json()
     except Exception as e:
@@ -220,12 +372,22 @@ def delete_repository(repository_id):
     """删除知识库"""
     try:
         repository = Repository.query.get_or_404(repository_id)
+        file_urls = {file.file for file in RepositoryFile.query.filter_by(repository_id=repository_id)}
         # 删除文件记录
+        IngestionJob.query.filter_by(repository_id=repository_id).delete()
         RepositoryFile.query.filter_by(repository_id=repository_id).delete()
         
         # 删除知识库
         db.session.delete(repository)
         db.session.commit()
+        # 数据库提交后再删除集合、索引和物理文件；中途失败留下的数据由 flask vector-gc 清理
+        get_vector_store_cache(current_app.config).drop(repository_id)
+        get_answer_cache(current_app.config).invalidate_repository(repository_id)
+        get_lexical_indexes(current_app.config).drop(repository_id)
+        for file_url in file_urls:
+            file_path = physical_path(file_url)
+            if os.path.exists(file_path):
+                os.remove(file_path)
         
         return Result.success().to_json()
     except Exception as e:
@@ -0,0 +1,53 @@
+from flask import Blueprint, request, current_app
+from flask_jwt_extended import jwt_required, current_user
+
+from app.services.search import SEARCH_TYPES, SEARCHERS, parse_terms
+from common.pagination import decode_offset, encode_offset, parse_limit
+from common.result import Result
+
+bp = Blueprint('search', __name__)
+
+
+@bp.route('', methods=['GET'])
+@jwt_required()
+def search():
+    """搜索当前用户的会话标题、消息内容和知识库
+
+    参数：
+      - q：搜索词，多个词用空格分隔，结果需包含全部词
+      - type：chat / message / repository，指定时按相关度分页返回 {items, next_cursor, has_more}；
+        不指定时每种类型各返回第一页 {chats, messages, repositories}
+      - limit、cursor：每页条数和下一页游标
+    每条结果带 snippet（命中词附近的片段）和 highlights（片段中命中词的 [起, 止] 字符位置）。
+    """
+    try:
+        user = current_user
+        terms = parse_terms(request.args.get('q'))
+        if not terms:
+            return Result.bad_request(message="搜索词不能为空").to_json()
+        search_type = request.args.get('type')
+        if search_type and search_type not in SEARCH_TYPES:
+            return Result.bad_request(message="不支持的搜索类型").to_json()
+        try:
+            limit = parse_limit(request.args.get('limit'), default=20, maximum=50)
+            offset = decode_offset(request.args.get('cursor'))
+        except ValueError as e:
+            return Result.bad_request(message=str(e)).to_json()
+
+        def page(kind, page_offset):
+            items, has_more = SEARCHERS[kind](user.id, terms, current_app.config, limit, page_offset)
+            return {
+                'items': items,
+                'next_cursor': encode_offset(page_offset + limit) if has_more else None,
+                'has_more': has_more
+            }
+
+        if search_type:
+            return Result.success(data=page(search_type, offset)).to_json()
+        return Result.success(data={
+            'chats': page('chat', 0),
+            'messages': page('message', 0),
+            'repositories': page('repository', 0)
+        }).to_json()
+    except Exception as e:
+        return Result.error(message=str(e)).to_json()
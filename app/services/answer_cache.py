@@ -0,0 +1,137 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Hashable, List, Optional, Tuple
+
+import numpy as np
+
+
+def prompt_version(system_prompt: Optional[str], version: str = "1") -> str:
+    """系统提示词或缓存版本号变化后，旧的缓存答案不再使用"""
+    return hashlib.sha256(f"{version}\0{system_prompt or ''}".encode("utf-8")).hexdigest()[:16]
+
+
+class _Namespace:
+    __slots__ = ("questions", "answers", "vectors", "created", "matrix", "last_used")
+
+    def __init__(self):
+        self.questions: List[str] = []
+        self.answers: List[str] = []
+        self.vectors: List[np.ndarray] = []
+        self.created: List[float] = []
+        self.matrix = None
+        self.last_used = time.monotonic()
+
+
+class AnswerCache:
+    """知识库问答的语义答案缓存
+
+    命名空间为 (知识库ID, 知识库内容版本, 模型, 提示词版本)。知识库增删文件时内容版本
+    递增，旧命名空间不再命中并随 LRU 淘汰。同一命名空间内按问题向量的余弦相似度匹配，
+    相似度不低于 threshold 时返回缓存的答案。
+    缓存键不包含会话上下文，聊天接口只对会话的第一个问题查找和写入缓存。
+    """
+
+    def __init__(self, threshold: float = 0.95, max_entries: int = 256, max_namespaces: int = 128,
+                 ttl: float = 86400):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.max_namespaces = max_namespaces
+        self.ttl = ttl
+        self._namespaces: "OrderedDict[Tuple[Hashable, ...], _Namespace]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _normalize(vector) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _expire(self, namespace: _Namespace):
+        if not self.ttl or not namespace.created:
+            return
+        deadline = time.time() - self.ttl
+        keep = [i for i, created in enumerate(namespace.created) if created >= deadline]
+        if len(keep) != len(namespace.created):
+            for name in ("questions", "answers", "vectors", "created"):
+                values = getattr(namespace, name)
+                setattr(namespace, name, [values[i] for i in keep])
+            namespace.matrix = None
+
+    def lookup(self, key: Tuple[Hashable, ...], vector) -> Optional[str]:
+        query = self._normalize(vector)
+        with self._lock:
+            namespace = self._namespaces.get(key)
+            if namespace is not None:
+                self._namespaces.move_to_end(key)
+                namespace.last_used = time.monotonic()
+                self._expire(namespace)
+            if namespace is None or not namespace.vectors:
+                self.misses += 1
+                return None
+            if namespace.matrix is None:
+                namespace.matrix = np.vstack(namespace.vectors)
+            scores = namespace.matrix @ query
+            best = int(np.argmax(scores))
+            if scores[best] >= self.threshold:
+                self.hits += 1
+                return namespace.answers[best]
+            self.misses += 1
+            return None
+
+    def store(self, key: Tuple[Hashable, ...], vector, question: str, answer: str):
+        with self._lock:
+            namespace = self._namespaces.get(key)
+            if namespace is None:
+                namespace = _Namespace()
+                self._namespaces[key] = namespace
+            self._namespaces.move_to_end(key)
+            namespace.questions.append(question)
+            namespace.answers.append(answer)
+            namespace.vectors.append(self._normalize(vector))
+            namespace.created.append(time.time())
+            if len(namespace.vectors) > self.max_entries:
+                for name in ("questions", "answers", "vectors", "created"):
+                    del getattr(namespace, name)[0]
+            namespace.matrix = None
+            while len(self._namespaces) > self.max_namespaces:
+                self._namespaces.popitem(last=False)
+
+    def invalidate_repository(self, repository_id: int):
+        with self._lock:
+            for key in [key for key in self._namespaces if key[0] == repository_id]:
+                del self._namespaces[key]
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "namespaces": len(self._namespaces),
+                "entries": sum(len(namespace.answers) for namespace in self._namespaces.values()),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+_cache: Optional[AnswerCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_answer_cache(config=None) -> AnswerCache:
+    """获取当前 worker 进程的答案缓存（首次调用时按配置创建）"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                config = config or {}
+                _cache = AnswerCache(
+                    threshold=float(config.get('ANSWER_CACHE_THRESHOLD', 0.95)),
+                    max_entries=int(config.get('ANSWER_CACHE_MAX_ENTRIES', 256)),
+                    max_namespaces=int(config.get('ANSWER_CACHE_MAX_NAMESPACES', 128)),
+                    ttl=float(config.get('ANSWER_CACHE_TTL', 86400)),
+                )
+    return _cache
@@ -0,0 +1,153 @@
+import threading
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.graph import END, MessagesState, StateGraph
+
+from app.services.metrics import RETRIEVALS, add_timing
+from app.services.prompt_assembler import assemble_prompt, message_tokens
+
+# 聊天图只有“带检索”和“不带检索”两种形状，每个进程各编译一次。
+# 模型客户端、检索器、系统提示词等每次请求不同的输入通过
+# config["configurable"] 传入节点，而不是绑定在 ChatService 实例方法上。
+_graphs = {}
+_graphs_lock = threading.Lock()
+
+# 检索器各阶段耗时（毫秒）对应的聊天阶段，按 id 取回候选也是一次 Chroma 查询，计入向量检索
+_RETRIEVAL_STAGES = {
+    "lexical_ms": "lexical_search",
+    "embed_ms": "query_embedding",
+    "vector_ms": "vector_search",
+    "fetch_ms": "vector_search",
+    "rerank_ms": "rerank",
+}
+
+
+def _conversation_messages(state: MessagesState):
+    return [
+        message
+        for message in state["messages"]
+        if message.type in ("human", "system")
+           or (message.type == "ai" and not message.tool_calls)
+    ]
+
+
+def _assemble(system_message_content: str, state: MessagesState, configurable: dict):
+    # 按 token 预算保留最近的消息，更早的对话以摘要形式放进系统提示词
+    prompt = assemble_prompt(
+        system_message_content,
+        _conversation_messages(state),
+        token_budget=configurable["token_budget"],
+        summary=configurable.get("summary"),
+        summary_until_id=configurable.get("summary_until_id") or 0,
+    )
+    usage = configurable.get("usage")
+    if usage is not None:
+        usage["prompt_tokens"] = sum(message_tokens(message) for message in prompt)
+    return prompt
+
+
+def _collect_sources(docs, sources: list):
+    # 记录检索到的文件，供 SSE 接口以 sources 事件返回给前端
+    seen = {(item.get("file_id"), item.get("page")) for item in sources}
+    for doc in docs:
+        metadata = doc.metadata or {}
+        key = (metadata.get("file_id"), metadata.get("page"))
+        if key in seen:
+            continue
+        seen.add(key)
+        source = {"file_id": metadata.get("file_id"), "file_name": metadata.get("file_name", "")}
+        if "page" in metadata:
+            source["page"] = metadata["page"]
+        sources.append(source)
+
+
+def _retrieve(retriever, state: MessagesState, sources: list = None, timings: dict = None) -> str:
+    # 获取用户最新的消息作为查询
+    user_messages = [msg for msg in state["messages"] if msg.type == "human"]
+    if not user_messages:
+        return ""
+    latest_query = user_messages[-1].content
+
+    # 直接进行向量检索
+    try:
+        retrieved_docs = retriever.search(latest_query)
+        print(f"检索到的文档数量: {len(retrieved_docs)}，检索方式: {retriever.last_path}，"
+              f"各阶段耗时: {retriever.timings}")
+        RETRIEVALS.inc(path=retriever.last_path)
+        for key, stage in _RETRIEVAL_STAGES.items():
+            if key in retriever.timings:
+                add_timing(timings, stage, retriever.timings[key] / 1000)
+        if sources is not None:
+            _collect_sources(retrieved_docs, sources)
+
+        # 打印检索到的文档内容
+        for i, doc in enumerate(retrieved_docs):
+            print(f"\n检索到的文档 {i+1}:")
+            print(f"元数据: {doc.metadata}")
+            print(f"内容: {doc.page_content}")
+
+        # 格式化检索到的文档
+        docs_content = "\n\n".join(
+            f"来源: {doc.metadata}\n内容: {doc.page_content}"
+            for doc in retrieved_docs
+        )
+        print("\n提供给模型的上下文信息:")
+        print(docs_content)
+        return docs_content
+    except Exception as e:
+        print(f"检索过程中出错: {str(e)}")
+        return ""
+
+
+def _generate(state: MessagesState, config: RunnableConfig):
+    """Generate answer with retrieval."""
+    configurable = config["configurable"]
+    docs_content = _retrieve(configurable["retriever"], state, configurable.get("sources"),
+                             configurable.get("timings"))
+
+    system_message_content = (
+        f"{configurable['system_prompt']}"
+        "\n\n"
+        f"{docs_content}"
+    )
+    prompt = _assemble(system_message_content, state, configurable)
+
+    # Run
+    response = configurable["model"].invoke(prompt)
+    return {"messages": [response]}
+
+
+def _simple_generate(state: MessagesState, config: RunnableConfig):
+    """直接生成回答，不使用检索"""
+    configurable = config["configurable"]
+    system_message_content = (
+        f"{configurable['system_prompt']}"
+    )
+    prompt = _assemble(system_message_content, state, configurable)
+    response = configurable["model"].invoke(prompt)
+    return {"messages": [response]}
+
+
+def build_chat_graph(with_retrieval: bool, checkpointer=None):
+    """构建并编译聊天图"""
+    graph_builder = StateGraph(MessagesState)
+    node = _generate if with_retrieval else _simple_generate
+    graph_builder.add_node(node.__name__, node)
+    graph_builder.set_entry_point(node.__name__)
+    graph_builder.add_edge(node.__name__, END)
+    return graph_builder.compile(checkpointer=checkpointer)
+
+
+def get_chat_graph(with_retrieval: bool, checkpointer=None):
+    """获取已编译的聊天图（每个进程每种形状只编译一次）
+
+    checkpointer 在进程内是单例，首次编译时绑定到图上。
+    """
+    graph = _graphs.get(with_retrieval)
+    if graph is None:
+        with _graphs_lock:
+            graph = _graphs.get(with_retrieval)
+            if graph is None:
+                graph = build_chat_graph(with_retrieval, checkpointer)
+                _graphs[with_retrieval] = graph
+    return graph
@@ -1,31 +1,31 @@
-from langchain.chat_models import init_chat_model
 import os
 from langchain_ollama import OllamaEmbeddings
-from langchain_chroma import Chroma
-from langchain_community.document_loaders import TextLoader, PyPDFLoader, Docx2txtLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langgraph.graph import MessagesState, StateGraph
-from langgraph.graph import END
-from langgraph.checkpoint.memory import MemorySaver
-from langchain.schema import SystemMessage
-from typing import List, Iterator
+from langchain_core.messages import AIMessageChunk
+from itertools import islice
+from typing import Callable, Iterable, List, Iterator, Optional, Tuple
 import uuid
 from flask import current_app
+from app import db
+from app.models import Message, RepositoryFile
+from app.services.model_pool import get_model_pool
+from app.services.vector_store_cache import get_vector_store_cache
+from app.services.lexical_index import get_lexical_indexes
+from app.services.retrieval import HybridRetriever
+from app.services.chat_graph import get_chat_graph
+from app.services.checkpointer import get_checkpointer
+from app.services.document_parser import iter_document
+from app.services.answer_cache import get_answer_cache, prompt_version
+from app.services.embedding_cache import CachedEmbeddings
+from app.services.embedding_executor import EmbeddingExecutor
+from app.services.prompt_assembler import get_token_budget, plan_summary, summarize
 
 # 从Flask配置中获取embeddings配置，支持远程连接
 # 默认使用环境变量中的EMBEDDINGS_URL和EMBEDDINGS_MODEL
 embeddings = None  # 将在ChatService初始化时创建
-PERSIST_DIRECTORY = "chroma_db"
-memory = MemorySaver()
 
 
 class ChatService:
     def __init__(self, model_name: str = None, repository_id: int = None):
-        # 从Flask配置获取API密钥
-        os.environ["OPENAI_API_KEY"] = current_app.config['OPENAI_API_KEY']
-        baseUrl = current_app.config['OPENAI_API_URL']
-        print(f"请求URL: {baseUrl}")
-        
         # 初始化embeddings模型
         global embeddings
         if embeddings is None:
@@ -33,157 +33,150 @@ class ChatService:
             embeddings_model = current_app.config.get('EMBEDDINGS_MODEL', 'bge-m3')
             print(f"初始化embeddings模型: {embeddings_model}, URL: {embeddings_url}")
             try:
-                embeddings = OllamaEmbeddings(model=embeddings_model, base_url=embeddings_url)
+                # 查询向量走两级缓存（进程内 LRU + 可选的跨 worker 磁盘缓存），文档块向量按内容寻址复用
+                embeddings = CachedEmbeddings(
+                    OllamaEmbeddings(model=embeddings_model, base_url=embeddings_url),
+                    model=embeddings_model,
+                    max_size=int(current_app.config.get('QUERY_EMBEDDING_CACHE_SIZE', 2048)),
+                    disk_path=current_app.config.get('QUERY_EMBEDDING_CACHE_PATH') or None,
+                    disk_max_rows=int(current_app.config.get('QUERY_EMBEDDING_CACHE_DISK_MAX', 100000)),
+                    chunk_disk_max_rows=int(current_app.config.get('CHUNK_EMBEDDING_CACHE_DISK_MAX', 200000)),
+                )
                 print("Embeddings模型初始化成功")
             except Exception as e:
                 print(f"Embeddings模型初始化失败: {str(e)}")
                 print(f"请确保Ollama服务正在运行，并且可以通过 {embeddings_url} 访问")
                 raise e
         
-        # 初始化聊天模型
-        self.model = init_chat_model(base_url=baseUrl,
-                                model=model_name,
-                                temperature=0.95,
-                                top_p=0.7,
-                                model_provider=current_app.config['MODEL_PROVIDER'])
+        # 从进程内的客户端池获取聊天模型，复用底层 HTTP 连接
+        # 只上传/删除文档时不需要聊天模型
+        self.model = None
+        self.model_name = model_name
+        if model_name:
+            self.model = get_model_pool(current_app.config).get(
+                model_name,
+                model_provider=current_app.config['MODEL_PROVIDER'],
+                base_url=current_app.config['OPENAI_API_URL'],
+                api_key=current_app.config['OPENAI_API_KEY'],
+                temperature=0.95,
+                top_p=0.7,
+            )
 
         self.repository_id = repository_id
         
-        # 只有在有 repository_id 时才初始化向量数据库
+        # 只有在有 repository_id 时才获取向量数据库，句柄由进程内缓存复用
+        self.vector_store = None
+        self.lexical_index = None
+        self.retriever = None
         if repository_id is not None:
-            print('加载向量数据库...')
             try:
-                self.vector_store = Chroma(
-                    collection_name=f"user_{repository_id}_benefits",
-                    embedding_function=embeddings,
-                    persist_directory=PERSIST_DIRECTORY
-                )
-                print("向量数据库初始化成功")
-                print(self.list_documents())
+                self.vector_store = get_vector_store_cache(current_app.config).get(repository_id, embeddings)
             except Exception as e:
                 print(f"向量数据库初始化失败: {str(e)}")
                 print(f"请检查Chroma数据库配置和embeddings模型是否正常")
                 raise e
-
-        # 添加聊天记录
-        # self.graph = self.graph_builder.compile(checkpointer=memory)
-        # self.graph = self.graph_builder.compile()
-
+            # 关键词索引与向量库一一对应，和向量检索融合使用
+            if current_app.config.get('LEXICAL_INDEX_ENABLED', True):
+                self.lexical_index = get_lexical_indexes(current_app.config).get(repository_id)
+            self.retriever = HybridRetriever(
+                self.vector_store,
+                self.lexical_index,
+                k=int(current_app.config.get('RETRIEVAL_K', 2)),
+                fetch_k=int(current_app.config.get('RETRIEVAL_FETCH_K', 20)),
+                fast_path_threshold=float(current_app.config.get('LEXICAL_FAST_PATH_THRESHOLD', 0.9)),
+                mmr_lambda=float(current_app.config.get('RETRIEVAL_MMR_LAMBDA', 0.5)),
+            )
 
 
-    def _generate(self, state: MessagesState):
-        """Generate answer with retrieval."""
-        # 获取用户最新的消息作为查询
-        user_messages = [msg for msg in state["messages"] if msg.type == "human"]
-        if user_messages:
-            latest_query = user_messages[-1].content
-            
-            # 直接进行向量检索
-            try:
-                retrieved_docs = self.vector_store.similarity_search(latest_query, k=2)
-                print(f"检索到的文档数量: {len(retrieved_docs)}")
-                
-                # 打印检索到的文档内容
-                for i, doc in enumerate(retrieved_docs):
-                    print(f"\n检索到的文档 {i+1}:")
-                    print(f"元数据: {doc.metadata}")
-                    print(f"内容: {doc.page_content}")
-                
-                # 格式化检索到的文档
-                docs_content = "\n\n".join(
-                    f"来源: {doc.metadata}\n内容: {doc.page_content}"
-                    for doc in retrieved_docs
-                )
-                print("\n提供给模型的上下文信息:")
-                print(docs_content)
-            except Exception as e:
-                print(f"检索过程中出错: {str(e)}")
-                docs_content = ""
-        else:
-            docs_content = ""
-        
-        system_message_content = (
-            f"{current_app.config['MODULE_PROMPT']}"
-            "\n\n"
-            f"{docs_content}"
-        )
-        conversation_messages = [
-            message
-            for message in state["messages"]
-            if message.type in ("human", "system")
-               or (message.type == "ai" and not message.tool_calls)
-        ]
-        prompt = [SystemMessage(system_message_content)] + conversation_messages
-
-        # Run
-        response = self.model.invoke(prompt)
-        return {"messages": [response]}
-
-    def _simple_generate(self, state: MessagesState):
-        """直接生成回答，不使用检索"""
-        system_message_content = (
-            f"{current_app.config['MODULE_PROMPT']}"
-        )
-        conversation_messages = [
-            message
-            for message in state["messages"]
-            if message.type in ("human", "system")
-               or (message.type == "ai" and not message.tool_calls)
-        ]
-        prompt = [SystemMessage(system_message_content)] + conversation_messages
-        response = self.model.invoke(prompt)
-        return {"messages": response}
-
-
-    def load_documents(self, file_path: str, file_type: int):
+    def load_documents(self, file_path: str, file_type: int, file_id: str = None):
         """加载用户文档到向量数据库"""
         try:
-            # 验证文件路径安全性
-            if not os.path.exists(file_path):
-                raise FileNotFoundError("文件不存在")
-                
-            # 验证文件权限
-            if not os.access(file_path, os.R_OK):
-                raise PermissionError("没有文件读取权限")
-            loader = None
-            if file_type == 1:
-                loader = TextLoader(file_path, encoding="utf-8")
-            elif file_type == 2:
-                loader = PyPDFLoader(file_path)
-            elif file_type == 3:
-                loader = Docx2txtLoader(file_path)
-            else:
-                return None
-
-            docs = loader.load()
-            print(f"成功加载文档，共 {len(docs)} 个文档")
-            
-            text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-            all_splits = text_splitter.split_documents(docs)
-            print(f"文档分块后，共 {len(all_splits)} 个块")
-            
-            # 生成文件ID
-            file_id = str(uuid.uuid4())
-            
-            # 添加文件信息到元数据
-            for doc in all_splits:
-                doc.metadata["file_id"] = file_id
-                doc.metadata["file_path"] = file_path
-                doc.metadata["file_name"] = os.path.basename(file_path)
-            
-            # 添加文档到用户专属的向量数据库
-            ids = self.vector_store.add_documents(documents=all_splits)
-            print(f"成功添加文档到向量存储，共 {len(ids)} 个文档")
-            
-            # 验证文档是否成功添加
-            result = self.vector_store.get()
-            print(f"当前向量存储中的文档数量: {len(result['ids'])}")
-            
+            file_id = file_id or str(uuid.uuid4())
+            count = self.add_chunks(file_id, file_path, iter_document(file_path, file_type))
+            print(f"文档分块后，共 {count} 个块")
             return file_id
         except Exception as e:
             print(f"加载文档时出错: {str(e)}")
             return None
 
+    def add_chunks(self, file_id: str, file_path: str, chunks: Iterable[Tuple[str, dict]],
+                   progress: Callable[[int, int], None] = None) -> int:
+        """把已切分的文档块分批向量化并写入向量数据库
+
+        chunks 可以是生成器：块按向量化批次依次取出、查重后提交，文档后面的部分还在解析时
+        前面的块就已经开始向量化，内存中只保留在途的批次。块 ID 由 file_id 和序号确定。
+        重试导入任务时，已经写入向量库的块会被跳过，不会重复向量化。
+        progress(已写入块数, 已取出块数) 在每个批次写入后调用。
+        """
+        batch_size = int(current_app.config.get('EMBEDDING_BATCH_SIZE', 32))
+        executor = EmbeddingExecutor(
+            embeddings,
+            batch_size=batch_size,
+            max_in_flight=int(current_app.config.get('EMBEDDING_MAX_IN_FLIGHT', 4)),
+            max_retries=int(current_app.config.get('EMBEDDING_MAX_RETRIES', 5)),
+        )
+        collection = self.vector_store._collection
+        chunks = iter(chunks)
+        # 关键词索引按文件整体写入一个段，只保留块 ID 和文本
+        all_ids, all_texts = [], []
+        total = done = skipped = 0
+
+        def batches():
+            nonlocal total, done, skipped
+            while True:
+                window = list(islice(chunks, batch_size))
+                if not window:
+                    return
+                ids, texts, metadatas = [], [], []
+                for index, (text, metadata) in enumerate(window, start=total):
+                    # 添加文件信息到元数据
+                    metadata = dict(metadata)
+                    metadata["file_id"] = file_id
+                    metadata["file_path"] = file_path
+                    metadata["file_name"] = os.path.basename(file_path)
+                    ids.append(f"{file_id}-{index}")
+                    texts.append(text)
+                    metadatas.append(metadata)
+                total += len(window)
+                all_ids.extend(ids)
+                all_texts.extend(texts)
+
+                # 按 ID 查询已存在的块（只取 ID，不扫描整个集合）
+                existing = set(collection.get(ids=ids, include=[])["ids"])
+                if existing:
+                    skipped += len(existing)
+                    done += len(existing)
+                    if progress:
+                        progress(done, total)
+                pending = [index for index, chunk_id in enumerate(ids) if chunk_id not in existing]
+                if pending:
+                    batch = ([ids[i] for i in pending], [texts[i] for i in pending], [metadatas[i] for i in pending])
+                    yield batch, batch[1]
+
+        def on_batch(batch, vectors: List[List[float]]):
+            nonlocal done
+            batch_ids, batch_texts, batch_metadatas = batch
+            # 添加文档到用户专属的向量数据库
+            collection.upsert(ids=batch_ids, embeddings=vectors, documents=batch_texts, metadatas=batch_metadatas)
+            done += len(batch_ids)
+            if progress:
+                progress(done, total)
+
+        executor.embed_batches(batches(), on_batch=on_batch)
+        if skipped:
+            print(f"跳过 {skipped} 个已写入的文档块")
+        print(f"成功添加文档到向量存储，共 {total} 个文档")
+
+        # 同步更新关键词索引；索引尚不存在时由向量库中的全部块（已包含本文件）构建
+        if self.lexical_index is not None:
+            try:
+                if not self.retriever.ensure_lexical_index():
+                    self.lexical_index.add(file_id, all_ids, all_texts)
+            except Exception as e:
+                print(f"更新关键词索引时出错: {str(e)}")
+
+        return total
+
     def delete_documents(self, file_id: str = None):
         """删除向量数据库中的文档
         
@@ -192,41 +185,38 @@ class ChatService:
         """
         try:
             if file_id:
-                # 删除指定文件ID的文档
-                self.vector_store.delete(
+                # 删除指定文件ID的文档（langchain_chroma 的 delete 不转发 where 条件，直接调用集合）
+                self.vector_store._collection.delete(
                     where={"file_id": {"$eq": file_id}}
                 )
+                if self.lexical_index is not None:
+                    self.lexical_index.delete_file(file_id)
             else:
                 # 删除所有文档
-                self.vector_store.delete(
+                self.vector_store._collection.delete(
                     where={"file_id": {"$ne": ""}}
                 )
+                if self.lexical_index is not None:
+                    self.lexical_index.drop()
             return True
         except Exception as e:
             print(f"删除文档时出错: {str(e)}")
             return False
 
     def list_documents(self):
-        """列出已加载的所有文件信息"""
+        """列出已加载的所有文件信息（读取知识库文件清单，不扫描向量库）"""
         try:
-            # 获取所有文档的元数据
-            results = self.vector_store.get(
-                where={"file_id": {"$ne": ""}},
-                include=["metadatas"]
-            )
-            
-            # 提取唯一的文件信息
+            files = RepositoryFile.query.filter_by(repository_id=self.repository_id, status='ready') \
+                .order_by(RepositoryFile.id).all()
+            # 内容相同的文件共享向量，按 file_id 去重
             unique_files = {}
-            for metadata in results["metadatas"]:
-                if "file_id" in metadata and "file_path" in metadata:
-                    file_id = metadata["file_id"]
-                    if file_id not in unique_files:
-                        unique_files[file_id] = {
-                            "file_id": file_id,
-                            "file_path": metadata["file_path"],
-                            "file_name": metadata.get("file_name", "")
-                        }
-            
+            for file in files:
+                unique_files.setdefault(file.file_id, {
+                    "file_id": file.file_id,
+                    "file_path": file.file,
+                    "file_name": file.name,
+                    "chunk_count": file.chunk_count or 0,
+                })
             return list(unique_files.values())
         except Exception as e:
             print(f"列出文档时出错: {str(e)}")
@@ -234,56 +224,112 @@ class ChatService:
 
     def get_chat_history(self, chat_id: str = None) -> List[dict]:
         try:
-            # 构造 RunnableConfig
-            config = {
-                "configurable": {
-                    "thread_id": str(chat_id)
-                }
-            }
-            # 从 memory 中获取历史记录
-            checkpoint = memory.get(config)
-            if not checkpoint:
-                return []
-                
-            # 从 checkpoint 中获取消息
-            messages = []
-            if "messages" in checkpoint.get("channel_values", {}):
-                for msg in checkpoint["channel_values"]["messages"]:
-                    if isinstance(msg, dict):
-                        messages.append({
-                            "role": msg.get("role", "unknown"),
-                            "content": msg.get("content", ""),
-                            "timestamp": msg.get("timestamp", "")
-                        })
-                    elif hasattr(msg, "type"):
-                        messages.append({
-                            "role": "assistant" if msg.type == "ai" else "user",
-                            "content": msg.content if hasattr(msg, "content") else str(msg),
-                            "timestamp": ""  # 如果消息对象没有时间戳，则留空
-                        })
-                    
-            return messages
+            # 直接读取会话的消息窗口，不需要反序列化整个检查点
+            rows = get_checkpointer(current_app.config).load_window(chat_id)
+            return [{
+                "role": role,
+                "content": content,
+                "timestamp": created_at.isoformat() if created_at else ""
+            } for _, role, content, created_at in rows]
         except Exception as e:
             print(f"获取历史记录时出错: {str(e)}")
             return []
 
 
-    def chat_stream(self, chat_id: int, message: str) -> Iterator:
+    def summarize_history(self, chat_id: int, summary: str = None,
+                          summary_until_id: int = 0) -> Optional[Tuple[str, int]]:
+        """未摘要的历史超过预算或超出会话历史窗口时，把较早的消息并入会话摘要
+
+        直接从 message 表读取摘要水位之后的全部消息：历史窗口只保留最近的若干条，
+        只看窗口会让移出窗口但还没有摘要的消息既不在提示词里、也不在摘要里。
+
+        Returns:
+            (新摘要, 已并入摘要的最后一条消息 ID)；无需更新时返回 None。
+        """
         try:
-            graph_builder = StateGraph(MessagesState)
-            if self.repository_id:
-                # 使用简化的生成方法，包含检索功能但不使用工具调用
-                graph_builder.add_node(self._generate)
-                graph_builder.set_entry_point("_generate")
-                graph_builder.add_edge("_generate", END)
-            else:
-                graph_builder.add_node(self._simple_generate)
-                graph_builder.set_entry_point("_simple_generate")
-                graph_builder.add_edge("_simple_generate", END)
-            graph = graph_builder.compile()
-            # 使用相同的thread_id来保持对话历史
+            token_budget = get_token_budget(current_app.config, self.model_name)
+            rows = db.session.query(Message.id, Message.role, Message.content, Message.created_at) \
+                .filter(Message.chat_id == chat_id, Message.id > (summary_until_id or 0)) \
+                .order_by(Message.id.asc()).all()
+            # 读取完毕即结束事务，调用模型生成摘要期间不占用数据库连接
+            db.session.commit()
+            folded = plan_summary([tuple(row) for row in rows], token_budget, summary_until_id or 0,
+                                  max_rows=get_checkpointer(current_app.config).window_size)
+            if not folded:
+                return None
+            print(f"会话 {chat_id} 将 {len(folded)} 条消息并入摘要")
+            return summarize(self.model, summary, folded), folded[-1][0]
+        except Exception as e:
+            print(f"更新会话摘要时出错: {str(e)}")
+            return None
+
+    def _answer_cache_key(self, content_version: int):
+        version = prompt_version(current_app.config['MODULE_PROMPT'],
+                                 current_app.config.get('ANSWER_CACHE_PROMPT_VERSION', '1'))
+        return (self.repository_id, content_version, self.model_name, version)
+
+    def cached_answer(self, question: str, content_version: int) -> Optional[str]:
+        """在答案缓存中查找与问题语义相近的已有回答（仅知识库问答）"""
+        if not self.repository_id:
+            return None
+        try:
+            vector = embeddings.embed_query(question)
+            return get_answer_cache(current_app.config).lookup(self._answer_cache_key(content_version), vector)
+        except Exception as e:
+            print(f"查询答案缓存时出错: {str(e)}")
+            return None
+
+    def remember_answer(self, question: str, answer: str, content_version: int):
+        """把本轮回答写入答案缓存，查询向量已由检索步骤缓存，不会再次请求向量化服务"""
+        if not self.repository_id:
+            return
+        try:
+            vector = embeddings.embed_query(question)
+            get_answer_cache(current_app.config).store(self._answer_cache_key(content_version),
+                                                       vector, question, answer)
+        except Exception as e:
+            print(f"写入答案缓存时出错: {str(e)}")
+
+    @staticmethod
+    def replay_answer(answer: str, chunk_size: int = 16) -> Iterator:
+        """把缓存的答案按与模型输出相同的格式分块流式返回"""
+        for start in range(0, len(answer), chunk_size):
+            yield AIMessageChunk(content=answer[start:start + chunk_size]), {"answer_cache": "hit"}
+
+    def chat_stream(self, chat_id: int, message: str, before_message_id: int = None,
+                    summary: str = None, summary_until_id: int = 0, sources: list = None,
+                    timings: dict = None, usage: dict = None) -> Iterator:
+        """流式对话
+
+        Args:
+            before_message_id: 本轮用户消息在 message 表中的 ID；历史记录只取它之前的消息，
+                避免与作为输入传入的本轮消息重复。
+            summary: 会话摘要，覆盖 ID 不超过 summary_until_id 的消息。
+            sources: 传入列表时，检索步骤会把命中的文件信息追加到其中。
+            timings: 传入字典时，检索步骤会累加查询向量化、关键词检索、向量检索和重排的耗时（秒）。
+            usage: 传入字典时，组装提示词后写入 prompt_tokens（估算的提示词 token 数）。
+        """
+        try:
+            checkpointer = get_checkpointer(current_app.config)
+            # 图在进程内只编译一次，本次请求的模型、向量库和提示词通过 config 传入
+            graph = get_chat_graph(with_retrieval=bool(self.repository_id), checkpointer=checkpointer)
+            # 在开始流式输出之前加载历史消息窗口
+            history = checkpointer.load_window(chat_id, before_message_id)
             # 使用相同的thread_id来保持对话历史
-            config = {"configurable": {"thread_id": chat_id}}
+            config = {"configurable": {
+                "thread_id": chat_id,
+                "before_message_id": before_message_id,
+                "history": history,
+                "model": self.model,
+                "retriever": self.retriever,
+                "system_prompt": current_app.config['MODULE_PROMPT'],
+                "token_budget": get_token_budget(current_app.config, self.model_name),
+                "summary": summary,
+                "summary_until_id": summary_until_id,
+                "sources": sources,
+                "timings": timings,
+                "usage": usage,
+            }}
 
             print("\n用户问题:", message)
             try:
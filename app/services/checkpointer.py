@@ -0,0 +1,162 @@
+import threading
+from collections import OrderedDict, deque
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    empty_checkpoint,
+)
+
+from app import db
+from app.models import Message
+
+
+class _ThreadWindow:
+    """单个会话最近若干条消息的窗口，只保存 (id, role, content, created_at) 元组"""
+    __slots__ = ("rows", "last_id")
+
+    def __init__(self, size: int):
+        self.rows = deque(maxlen=size)
+        self.last_id = 0
+
+    def extend(self, rows):
+        for row in rows:
+            self.rows.append(row)
+            self.last_id = row[0]
+
+
+class MessageCheckpointer(BaseCheckpointSaver):
+    """以 MySQL message 表为准的会话检查点
+
+    所有 worker 共享同一张 message 表，因此不再需要进程内的 MemorySaver：
+    每个会话在内存里只保留最近 window_size 条消息，按需从 Message 表增量加载，
+    会话数量超过 max_threads 时按 LRU 淘汰，内存占用不随运行时间增长。
+    用户消息和 AI 回复由聊天接口写入 message 表，put/put_writes 无需再保存。
+    """
+
+    def __init__(self, window_size: int = 40, max_threads: int = 1024):
+        super().__init__()
+        self.window_size = window_size
+        self.max_threads = max_threads
+        self._windows: "OrderedDict[str, _ThreadWindow]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def load_window(self, thread_id, before_message_id: Optional[int] = None) -> List[Tuple]:
+        """返回会话最近的消息窗口，只查询上次加载之后的新消息
+
+        before_message_id 用于排除本轮刚写入、会作为图输入传入的用户消息。
+        """
+        thread_id = str(thread_id)
+        with self._lock:
+            window = self._windows.get(thread_id)
+            if window is None:
+                window = _ThreadWindow(self.window_size)
+                self._windows[thread_id] = window
+            self._windows.move_to_end(thread_id)
+            while len(self._windows) > self.max_threads:
+                self._windows.popitem(last=False)
+            last_id = window.last_id
+
+        query = db.session.query(Message.id, Message.role, Message.content, Message.created_at).filter(
+            Message.chat_id == int(thread_id),
+            Message.id > last_id,
+        )
+        if before_message_id is not None:
+            query = query.filter(Message.id < before_message_id)
+        rows = query.order_by(Message.id.desc()).limit(self.window_size).all()
+
+        with self._lock:
+            # 其他请求可能已经加载过同一批消息，只追加更新的部分
+            window.extend(row_tuple for row_tuple in (tuple(row) for row in reversed(rows))
+                          if row_tuple[0] > window.last_id)
+            if before_message_id is None:
+                return list(window.rows)
+            return [row for row in window.rows if row[0] < before_message_id]
+
+    def invalidate(self, thread_id=None) -> None:
+        """会话被删除时丢弃窗口；不传 thread_id 则清空全部"""
+        with self._lock:
+            if thread_id is None:
+                self._windows.clear()
+            else:
+                self._windows.pop(str(thread_id), None)
+
+    @staticmethod
+    def _to_message(row):
+        message_id, role, content, _ = row
+        if role == "assistant":
+            return AIMessage(content=content, id=f"message-{message_id}")
+        return HumanMessage(content=content, id=f"message-{message_id}")
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        configurable = config["configurable"]
+        thread_id = str(configurable["thread_id"])
+        # 聊天接口在开始流式输出前已加载好历史窗口，图运行期间不再访问数据库
+        rows = configurable.get("history")
+        if rows is None:
+            rows = self.load_window(thread_id, configurable.get("before_message_id"))
+        if not rows:
+            return None
+
+        checkpoint = empty_checkpoint()
+        checkpoint["channel_values"] = {"messages": [self._to_message(row) for row in rows]}
+        checkpoint["channel_versions"] = {"messages": self.get_next_version(None, None)}
+        return CheckpointTuple(
+            config={"configurable": {
+                "thread_id": thread_id,
+                "checkpoint_ns": configurable.get("checkpoint_ns", ""),
+                "checkpoint_id": checkpoint["id"],
+            }},
+            checkpoint=checkpoint,
+            metadata={"source": "loop", "step": -1, "writes": None, "parents": {}},
+            parent_config=None,
+            pending_writes=[],
+        )
+
+    def list(self, config: Optional[RunnableConfig], *, filter=None, before=None,
+             limit=None) -> Iterator[CheckpointTuple]:
+        if config is None:
+            return
+        saved = self.get_tuple(config)
+        if saved is not None:
+            yield saved
+
+    def put(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+            new_versions: ChannelVersions) -> RunnableConfig:
+        # 消息已由聊天接口写入 message 表，这里只返回新的检查点配置
+        return {"configurable": {
+            "thread_id": config["configurable"]["thread_id"],
+            "checkpoint_ns": config["configurable"].get("checkpoint_ns", ""),
+            "checkpoint_id": checkpoint["id"],
+        }}
+
+    def put_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, object]],
+                   task_id: str, task_path: str = "") -> None:
+        return None
+
+    def delete_thread(self, thread_id: str) -> None:
+        self.invalidate(thread_id)
+
+
+_checkpointer: Optional[MessageCheckpointer] = None
+_checkpointer_lock = threading.Lock()
+
+
+def get_checkpointer(config=None) -> MessageCheckpointer:
+    """获取当前 worker 进程的会话检查点（首次调用时按配置创建）"""
+    global _checkpointer
+    if _checkpointer is None:
+        with _checkpointer_lock:
+            if _checkpointer is None:
+                config = config or {}
+                _checkpointer = MessageCheckpointer(
+                    window_size=int(config.get('CHAT_HISTORY_WINDOW', 40)),
+                    max_threads=int(config.get('CHAT_HISTORY_MAX_THREADS', 1024)),
+                )
+    return _checkpointer
@@ -0,0 +1,148 @@
+import threading
+import time
+from collections import deque
+from typing import Optional
+
+from sqlalchemy import event, exc
+from sqlalchemy.pool import QueuePool
+
+
+class PoolMetrics:
+    """数据库连接池的取用统计（每个 worker 进程一份）
+
+    wait 是从请求连接到拿到连接的耗时（池中没有空闲连接时包含排队和新建连接的时间），
+    hold 是连接从取出到归还的时长，流式回答期间没有占用连接时 hold 应该只有几毫秒。
+    """
+
+    def __init__(self, samples: int = 2048):
+        self._lock = threading.Lock()
+        self._waits = deque(maxlen=samples)
+        self._holds = deque(maxlen=samples)
+        self.pool = None
+        self.checkouts = 0
+        self.connects = 0
+        self.invalidations = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_max = 0.0
+        self.hold_max = 0.0
+
+    def record_wait(self, pool, seconds: float, timed_out: bool = False):
+        with self._lock:
+            self.pool = pool
+            self._waits.append(seconds)
+            self.wait_seconds_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+            if timed_out:
+                self.timeouts += 1
+
+    def record_checkout(self, connection_record):
+        connection_record.info['checked_out_at'] = time.perf_counter()
+        with self._lock:
+            self.checkouts += 1
+
+    def record_checkin(self, connection_record):
+        started = connection_record.info.pop('checked_out_at', None)
+        if started is None:
+            return
+        seconds = time.perf_counter() - started
+        with self._lock:
+            self._holds.append(seconds)
+            self.hold_max = max(self.hold_max, seconds)
+
+    def record_connect(self):
+        with self._lock:
+            self.connects += 1
+
+    def record_invalidation(self):
+        with self._lock:
+            self.invalidations += 1
+
+    @staticmethod
+    def _percentile_ms(values, p: float) -> Optional[float]:
+        if not values:
+            return None
+        values = sorted(values)
+        return round(values[min(len(values) - 1, int(len(values) * p))] * 1000, 2)
+
+    def stats(self) -> dict:
+        with self._lock:
+            waits, holds, pool = list(self._waits), list(self._holds), self.pool
+            result = {
+                "checkouts": self.checkouts,
+                "connects": self.connects,
+                "invalidations": self.invalidations,
+                "timeouts": self.timeouts,
+                "wait_seconds_total": round(self.wait_seconds_total, 3),
+                "wait_max_ms": round(self.wait_max * 1000, 2),
+                "hold_max_ms": round(self.hold_max * 1000, 2),
+            }
+        result.update({
+            "wait_p50_ms": self._percentile_ms(waits, 0.5),
+            "wait_p99_ms": self._percentile_ms(waits, 0.99),
+            "hold_p50_ms": self._percentile_ms(holds, 0.5),
+            "hold_p99_ms": self._percentile_ms(holds, 0.99),
+        })
+        if pool is not None:
+            result.update({
+                "size": pool.size(),
+                "checked_out": pool.checkedout(),
+                "overflow": max(0, pool.overflow()),
+            })
+        return result
+
+
+_metrics = PoolMetrics()
+
+
+def get_pool_metrics() -> PoolMetrics:
+    return _metrics
+
+
+class MeteredQueuePool(QueuePool):
+    """记录取连接等待时间的 QueuePool"""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            _metrics.record_wait(self, time.perf_counter() - started, timed_out=True)
+            raise
+        _metrics.record_wait(self, time.perf_counter() - started)
+        return connection
+
+
+@event.listens_for(MeteredQueuePool, "checkout")
+def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+    _metrics.record_checkout(connection_record)
+
+
+@event.listens_for(MeteredQueuePool, "checkin")
+def _on_checkin(dbapi_connection, connection_record):
+    _metrics.record_checkin(connection_record)
+
+
+@event.listens_for(MeteredQueuePool, "connect")
+def _on_connect(dbapi_connection, connection_record):
+    _metrics.record_connect()
+
+
+@event.listens_for(MeteredQueuePool, "invalidate")
+def _on_invalidate(dbapi_connection, connection_record, exception):
+    _metrics.record_invalidation()
+
+
+def engine_options(config) -> dict:
+    """按配置生成 SQLALCHEMY_ENGINE_OPTIONS
+
+    内存 SQLite 只能使用单连接的连接池，不设置池大小；其他数据库使用带统计的 QueuePool。
+    """
+    options = dict(config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    uri = config.get('SQLALCHEMY_DATABASE_URI') or ''
+    if uri == 'sqlite://' or ':memory:' in uri:
+        for key in ('pool_size', 'max_overflow', 'pool_timeout', 'poolclass'):
+            options.pop(key, None)
+        return options
+    options.setdefault('poolclass', MeteredQueuePool)
+    return options
@@ -0,0 +1,105 @@
+import os
+from typing import Iterator, List, Tuple
+
+from langchain_community.document_loaders import Docx2txtLoader
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from PyPDF2 import PdfReader
+
+# 文本文件按字节区间划分解析任务，区间边界对齐到换行符之后
+TEXT_SECTION_BYTES = 256 * 1024
+
+# 解析进程中最近打开的 PDF：((路径, 修改时间, 大小), PdfReader)
+_pdf_reader = None
+
+
+def _open_pdf(file_path: str) -> PdfReader:
+    """同一进程连续解析同一个 PDF 的多个区间时复用 PdfReader，避免每个区间都重新展开页目录"""
+    global _pdf_reader
+    stat = os.stat(file_path)
+    key = (file_path, stat.st_mtime_ns, stat.st_size)
+    if _pdf_reader is None or _pdf_reader[0] != key:
+        _pdf_reader = (key, PdfReader(file_path))
+    return _pdf_reader[1]
+
+
+def _check_file(file_path: str, file_type: int):
+    # 验证文件路径安全性
+    if not os.path.exists(file_path):
+        raise FileNotFoundError("文件不存在")
+
+    # 验证文件权限
+    if not os.access(file_path, os.R_OK):
+        raise PermissionError("没有文件读取权限")
+
+    # 文件类型：1 文本，2 PDF，3 Word
+    if file_type not in (1, 2, 3):
+        raise ValueError("文件类型暂不支持")
+
+
+def plan_sections(file_path: str, file_type: int, pages_per_section: int = 10) -> List[Tuple[int, int]]:
+    """把文档划分为可以独立解析的区间：PDF 按页，文本按字节，Word 整个文件为一个区间
+
+    只读取 PDF 的页目录和文件大小，不解析正文。
+    """
+    _check_file(file_path, file_type)
+    if file_type == 2:
+        total, step = len(_open_pdf(file_path).pages), max(1, pages_per_section)
+    elif file_type == 1:
+        total, step = os.path.getsize(file_path), TEXT_SECTION_BYTES
+    else:
+        return [(0, 1)]
+    return [(start, min(start + step, total)) for start in range(0, total, step)] or [(0, 0)]
+
+
+def _line_boundary(f, position: int, size: int) -> int:
+    """position 处或之后第一个换行符的下一个字节位置"""
+    if position <= 0:
+        return 0
+    if position >= size:
+        return size
+    f.seek(position)
+    while True:
+        block = f.read(64 * 1024)
+        if not block:
+            return size
+        index = block.find(b"\n")
+        if index >= 0:
+            return position + index + 1
+        position += len(block)
+
+
+def _load_section(file_path: str, file_type: int, start: int, end: int) -> List[Document]:
+    if file_type == 2:
+        reader = _open_pdf(file_path)
+        total = len(reader.pages)
+        return [Document(page_content=(reader.pages[page].extract_text() or "").strip(),
+                         metadata={"source": file_path, "page": page, "total_pages": total})
+                for page in range(start, min(end, total))]
+    if file_type == 1:
+        size = os.path.getsize(file_path)
+        with open(file_path, "rb") as f:
+            begin, finish = _line_boundary(f, start, size), _line_boundary(f, end, size)
+            f.seek(begin)
+            text = f.read(max(0, finish - begin)).decode("utf-8")
+        return [Document(page_content=text, metadata={"source": file_path})]
+    return Docx2txtLoader(file_path).load()
+
+
+def parse_section(file_path: str, file_type: int, start: int, end: int, chunk_size: int = 1000,
+                  chunk_overlap: int = 200) -> List[Tuple[str, dict]]:
+    """解析并切分文档的一个区间，返回 (文本, 元数据) 列表
+
+    只依赖文件路径和基本类型参数，可以直接提交到进程池执行。
+    """
+    _check_file(file_path, file_type)
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    docs = [doc for doc in _load_section(file_path, file_type, start, end) if doc.page_content]
+    return [(doc.page_content, doc.metadata) for doc in text_splitter.split_documents(docs)]
+
+
+def iter_document(file_path: str, file_type: int, pages_per_section: int = 10) -> Iterator[Tuple[str, dict]]:
+    """在当前进程中逐个区间解析文档，依次产出 (文本, 元数据)"""
+    for start, end in plan_sections(file_path, file_type, pages_per_section):
+        yield from parse_section(file_path, file_type, start, end)
+
@@ -0,0 +1,237 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from langchain_core.embeddings import Embeddings
+
+
+def normalize_query(text: str) -> str:
+    """规范化查询文本：全角转半角、去掉首尾空白、合并连续空白、英文转小写"""
+    text = unicodedata.normalize("NFKC", text or "")
+    return " ".join(text.split()).lower()
+
+
+# 命中后的 last_used 更新攒够这么多条、或距上次写入超过这么多秒时批量写入
+TOUCH_BATCH = 64
+TOUCH_INTERVAL = 30
+
+
+class _DiskStore:
+    """跨 worker 共享的向量缓存，保存在本地 SQLite 文件中
+
+    查询向量（query_embedding）和文档块向量（chunk_embedding）分表存放，各自按行数上限淘汰最久未使用的记录。
+    命中时不立即写库，而是把 last_used 的更新攒成一批再写入，淘汰前先写入尚未提交的更新。
+    """
+
+    def __init__(self, path: str, model: str, max_rows: int = 100000, table: str = "query_embedding"):
+        self.path = path
+        self.model = model
+        self.max_rows = max_rows
+        self.table = table
+        self._local = threading.local()
+        self._writes = 0
+        self._touched: Dict[str, float] = {}
+        self._touched_at = time.monotonic()
+        self._touch_lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._conn()
+        conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            " key TEXT PRIMARY KEY, model TEXT NOT NULL, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_last_used ON {table} (last_used)")
+        # 向量化模型变化后，旧模型的向量全部作废
+        conn.execute(f"DELETE FROM {table} WHERE model != ?", (model,))
+        conn.commit()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[List[float]]:
+        row = self._conn().execute(
+            f"SELECT vector FROM {self.table} WHERE key = ? AND model = ?", (key, self.model)
+        ).fetchone()
+        if row is None:
+            return None
+        self._touch([key])
+        return array("f", row[0]).tolist()
+
+    def get_many(self, keys: List[str]) -> Dict[str, List[float]]:
+        found = {}
+        conn = self._conn()
+        for start in range(0, len(keys), 500):
+            batch = keys[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            for key, vector in conn.execute(
+                f"SELECT key, vector FROM {self.table} WHERE model = ? AND key IN ({placeholders})",
+                [self.model, *batch],
+            ):
+                found[key] = array("f", vector).tolist()
+        if found:
+            self._touch(list(found))
+        return found
+
+    def _touch(self, keys: List[str]):
+        """记录命中的键，攒够一批或间隔超过 TOUCH_INTERVAL 秒后一次性更新 last_used"""
+        now = time.time()
+        with self._touch_lock:
+            for key in keys:
+                self._touched[key] = now
+            if len(self._touched) < TOUCH_BATCH and time.monotonic() - self._touched_at < TOUCH_INTERVAL:
+                return
+        try:
+            conn = self._conn()
+            self._write_touches(conn)
+            conn.commit()
+        except sqlite3.Error as e:
+            print(f"更新向量缓存使用时间出错: {str(e)}")
+
+    def _write_touches(self, conn):
+        with self._touch_lock:
+            touched, self._touched = self._touched, {}
+            self._touched_at = time.monotonic()
+        if touched:
+            conn.executemany(f"UPDATE {self.table} SET last_used = MAX(last_used, ?) WHERE key = ?",
+                             [(used, key) for key, used in touched.items()])
+
+    def put(self, key: str, vector: List[float]):
+        self.put_many([(key, vector)])
+
+    def put_many(self, items: List[Tuple[str, List[float]]]):
+        conn = self._conn()
+        now = time.time()
+        conn.executemany(
+            f"INSERT OR REPLACE INTO {self.table} (key, model, vector, last_used) VALUES (?, ?, ?, ?)",
+            [(key, self.model, array("f", vector).tobytes(), now) for key, vector in items],
+        )
+        previous, self._writes = self._writes, self._writes + len(items)
+        if self._writes // 100 != previous // 100:
+            # 超出上限时删除最久未使用的记录，先写入命中记录的使用时间
+            self._write_touches(conn)
+            conn.execute(
+                f"DELETE FROM {self.table} WHERE key IN ("
+                f" SELECT key FROM {self.table} ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_rows,),
+            )
+        conn.commit()
+
+
+class CachedEmbeddings(Embeddings):
+    """带查询向量缓存的 Embeddings 包装
+
+    embed_query 先查进程内 LRU，再查（可选的）磁盘缓存，都未命中才请求向量化服务。
+    缓存键为 (向量化模型, 规范化后的查询文本)，更换 EMBEDDINGS_MODEL 后旧缓存自动失效。
+    embed_documents 在启用磁盘缓存时按 (向量化模型, 块文本) 的哈希查找已有向量，
+    同一文件重复上传、或相同的块出现在不同文件/知识库中时不会重复向量化。
+    """
+
+    def __init__(self, embeddings: Embeddings, model: str, max_size: int = 2048,
+                 disk_path: Optional[str] = None, disk_max_rows: int = 100000,
+                 chunk_disk_max_rows: int = 200000):
+        self.embeddings = embeddings
+        self.model = model
+        self.max_size = max_size
+        self._memory: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk = _DiskStore(disk_path, model, disk_max_rows) if disk_path else None
+        self._chunks = _DiskStore(disk_path, model, chunk_disk_max_rows, table="chunk_embedding") \
+            if disk_path else None
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.chunk_hits = 0
+        self.chunk_misses = 0
+
+    def _key(self, text: str) -> str:
+        normalized = normalize_query(text)
+        return hashlib.sha256(f"{self.model}\0{normalized}".encode("utf-8")).hexdigest()
+
+    def embed_query(self, text: str) -> List[float]:
+        key = self._key(text)
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return vector
+
+        vector = None
+        if self._disk is not None:
+            try:
+                vector = self._disk.get(key)
+            except sqlite3.Error as e:
+                print(f"读取查询向量缓存出错: {str(e)}")
+        if vector is not None:
+            with self._lock:
+                self.disk_hits += 1
+        else:
+            vector = self.embeddings.embed_query(normalize_query(text))
+            with self._lock:
+                self.misses += 1
+            if self._disk is not None:
+                try:
+                    self._disk.put(key, vector)
+                except sqlite3.Error as e:
+                    print(f"写入查询向量缓存出错: {str(e)}")
+
+        with self._lock:
+            self._memory[key] = vector
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_size:
+                self._memory.popitem(last=False)
+        return vector
+
+    def _chunk_key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model}\0{text}".encode("utf-8")).hexdigest()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if self._chunks is None:
+            return self.embeddings.embed_documents(texts)
+        keys = [self._chunk_key(text) for text in texts]
+        try:
+            found = self._chunks.get_many(list(set(keys)))
+        except sqlite3.Error as e:
+            print(f"读取文档块向量缓存出错: {str(e)}")
+            found = {}
+        # 同一批次内重复的块只向量化一次
+        missing = list(dict.fromkeys(key for key in keys if key not in found))
+        if missing:
+            text_of = dict(zip(keys, texts))
+            vectors = self.embeddings.embed_documents([text_of[key] for key in missing])
+            new = list(zip(missing, vectors))
+            found.update(new)
+            try:
+                self._chunks.put_many(new)
+            except sqlite3.Error as e:
+                print(f"写入文档块向量缓存出错: {str(e)}")
+        with self._lock:
+            self.chunk_hits += len(keys) - len(missing)
+            self.chunk_misses += len(missing)
+        return [found[key] for key in keys]
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "size": len(self._memory),
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.memory_hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+                "chunk_hits": self.chunk_hits,
+                "chunk_misses": self.chunk_misses,
+            }
@@ -0,0 +1,139 @@
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Iterable, List, Optional, Sequence, Tuple
+
+
+class EmbeddingError(Exception):
+    """部分批次在重试后仍然向量化失败"""
+
+    def __init__(self, failed_chunks: int, last_error: Exception):
+        super().__init__(f"{failed_chunks} 个文档块向量化失败: {last_error}")
+        self.failed_chunks = failed_chunks
+        self.last_error = last_error
+
+
+class _AdaptiveLimit:
+    """自适应的并发上限：成功时加一，失败时减半（AIMD）"""
+
+    def __init__(self, maximum: int):
+        self.maximum = maximum
+        self.limit = maximum
+        self.active = 0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        with self._cond:
+            while self.active >= self.limit:
+                self._cond.wait()
+            self.active += 1
+
+    def release(self, ok: bool):
+        with self._cond:
+            self.active -= 1
+            if ok:
+                self.limit = min(self.maximum, self.limit + 1)
+            else:
+                self.limit = max(1, self.limit // 2)
+            self._cond.notify_all()
+
+
+class EmbeddingExecutor:
+    """分批、并发地调用向量化服务
+
+    文本按 batch_size 分批，同时在途的请求不超过 max_in_flight；向量化服务出错时
+    按指数退避重试失败的批次并降低并发，已经成功的批次通过 on_batch 立即交给调用方，
+    不会因为其他批次失败而重新向量化。批次也可以由生成器边产生边提交（embed_batches）。
+    """
+
+    def __init__(self, embeddings, batch_size: int = 32, max_in_flight: int = 4, max_retries: int = 5,
+                 base_backoff: float = 0.5, max_backoff: float = 30):
+        self.embeddings = embeddings
+        self.batch_size = batch_size
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.stats = {}
+
+    def _embed_batch(self, limit: _AdaptiveLimit, key: Any, texts: Sequence[str]):
+        attempt = 0
+        while True:
+            limit.acquire()
+            ok = False
+            try:
+                vectors = self.embeddings.embed_documents(list(texts))
+                ok = True
+                return key, vectors, attempt
+            except Exception as e:
+                attempt += 1
+                if attempt > self.max_retries:
+                    raise
+                print(f"向量化批次失败（第 {attempt} 次，{len(texts)} 个块），稍后重试: {str(e)}")
+            finally:
+                limit.release(ok)
+            delay = min(self.max_backoff, self.base_backoff * 2 ** (attempt - 1))
+            time.sleep(delay * (0.5 + random.random()))
+
+    def embed(self, texts: Sequence[str],
+              on_batch: Optional[Callable[[int, List[List[float]]], None]] = None) -> dict:
+        """向量化 texts，每完成一个批次调用 on_batch(起始下标, 向量列表)"""
+        return self.embed_batches(((start, texts[start:start + self.batch_size])
+                                   for start in range(0, len(texts), self.batch_size)), on_batch)
+
+    def embed_batches(self, batches: Iterable[Tuple[Any, Sequence[str]]],
+                      on_batch: Optional[Callable[[Any, List[List[float]]], None]] = None) -> dict:
+        """依次从 batches 取出 (键, 文本列表) 并向量化，每完成一个批次调用 on_batch(键, 向量列表)
+
+        batches 可以是生成器：已取出但未处理完的批次不超过 max_in_flight * 2 个，
+        生成器产生后面批次的同时，前面的批次已经在向量化，内存中只保留在途的批次。
+        on_batch 和生成器都在调用线程中执行，可以安全地写数据库或向量库。
+        全部批次处理完后，如果仍有失败的批次则抛出 EmbeddingError。
+        """
+        started = time.perf_counter()
+        limit = _AdaptiveLimit(self.max_in_flight)
+        embedded, retries, failed, last_error = 0, 0, 0, None
+        batches = iter(batches)
+        exhausted = False
+
+        with ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix="embedding") as pool:
+            futures = {}
+            while futures or not exhausted:
+                if not exhausted and len(futures) < self.max_in_flight * 2:
+                    item = next(batches, None)
+                    if item is None:
+                        exhausted = True
+                    else:
+                        key, texts = item
+                        futures[pool.submit(self._embed_batch, limit, key, texts)] = len(texts)
+                if exhausted or len(futures) >= self.max_in_flight * 2:
+                    completed = wait(futures, return_when=FIRST_COMPLETED).done if futures else set()
+                else:
+                    # 还能继续取批次时只处理已经完成的批次，不等待
+                    completed = [future for future in futures if future.done()]
+                for future in completed:
+                    size = futures.pop(future)
+                    try:
+                        key, vectors, attempts = future.result()
+                    except Exception as e:
+                        failed += size
+                        last_error = e
+                        continue
+                    retries += attempts
+                    if on_batch:
+                        on_batch(key, vectors)
+                    embedded += len(vectors)
+
+        elapsed = time.perf_counter() - started
+        self.stats = {
+            "chunks": embedded,
+            "failed_chunks": failed,
+            "retries": retries,
+            "seconds": round(elapsed, 3),
+            "chunks_per_sec": round(embedded / elapsed, 1) if elapsed > 0 else 0.0,
+        }
+        print(f"向量化完成: {self.stats}")
+        if failed:
+            raise EmbeddingError(failed, last_error)
+        return self.stats
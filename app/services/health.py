@@ -0,0 +1,110 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Optional
+
+import requests
+
+from app import db
+from app.services.vector_store_cache import get_vector_store_cache
+
+# 就绪检查依赖的组件；embeddings 只影响知识库问答和文档导入，不可用时只标记为降级
+CRITICAL_CHECKS = ('database', 'chroma', 'model')
+
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='health')
+_cached: Optional[dict] = None
+_cached_at = 0.0
+_cache_lock = threading.Lock()
+
+
+def check_database(app, timeout: float):
+    with app.app_context():
+        db.session.execute(db.text('SELECT 1'))
+        db.session.commit()
+    return {}
+
+
+def check_chroma(app, timeout: float):
+    client = get_vector_store_cache(app.config).client
+    client.heartbeat()
+    # heartbeat 不访问磁盘，再查一次集合数确认持久化目录可读
+    return {'collections': client.count_collections()}
+
+
+def _http_check(url: str, timeout: float, headers: dict = None):
+    response = requests.get(url, headers=headers or {}, timeout=timeout)
+    # 能返回响应（包括 4xx）说明服务可达；5xx 视为不可用
+    if response.status_code >= 500:
+        raise RuntimeError(f"HTTP {response.status_code}")
+    return {'status_code': response.status_code}
+
+
+def check_model(app, timeout: float):
+    base_url = app.config.get('OPENAI_API_URL')
+    if not base_url:
+        return {'skipped': '未配置 OPENAI_API_URL'}
+    api_key = app.config.get('OPENAI_API_KEY')
+    headers = {'Authorization': f"Bearer {api_key}"} if api_key else {}
+    return _http_check(f"{base_url.rstrip('/')}/models", timeout, headers)
+
+
+def check_embeddings(app, timeout: float):
+    base_url = app.config.get('EMBEDDINGS_URL')
+    if not base_url:
+        return {'skipped': '未配置 EMBEDDINGS_URL'}
+    # Ollama 的模型列表接口
+    return _http_check(f"{base_url.rstrip('/')}/api/tags", timeout)
+
+
+CHECKS = {
+    'database': check_database,
+    'chroma': check_chroma,
+    'model': check_model,
+    'embeddings': check_embeddings,
+}
+
+
+def _timed(check, app, timeout: float) -> dict:
+    started = time.perf_counter()
+    try:
+        result = dict(check(app, timeout), ok=True)
+    except Exception as e:
+        result = {'ok': False, 'error': str(e)}
+    result['latency_ms'] = round((time.perf_counter() - started) * 1000, 1)
+    return result
+
+
+def _run_checks(app, timeout: float) -> dict:
+    """并发执行各项检查，总共最多等待 timeout 秒，未完成的检查记为失败"""
+    started = time.perf_counter()
+    futures = {name: _executor.submit(_timed, check, app, timeout) for name, check in CHECKS.items()}
+    checks = {}
+    for name, future in futures.items():
+        remaining = max(0.0, timeout - (time.perf_counter() - started))
+        try:
+            checks[name] = future.result(timeout=remaining)
+        except FutureTimeoutError:
+            checks[name] = {'ok': False, 'error': f"超过 {timeout} 秒未响应", 'latency_ms': round(timeout * 1000, 1)}
+    ready = all(checks[name]['ok'] for name in CRITICAL_CHECKS)
+    return {
+        'ready': ready,
+        'status': 'ok' if ready and all(check['ok'] for check in checks.values()) else
+                  'degraded' if ready else 'unavailable',
+        'checks': checks,
+    }
+
+
+def readiness(app) -> dict:
+    """就绪检查结果，在 HEALTH_READY_CACHE_SECONDS 内复用上一次的结果
+
+    负载均衡器和容器编排会频繁探测，缓存避免每次探测都访问数据库和模型服务。
+    """
+    global _cached, _cached_at
+    ttl = float(app.config.get('HEALTH_READY_CACHE_SECONDS', 5))
+    with _cache_lock:
+        if _cached is not None and time.monotonic() - _cached_at < ttl:
+            return _cached
+    result = _run_checks(app, float(app.config.get('HEALTH_CHECK_TIMEOUT', 2)))
+    with _cache_lock:
+        _cached, _cached_at = result, time.monotonic()
+    return result
@@ -0,0 +1,101 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import NamedTuple, Optional
+
+from app import db
+from app.models import User
+
+
+class Identity(NamedTuple):
+    """已登录用户的只读快照，请求处理中通过 flask_jwt_extended.current_user 获取
+
+    不包含密码；需要修改用户资料时再按 id 读取 User 模型。
+    """
+    id: int
+    username: Optional[str]
+    nickname: Optional[str]
+    avatar: Optional[str]
+    created_at: Optional[datetime]
+
+    @classmethod
+    def from_user(cls, user) -> "Identity":
+        return cls(user.id, user.username, user.nickname, user.avatar, user.created_at)
+
+
+class IdentityCache:
+    """按用户 ID 缓存 Identity（LRU + TTL）
+
+    每个 worker 进程一份。本进程修改资料或头像后调用 invalidate 立即失效；
+    其他 worker 中的旧快照最多保留 ttl 秒。ttl 为 0 时不缓存。
+    """
+
+    def __init__(self, max_size: int = 10000, ttl: float = 60):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._identities: "OrderedDict[int, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id: int) -> Optional[Identity]:
+        if not self.ttl:
+            return None
+        with self._lock:
+            cached = self._identities.get(user_id)
+            if cached is not None and time.monotonic() - cached[1] < self.ttl:
+                self._identities.move_to_end(user_id)
+                self.hits += 1
+                return cached[0]
+            self._identities.pop(user_id, None)
+            self.misses += 1
+            return None
+
+    def put(self, identity: Identity) -> None:
+        if not self.ttl:
+            return
+        with self._lock:
+            self._identities[identity.id] = (identity, time.monotonic())
+            self._identities.move_to_end(identity.id)
+            while len(self._identities) > self.max_size:
+                self._identities.popitem(last=False)
+
+    def invalidate(self, user_id: int) -> None:
+        with self._lock:
+            self._identities.pop(user_id, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"size": len(self._identities), "hits": self.hits, "misses": self.misses}
+
+
+_cache: Optional[IdentityCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_identity_cache(config=None) -> IdentityCache:
+    """获取当前 worker 进程的用户身份缓存（首次调用时按配置创建）"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                config = config or {}
+                _cache = IdentityCache(
+                    max_size=int(config.get('USER_CACHE_SIZE', 10000)),
+                    ttl=float(config.get('USER_CACHE_TTL', 60)),
+                )
+    return _cache
+
+
+def load_identity(user_id: int, config=None) -> Optional[Identity]:
+    """按 ID 获取用户身份，缓存未命中时查询一次数据库；用户不存在时返回 None"""
+    cache = get_identity_cache(config)
+    identity = cache.get(user_id)
+    if identity is None:
+        user = db.session.get(User, user_id)
+        if user is None:
+            return None
+        identity = Identity.from_user(user)
+        cache.put(identity)
+    return identity
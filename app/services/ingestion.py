@@ -0,0 +1,246 @@
+import multiprocessing
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta, timezone
+from typing import Iterator, Optional, Tuple
+
+from app import db
+from app.models import IngestionJob, Repository, RepositoryFile
+from app.services.chat_service import ChatService
+from app.services.document_parser import parse_section, plan_sections
+
+ACTIVE_STATUSES = ('parsing', 'embedding')
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+def _file_rows(job: IngestionJob):
+    """任务对应的文件记录：内容相同的文件共享 file_id 和同一个导入任务，状态一起更新"""
+    return RepositoryFile.query.filter_by(repository_id=job.repository_id, file_id=job.file_id)
+
+
+class IngestionManager:
+    """知识库文件的后台导入
+
+    上传接口只负责保存文件并写入一条 queued 状态的 ingestion_job 记录。
+    每个 worker 进程有一个调度线程，从表中原子地认领任务：文档按页区间（每个区间
+    pages_per_task 页）提交到进程池解析，最多提前解析 parse_workers * 2 个区间；
+    解析出的块按顺序流入向量化（网络 I/O，在线程池中执行），前面的页向量化时后面的页仍在解析，
+    内存中只保留有限个区间的块。同时运行的任务数不超过 embed_workers。
+    任务状态保存在数据库中，进度更新同时作为心跳；进程重启或崩溃后，
+    超过 lease 秒没有心跳的任务会被重新放回队列。
+    """
+
+    def __init__(self, app, parse_workers: int = 2, embed_workers: int = 2, poll_interval: float = 5,
+                 lease: float = 600, max_attempts: int = 3, pages_per_task: int = 10):
+        self.app = app
+        self.parse_workers = parse_workers
+        self.pages_per_task = pages_per_task
+        self.embed_workers = embed_workers
+        self.poll_interval = poll_interval
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self._parse_pool = None
+        self._parse_pool_lock = threading.Lock()
+        self._threads = ThreadPoolExecutor(max_workers=embed_workers, thread_name_prefix="ingestion")
+        self._slots = threading.BoundedSemaphore(embed_workers)
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._dispatcher = None
+
+    def start(self):
+        if self._dispatcher is None:
+            self._dispatcher = threading.Thread(target=self._dispatch_loop, name="ingestion-dispatcher",
+                                                daemon=True)
+            self._dispatcher.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._wakeup.set()
+        self._threads.shutdown(wait=False)
+        if self._parse_pool is not None:
+            self._parse_pool.shutdown(wait=False)
+
+    def notify(self):
+        """有新任务入队时唤醒调度线程，不必等到下一次轮询"""
+        self._wakeup.set()
+
+    def queue_depth(self) -> int:
+        return IngestionJob.query.filter_by(status='queued').count()
+
+    @staticmethod
+    def retry(job: IngestionJob) -> bool:
+        """把失败的任务重新放回队列（调用方负责提交事务）"""
+        if job.status != 'failed':
+            return False
+        job.status = 'queued'
+        job.attempts = 0
+        job.error = None
+        job.updated_at = _now()
+        _file_rows(job).update({'status': 'queued'}, synchronize_session=False)
+        return True
+
+    def _get_parse_pool(self):
+        with self._parse_pool_lock:
+            if self._parse_pool is None:
+                # gunicorn worker 中已有多个线程，使用 spawn 避免 fork 带来的锁状态问题
+                self._parse_pool = ProcessPoolExecutor(max_workers=self.parse_workers,
+                                                       mp_context=multiprocessing.get_context("spawn"))
+            return self._parse_pool
+
+    def _reset_parse_pool(self):
+        with self._parse_pool_lock:
+            if self._parse_pool is not None:
+                self._parse_pool.shutdown(wait=False)
+                self._parse_pool = None
+
+    def _dispatch_loop(self):
+        while not self._stopped.is_set():
+            try:
+                with self.app.app_context():
+                    self._requeue_stale()
+                    while self._slots.acquire(blocking=False):
+                        job_id = self._claim_next()
+                        if job_id is None:
+                            self._slots.release()
+                            break
+                        self._threads.submit(self._run, job_id)
+            except Exception as e:
+                print(f"导入任务调度出错: {str(e)}")
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+
+    def _requeue_stale(self):
+        deadline = _now() - timedelta(seconds=self.lease)
+        count = IngestionJob.query.filter(
+            IngestionJob.status.in_(ACTIVE_STATUSES),
+            IngestionJob.updated_at < deadline,
+        ).update({'status': 'queued', 'updated_at': _now()}, synchronize_session=False)
+        db.session.commit()
+        if count:
+            print(f"重新排队 {count} 个超时的导入任务")
+
+    def _claim_next(self) -> Optional[int]:
+        candidates = [row.id for row in db.session.query(IngestionJob.id)
+                      .filter_by(status='queued').order_by(IngestionJob.id).limit(5)]
+        for job_id in candidates:
+            # 条件更新保证多个 worker 进程不会认领同一个任务
+            claimed = IngestionJob.query.filter_by(id=job_id, status='queued').update({
+                'status': 'parsing',
+                'attempts': IngestionJob.attempts + 1,
+                'updated_at': _now(),
+            }, synchronize_session=False)
+            db.session.commit()
+            if claimed:
+                return job_id
+        return None
+
+    def _update(self, job_id: int, **fields):
+        fields['updated_at'] = _now()
+        IngestionJob.query.filter_by(id=job_id).update(fields, synchronize_session=False)
+        db.session.commit()
+
+    def _run(self, job_id: int):
+        try:
+            with self.app.app_context():
+                try:
+                    self._process(job_id)
+                except Exception as e:
+                    db.session.rollback()
+                    if isinstance(e, BrokenProcessPool):
+                        self._reset_parse_pool()
+                    job = db.session.get(IngestionJob, job_id)
+                    if job is not None:
+                        # 未超过最大重试次数的任务自动重新排队
+                        status = 'queued' if (job.attempts or 0) < self.max_attempts else 'failed'
+                        print(f"导入任务 {job_id} 失败（第 {job.attempts} 次）: {str(e)}")
+                        _file_rows(job).update({'status': status}, synchronize_session=False)
+                        self._update(job_id, status=status, error=str(e)[:1000])
+        except Exception as e:
+            print(f"导入任务 {job_id} 状态更新出错: {str(e)}")
+        finally:
+            self._slots.release()
+            self.notify()
+
+    def _wait(self, job_id: int, future):
+        while True:
+            try:
+                return future.result(timeout=min(30, self.lease / 2))
+            except FutureTimeoutError:
+                self._update(job_id)  # 解析大文件时保持心跳
+
+    def _iter_chunks(self, job_id: int, file_path: str, file_type: int) -> Iterator[Tuple[str, dict]]:
+        """按页区间在进程池中解析文档，按顺序产出块，并提前提交后续区间的解析"""
+        pool = self._get_parse_pool()
+        sections = deque(self._wait(job_id, pool.submit(plan_sections, file_path, file_type,
+                                                         self.pages_per_task)))
+        print(f"导入任务 {job_id} 共 {len(sections)} 个解析区间")
+        pending = deque()
+        try:
+            while sections or pending:
+                while sections and len(pending) < self.parse_workers * 2:
+                    start, end = sections.popleft()
+                    pending.append(pool.submit(parse_section, file_path, file_type, start, end))
+                yield from self._wait(job_id, pending.popleft())
+        finally:
+            # 向量化失败时不再解析剩余区间
+            for future in pending:
+                future.cancel()
+
+    def _process(self, job_id: int):
+        job = db.session.get(IngestionJob, job_id)
+        if job is None:
+            return
+        repository_id, file_id, file_path, file_type = job.repository_id, job.file_id, job.file_path, job.file_type
+        _file_rows(job).update({'status': 'ingesting'}, synchronize_session=False)
+        db.session.commit()
+
+        cs = ChatService(repository_id=repository_id)
+        count = cs.add_chunks(
+            file_id, file_path, self._iter_chunks(job_id, file_path, file_type),
+            progress=lambda done, total: self._update(job_id, status='embedding', processed_chunks=done,
+                                                      total_chunks=total))
+        print(f"导入任务 {job_id} 完成，共 {count} 个块")
+        # 任务状态、文件清单和内容版本在同一个事务中更新；
+        # 内容版本递增使所有 worker 的答案缓存失效
+        IngestionJob.query.filter_by(id=job_id).update({
+            'status': 'done', 'total_chunks': count, 'processed_chunks': count, 'error': None,
+            'updated_at': _now(),
+        }, synchronize_session=False)
+        RepositoryFile.query.filter_by(repository_id=repository_id, file_id=file_id).update(
+            {'status': 'ready', 'chunk_count': count}, synchronize_session=False)
+        Repository.query.filter_by(id=repository_id).update(
+            {'content_version': Repository.content_version + 1}, synchronize_session=False)
+        db.session.commit()
+
+
+_manager: Optional[IngestionManager] = None
+
+
+def init_ingestion(app) -> Optional[IngestionManager]:
+    """创建并启动当前 worker 进程的导入任务调度"""
+    global _manager
+    if multiprocessing.parent_process() is not None:
+        # 解析进程池的子进程会重新导入主模块，不能在其中再启动调度
+        return None
+    if _manager is None:
+        _manager = IngestionManager(
+            app,
+            parse_workers=int(app.config.get('INGESTION_PARSE_WORKERS', 2)),
+            embed_workers=int(app.config.get('INGESTION_EMBED_WORKERS', 2)),
+            poll_interval=float(app.config.get('INGESTION_POLL_INTERVAL', 5)),
+            lease=float(app.config.get('INGESTION_JOB_LEASE', 600)),
+            max_attempts=int(app.config.get('INGESTION_MAX_ATTEMPTS', 3)),
+            pages_per_task=int(app.config.get('INGESTION_PAGES_PER_TASK', 10)),
+        )
+        _manager.start()
+    return _manager
+
+
+def get_ingestion_manager() -> Optional[IngestionManager]:
+    return _manager
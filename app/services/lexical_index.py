@@ -0,0 +1,435 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+import unicodedata
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows 开发环境没有 fcntl，只在单进程内加锁
+    fcntl = None
+
+try:
+    import jieba
+except ImportError:
+    jieba = None
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:[-_./][a-z0-9]+)*|[\u3400-\u9fff\uf900-\ufaff]+")
+
+
+def _cjk_bigrams(run: str) -> List[str]:
+    if len(run) == 1:
+        return [run]
+    return [run[i:i + 2] for i in range(len(run) - 1)]
+
+
+def _cjk_jieba(run: str) -> List[str]:
+    return [word for word in jieba.lcut_for_search(run) if word.strip()]
+
+
+def available_tokenizer() -> str:
+    """新建索引使用的分词方式：安装了 jieba 时按词切分，否则使用汉字二元组"""
+    return "jieba" if jieba is not None else "bigram"
+
+
+def tokenize(text: str, tokenizer: str = "bigram") -> List[str]:
+    """把文本切分为检索词：英文和数字按词（保留表单编号中的 - _ . /），汉字按 jieba 或二元组"""
+    split_cjk = _cjk_jieba if tokenizer == "jieba" else _cjk_bigrams
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    tokens = []
+    for match in _TOKEN_RE.finditer(text):
+        run = match.group()
+        if run[0] < "\u3400":
+            tokens.append(run)
+        else:
+            tokens.extend(split_cjk(run))
+    return tokens
+
+
+def _term_hash(term: str) -> int:
+    return int.from_bytes(hashlib.blake2b(term.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+class _Segment:
+    """不可变的索引段，所有数组通过内存映射打开，多个 worker 共享操作系统页缓存
+
+    terms 为排好序的检索词哈希，offsets[i]:offsets[i+1] 是第 i 个检索词在
+    docs/tfs 中的倒排列表区间。
+    """
+    ARRAYS = ("terms", "offsets", "docs", "tfs", "doc_len", "ids", "files")
+
+    def __init__(self, path: str):
+        self.path = path
+        for name in self.ARRAYS:
+            setattr(self, name, np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r"))
+        self._alive_key = None
+        self._alive = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    def alive(self, deleted: Sequence[str]) -> Optional[np.ndarray]:
+        """已删除文件的文档掩码；没有删除时返回 None"""
+        if not deleted:
+            return None
+        key = tuple(sorted(deleted))
+        if key != self._alive_key:
+            self._alive = ~np.isin(np.asarray(self.files), list(key))
+            self._alive_key = key
+        return self._alive
+
+    @staticmethod
+    def write(path: str, ids: Sequence[str], files: Sequence[str], hashes: np.ndarray, docs: np.ndarray,
+              tfs: np.ndarray, doc_len: np.ndarray):
+        order = np.lexsort((docs, hashes))
+        hashes, docs, tfs = hashes[order], docs[order], tfs[order]
+        terms, starts = np.unique(hashes, return_index=True)
+        offsets = np.append(starts, len(hashes)).astype(np.int64)
+        tmp = f"{path}.tmp"
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        arrays = {
+            "terms": terms.astype(np.uint64),
+            "offsets": offsets,
+            "docs": docs.astype(np.int32),
+            "tfs": tfs.astype(np.float32),
+            "doc_len": np.asarray(doc_len, dtype=np.int32),
+            "ids": np.asarray(list(ids), dtype=str) if len(ids) else np.zeros(0, dtype="U1"),
+            "files": np.asarray(list(files), dtype=str) if len(files) else np.zeros(0, dtype="U1"),
+        }
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp, f"{name}.npy"), array)
+        os.replace(tmp, path)
+
+
+def _postings(token_lists: Sequence[List[str]]):
+    hashes, docs, tfs, doc_len = [], [], [], []
+    for doc, tokens in enumerate(token_lists):
+        doc_len.append(len(tokens))
+        for term, count in Counter(tokens).items():
+            hashes.append(_term_hash(term))
+            docs.append(doc)
+            tfs.append(count)
+    return (np.asarray(hashes, dtype=np.uint64), np.asarray(docs, dtype=np.int32),
+            np.asarray(tfs, dtype=np.float32), np.asarray(doc_len, dtype=np.int32))
+
+
+class LexicalIndex:
+    """单个知识库的 BM25 倒排索引，保存在磁盘上并以内存映射方式读取
+
+    索引由若干不可变的段和一个 manifest.json 组成。新增文件时写入一个新段，
+    删除文件时只在 manifest 中记录墓碑，段数超过 max_segments 时合并为一个段。
+    写操作持有目录下的文件锁，manifest 通过原子替换更新；读取方在每次查询前
+    检查 manifest 是否变化，因此所有 worker 看到的都是同一份一致的索引。
+    """
+
+    def __init__(self, directory: str, max_segments: int = 8, k1: float = 1.5, b: float = 0.75):
+        self.directory = directory
+        self.max_segments = max_segments
+        self.k1 = k1
+        self.b = b
+        self._manifest = None
+        self._manifest_stamp = None
+        self._segments: Dict[str, _Segment] = {}
+        self._lock = threading.Lock()
+        self._write_mutex = threading.Lock()
+
+    @property
+    def _manifest_path(self):
+        return os.path.join(self.directory, "manifest.json")
+
+    def exists(self) -> bool:
+        return os.path.exists(self._manifest_path)
+
+    @contextmanager
+    def _write_lock(self):
+        os.makedirs(self.directory, exist_ok=True)
+        with self._write_mutex, open(os.path.join(self.directory, ".lock"), "w") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_manifest(self) -> Optional[dict]:
+        try:
+            with open(self._manifest_path, encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _write_manifest(self, manifest: dict):
+        manifest["version"] = manifest.get("version", 0) + 1
+        tmp = f"{self._manifest_path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        os.replace(tmp, self._manifest_path)
+
+    def _new_manifest(self) -> dict:
+        return {"version": 0, "tokenizer": available_tokenizer(), "next_segment": 1, "segments": [],
+                "deleted": {}, "files": {}, "doc_count": 0, "total_len": 0}
+
+    def _refresh(self, retries: int = 3) -> Optional[dict]:
+        """manifest 变化时重新打开索引段（段文件不可变，已打开的段直接复用）"""
+        try:
+            stat = os.stat(self._manifest_path)
+        except FileNotFoundError:
+            self._manifest, self._manifest_stamp, self._segments = None, None, {}
+            return None
+        stamp = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+        if stamp != self._manifest_stamp:
+            manifest = self._read_manifest()
+            if manifest is None:
+                return None
+            segments = {}
+            try:
+                for name in manifest["segments"]:
+                    segment = self._segments.get(name)
+                    segments[name] = segment if segment is not None else _Segment(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                if retries <= 0:
+                    raise
+                # 读到 manifest 之后其他 worker 完成了合并并删除了旧段，重新读取新的 manifest
+                return self._refresh(retries - 1)
+            self._manifest, self._manifest_stamp, self._segments = manifest, stamp, segments
+        return self._manifest
+
+    def _tombstone(self, manifest: dict, file_id: str):
+        entry = manifest["files"].pop(file_id, None)
+        if entry is None:
+            return
+        manifest["deleted"].setdefault(entry["segment"], []).append(file_id)
+        manifest["doc_count"] -= entry["docs"]
+        manifest["total_len"] -= entry["length"]
+
+    def _add_segment(self, manifest: dict, ids: Sequence[str], files: Sequence[str], token_lists):
+        name = f"seg-{manifest['next_segment']:06d}"
+        manifest["next_segment"] += 1
+        hashes, docs, tfs, doc_len = _postings(token_lists)
+        _Segment.write(os.path.join(self.directory, name), ids, files, hashes, docs, tfs, doc_len)
+        manifest["segments"].append(name)
+        entries = {}
+        for file_id, length in zip(files, doc_len.tolist()):
+            entry = entries.setdefault(file_id, {"segment": name, "docs": 0, "length": 0})
+            entry["docs"] += 1
+            entry["length"] += length
+        manifest["files"].update(entries)
+        manifest["doc_count"] += len(files)
+        manifest["total_len"] += int(doc_len.sum())
+
+    def add(self, file_id: str, ids: Sequence[str], texts: Sequence[str]):
+        """索引一个文件的全部文档块；同一文件重复导入时替换旧的块"""
+        # 分词在加锁之前完成，避免大文件阻塞其他 worker 的写入
+        tokenizer = (self._read_manifest() or self._new_manifest())["tokenizer"]
+        token_lists = [tokenize(text, tokenizer) for text in texts]
+        with self._write_lock():
+            manifest = self._read_manifest() or self._new_manifest()
+            if manifest["tokenizer"] != tokenizer:
+                token_lists = [tokenize(text, manifest["tokenizer"]) for text in texts]
+            self._tombstone(manifest, file_id)
+            if ids:
+                self._add_segment(manifest, ids, [file_id] * len(ids), token_lists)
+            compacted = len(manifest["segments"]) > self.max_segments
+            if compacted:
+                self._compact(manifest)
+            self._write_manifest(manifest)
+            if compacted:
+                # 新 manifest 生效后才删除旧段，读取方不会看到指向已删除段的 manifest
+                self._remove_unreferenced(manifest)
+
+    def rebuild(self, load: Callable[[], Tuple[List[str], List[str], List[str]]]) -> bool:
+        """索引不存在时用 load() 返回的 (块ID, 文本, 文件ID) 全量构建，已存在则跳过"""
+        with self._write_lock():
+            if self.exists():
+                return False
+            ids, texts, files = load()
+            manifest = self._new_manifest()
+            if ids:
+                token_lists = [tokenize(text, manifest["tokenizer"]) for text in texts]
+                self._add_segment(manifest, ids, files, token_lists)
+            self._write_manifest(manifest)
+            print(f"已构建关键词索引 {self.directory}，共 {len(ids)} 个块")
+            return True
+
+    def delete_file(self, file_id: str):
+        with self._write_lock():
+            manifest = self._read_manifest()
+            if manifest is None or file_id not in manifest["files"]:
+                return
+            self._tombstone(manifest, file_id)
+            self._write_manifest(manifest)
+
+    def drop(self):
+        """删除整个索引目录"""
+        with self._write_mutex, self._lock:
+            shutil.rmtree(self.directory, ignore_errors=True)
+            self._manifest, self._manifest_stamp, self._segments = None, None, {}
+
+    def _compact(self, manifest: dict):
+        """把所有段合并为一个段并丢弃已删除的文档，无需重新分词"""
+        ids, files, doc_len = [], [], []
+        hashes, docs, tfs = [], [], []
+        for name in manifest["segments"]:
+            segment = _Segment(os.path.join(self.directory, name))
+            alive = segment.alive(manifest["deleted"].get(name, []))
+            if alive is None:
+                alive = np.ones(len(segment), dtype=bool)
+            remap = np.full(len(segment), -1, dtype=np.int64)
+            remap[alive] = np.arange(int(alive.sum())) + len(ids)
+            ids.extend(np.asarray(segment.ids)[alive].tolist())
+            files.extend(np.asarray(segment.files)[alive].tolist())
+            doc_len.append(np.asarray(segment.doc_len)[alive])
+            term_of_posting = np.repeat(np.asarray(segment.terms), np.diff(np.asarray(segment.offsets)))
+            keep = alive[np.asarray(segment.docs)]
+            hashes.append(term_of_posting[keep])
+            docs.append(remap[np.asarray(segment.docs)[keep]])
+            tfs.append(np.asarray(segment.tfs)[keep])
+        name = f"seg-{manifest['next_segment']:06d}"
+        manifest["next_segment"] += 1
+        _Segment.write(os.path.join(self.directory, name), ids, files,
+                       np.concatenate(hashes) if hashes else np.zeros(0, np.uint64),
+                       np.concatenate(docs) if docs else np.zeros(0, np.int32),
+                       np.concatenate(tfs) if tfs else np.zeros(0, np.float32),
+                       np.concatenate(doc_len) if doc_len else np.zeros(0, np.int32))
+        manifest["segments"] = [name]
+        manifest["deleted"] = {}
+        for entry in manifest["files"].values():
+            entry["segment"] = name
+
+    def _remove_unreferenced(self, manifest: dict):
+        """删除 manifest 不再引用的段目录（需持有写锁）
+
+        包括本次合并掉的旧段，以及之前在写入段或删除旧段时崩溃留下的目录。
+        正在读取旧段的 worker 仍持有内存映射，删除目录不影响它们。
+        """
+        referenced = set(manifest["segments"])
+        for name in os.listdir(self.directory):
+            if name.startswith("seg-") and name not in referenced:
+                shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+
+    def search(self, query: str, limit: int = 10) -> Tuple[List[Tuple[str, float]], float]:
+        """BM25 检索
+
+        Returns:
+            ([(块ID, 分数), ...], 覆盖率)。覆盖率是得分最高的块包含的查询词按 IDF 加权的比例，
+            1.0 表示查询中的每个词都出现在该块中。
+        """
+        with self._lock:
+            manifest = self._refresh()
+            segments = dict(self._segments)
+        if not manifest or manifest["doc_count"] <= 0:
+            return [], 0.0
+        tokenizer = manifest["tokenizer"]
+        if tokenizer == "jieba" and jieba is None:
+            print("关键词索引使用 jieba 分词构建，但当前环境未安装 jieba")
+            return [], 0.0
+
+        terms = list(dict.fromkeys(tokenize(query, tokenizer)))
+        if not terms:
+            return [], 0.0
+        query_hashes = np.asarray([_term_hash(term) for term in terms], dtype=np.uint64)
+
+        # 先汇总各段的文档频率，得到全局 IDF
+        located = []
+        df = np.zeros(len(terms), dtype=np.float64)
+        for name, segment in segments.items():
+            positions = np.searchsorted(segment.terms, query_hashes)
+            found = positions < len(segment.terms)
+            found[found] = segment.terms[positions[found]] == query_hashes[found]
+            starts = np.where(found, segment.offsets[np.minimum(positions, len(segment.terms) - 1)], 0)
+            ends = np.where(found, segment.offsets[np.minimum(positions, len(segment.terms) - 1) + 1], 0)
+            df += ends - starts
+            located.append((name, segment, starts, ends))
+
+        n = manifest["doc_count"]
+        avgdl = manifest["total_len"] / n if n else 1.0
+        # 文档频率包含尚未合并掉的已删除文档，可能略大于 n，这里截断到 0
+        idf = np.log1p(np.maximum((n - df + 0.5) / (df + 0.5), 0.0))
+        total_idf = float(idf.sum()) or 1.0
+
+        best: List[Tuple[float, str, float]] = []
+        for name, segment, starts, ends in located:
+            if len(segment) == 0:
+                continue
+            scores = np.zeros(len(segment), dtype=np.float32)
+            matched = np.zeros(len(segment), dtype=np.float32)
+            doc_len = segment.doc_len
+            for i in range(len(terms)):
+                if ends[i] <= starts[i]:
+                    continue
+                docs = segment.docs[starts[i]:ends[i]]
+                tf = segment.tfs[starts[i]:ends[i]]
+                norm = self.k1 * (1 - self.b + self.b * doc_len[docs] / avgdl)
+                scores[docs] += idf[i] * tf * (self.k1 + 1) / (tf + norm)
+                matched[docs] += idf[i]
+            alive = segment.alive(manifest["deleted"].get(name, []))
+            if alive is not None:
+                scores[~alive] = 0
+            hits = np.flatnonzero(scores > 0)
+            if len(hits) > limit:
+                hits = hits[np.argpartition(-scores[hits], limit - 1)[:limit]]
+            best.extend((float(scores[doc]), str(segment.ids[doc]), float(matched[doc]) / total_idf)
+                        for doc in hits)
+
+        best.sort(key=lambda item: item[0], reverse=True)
+        best = best[:limit]
+        coverage = min(1.0, best[0][2]) if best else 0.0
+        return [(chunk_id, score) for score, chunk_id, _ in best], coverage
+
+
+class LexicalIndexRegistry:
+    """按知识库缓存已打开的关键词索引（LRU）"""
+
+    def __init__(self, directory: str, max_size: int = 64, max_segments: int = 8):
+        self.directory = directory
+        self.max_size = max_size
+        self.max_segments = max_segments
+        self._indexes: "OrderedDict[int, LexicalIndex]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, repository_id: int) -> LexicalIndex:
+        with self._lock:
+            index = self._indexes.get(repository_id)
+            if index is None:
+                index = LexicalIndex(os.path.join(self.directory, str(repository_id)),
+                                     max_segments=self.max_segments)
+                self._indexes[repository_id] = index
+            self._indexes.move_to_end(repository_id)
+            while len(self._indexes) > self.max_size:
+                self._indexes.popitem(last=False)
+            return index
+
+    def drop(self, repository_id: int):
+        """知识库被删除时删除其索引目录"""
+        self.get(repository_id).drop()
+        with self._lock:
+            self._indexes.pop(repository_id, None)
+
+
+_registry: Optional[LexicalIndexRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_lexical_indexes(config=None) -> LexicalIndexRegistry:
+    """获取当前 worker 进程的关键词索引登记表（首次调用时按配置创建）"""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                config = config or {}
+                _registry = LexicalIndexRegistry(
+                    config.get('LEXICAL_INDEX_DIRECTORY') or os.path.join(
+                        config.get('CHROMA_PERSIST_DIRECTORY', 'chroma_db'), 'lexical'),
+                    max_size=int(config.get('LEXICAL_INDEX_CACHE_SIZE', 64)),
+                    max_segments=int(config.get('LEXICAL_INDEX_MAX_SEGMENTS', 8)),
+                )
+    return _registry
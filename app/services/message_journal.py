@@ -0,0 +1,376 @@
+import atexit
+import json
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from sqlalchemy import insert
+
+from app import db
+from app.models import Message
+
+try:
+    import fcntl
+except ImportError:  # Windows 开发环境没有 fcntl，只在单进程内运行
+    fcntl = None
+
+SEGMENT_SUFFIX = ".jsonl"
+CREATING_SUFFIX = ".creating"
+
+
+def _insert_ignore(rows: List[dict]):
+    """多行 INSERT，journal_key 已存在的行跳过（重放日志时去重）
+
+    MySQL 的 IGNORE 同时会跳过外键不存在的行：回答写入前会话已被删除时直接丢弃。
+    """
+    return (insert(Message.__table__).values(rows)
+            .prefix_with("IGNORE", dialect="mysql")
+            .prefix_with("OR IGNORE", dialect="sqlite"))
+
+
+def _read_segment(path: str) -> List[dict]:
+    """读取日志段中的全部条目，跳过写到一半的末行"""
+    entries = []
+    try:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    continue
+    except FileNotFoundError:
+        pass
+    return entries
+
+
+class MessageJournal:
+    """回答消息的后写日志（每个 worker 进程一份）
+
+    append 先把消息追加到本地日志段文件，再放入内存队列，由后台线程每隔 flush_interval 秒
+    （或攒够 batch_size 条时）用多行 INSERT 批量写入 message 表，提交成功后删除对应的日志段。
+    内存队列最多保留 max_pending 条，超出时只写日志文件，写库时从文件读回。
+
+    投递语义为至少一次：进程崩溃后日志段仍在磁盘上，其他 worker 启动或定期检查时
+    用 flock 判断段文件的所属进程已退出，重放后删除；每条消息带唯一的 journal_key，
+    重复写入会被忽略。fsync 为 False 时只防进程崩溃，防断电需要开启。
+
+    读己之写：读取某个会话之前调用 sync_chat，把本进程未写入的该会话消息立即写库，
+    并把其他 worker 日志段中属于该会话的条目一并写入（按 journal_key 去重，可重复执行）。
+    """
+
+    def __init__(self, app, directory: str, batch_size: int = 100, flush_interval: float = 0.2,
+                 max_pending: int = 5000, fsync: bool = False, recover_interval: float = 30):
+        self.app = app
+        self.directory = directory
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.max_pending = max(1, max_pending)
+        self.fsync = fsync
+        self.recover_interval = recover_interval
+        # 段文件名前缀，进程内唯一，用于区分本进程和其他进程的日志段
+        self._prefix = f"{os.getpid()}-{uuid.uuid4().hex[:8]}-"
+        self._seq = 0
+        self._lock = threading.Lock()  # 保护当前段、内存队列和计数
+        self._flush_lock = threading.Lock()  # 同一时间只有一个线程写库
+        self._wakeup = threading.Event()
+        self._segment = None  # (路径, 文件对象)
+        self._sealed = []  # 已封存、尚未写库成功的段 (路径, 文件对象)，删除前一直持有锁
+        self._index = {}  # 其他进程的段路径 -> (已读取的字节数, 会话 ID -> 尚未写入的条目)
+        self._index_lock = threading.Lock()
+        self._pending: List[dict] = []
+        self._spilled = False  # 当前段有条目没有放进内存队列
+        self._retry = False  # 上次写库失败，下次从段文件读回全部条目
+        self._unflushed = Counter()  # 会话 ID -> 本进程尚未写库的消息数
+        self._failures = 0
+        self._thread = None
+        self._stopped = False
+        self.appended = 0
+        self.flushed = 0
+        self.batches = 0
+        self.replayed = 0
+        self.errors = 0
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _open_segment(self):
+        if self._segment is None:
+            self._seq += 1
+            path = os.path.join(self.directory, f"{self._prefix}{self._seq:08d}{SEGMENT_SUFFIX}")
+            if fcntl is None:
+                f = open(path, "a", encoding="utf-8")
+            else:
+                # 进程存活期间一直持有段文件的锁，其他进程据此判断是否需要接管。
+                # 先用临时文件名创建并加锁再改名，其他进程的 recover 看到的段文件总是已被锁住
+                creating = path + CREATING_SUFFIX
+                f = open(creating, "a", encoding="utf-8")
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                os.rename(creating, path)
+            self._segment = (path, f)
+        return self._segment[1]
+
+    def append(self, chat_id: int, role: str, content: str) -> str:
+        """追加一条消息，返回其 journal_key；写入日志文件后即返回，不访问数据库"""
+        entry = {
+            "key": uuid.uuid4().hex,
+            "chat_id": chat_id,
+            "role": role,
+            "content": content,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+        }
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        with self._lock:
+            f = self._open_segment()
+            f.write(line)
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+            if len(self._pending) < self.max_pending:
+                self._pending.append(entry)
+            else:
+                self._spilled = True
+            self._unflushed[chat_id] += 1
+            self.appended += 1
+            pending = self.appended - self.flushed
+        if pending >= self.batch_size:
+            self._wakeup.set()
+        return entry["key"]
+
+    def _write(self, entries: List[dict]) -> None:
+        """在当前应用上下文的会话中批量写入并提交"""
+        rows = [{
+            "chat_id": entry["chat_id"],
+            "role": entry["role"],
+            "content": entry["content"],
+            "created_at": datetime.fromisoformat(entry["created_at"]),
+            "journal_key": entry["key"],
+        } for entry in entries]
+        try:
+            for start in range(0, len(rows), self.batch_size):
+                db.session.execute(_insert_ignore(rows[start:start + self.batch_size]))
+                self.batches += 1
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+    def flush(self) -> int:
+        """把本进程的日志写入数据库，返回写入的条数；需要在应用上下文中调用（会提交当前会话）"""
+        with self._flush_lock:
+            with self._lock:
+                if self._segment is not None:
+                    self._sealed.append(self._segment)
+                    self._segment = None
+                memory, self._pending = self._pending, []
+                from_files = self._spilled or self._retry
+                self._spilled = False
+                sealed = list(self._sealed)
+            if not sealed:
+                return 0
+            entries = memory
+            if from_files:
+                entries = [entry for path, _ in sealed for entry in _read_segment(path)]
+            try:
+                self._write(entries)
+            except Exception as e:
+                with self._lock:
+                    self._retry = True
+                    self.errors += 1
+                    self._failures += 1
+                print(f"消息日志写入数据库失败，稍后重试: {str(e)}")
+                return 0
+            # 已经提交，删除段文件失败也不能影响计数，否则这些段会一直留在 _sealed 中
+            for path, f in sealed:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    # 关闭后锁被释放，由 recover 重放（按 journal_key 去重）并删除
+                    print(f"删除消息日志 {os.path.basename(path)} 失败: {str(e)}")
+                finally:
+                    f.close()
+            with self._lock:
+                self._sealed = self._sealed[len(sealed):]
+                self._retry = False
+                self._failures = 0
+                self.flushed += len(entries)
+                self._unflushed.subtract(entry["chat_id"] for entry in entries)
+                self._unflushed += Counter()  # 去掉计数为 0 的会话
+            return len(entries)
+
+    def _foreign_segments(self, suffix: str = SEGMENT_SUFFIX) -> List[str]:
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return [os.path.join(self.directory, name) for name in sorted(names)
+                if name.endswith(suffix) and not name.startswith(self._prefix)]
+
+    def sync_chat(self, chat_id: int) -> None:
+        """读取会话消息之前调用，保证已经返回给客户端的回答能从数据库读到
+
+        本进程有该会话未写库的消息时立即写库；其他 worker 日志段中该会话的条目
+        也在当前会话中写入（之后原进程再写入时按 journal_key 忽略）。
+        """
+        with self._lock:
+            own = self._unflushed.get(chat_id, 0) > 0
+        if own:
+            self.flush()
+        foreign = self._foreign_entries(chat_id)
+        if foreign:
+            try:
+                self._write(foreign)
+            except Exception as e:
+                print(f"写入其他进程的消息日志失败: {str(e)}")
+                return
+            with self._index_lock:
+                written = {entry["key"] for entry in foreign}
+                for _, by_chat in self._index.values():
+                    if chat_id in by_chat:
+                        by_chat[chat_id] = [entry for entry in by_chat[chat_id] if entry["key"] not in written]
+
+    def _foreign_entries(self, chat_id: int) -> List[dict]:
+        """其他进程日志段中属于该会话、本进程还没有写入过的条目
+
+        每个段只读取上次之后新追加的完整行，并按会话 ID 建立索引，
+        不必在每次请求时重新解析所有段文件；段文件被删除后丢弃对应的索引。
+        """
+        paths = self._foreign_segments()
+        with self._index_lock:
+            for path in set(self._index) - set(paths):
+                del self._index[path]
+            entries = []
+            for path in paths:
+                offset, by_chat = self._index.get(path, (0, {}))
+                try:
+                    with open(path, "rb") as f:
+                        f.seek(offset)
+                        data = f.read()
+                except FileNotFoundError:
+                    self._index.pop(path, None)
+                    continue
+                end = data.rfind(b"\n") + 1  # 末行可能还没写完，留到下次再读
+                for line in data[:end].splitlines():
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    by_chat.setdefault(entry.get("chat_id"), []).append(entry)
+                self._index[path] = (offset + end, by_chat)
+                entries.extend(by_chat.get(chat_id, ()))
+            return entries
+
+    def recover(self) -> int:
+        """重放已退出进程遗留的日志段，返回重放的条数；需要在应用上下文中调用"""
+        recovered = 0
+        # 创建段文件时在改名前崩溃会留下空的临时文件，同样加锁后删除
+        for path in self._foreign_segments() + self._foreign_segments(CREATING_SUFFIX):
+            try:
+                f = open(path, "r+", encoding="utf-8")
+            except FileNotFoundError:
+                continue
+            with f:
+                if fcntl is not None:
+                    try:
+                        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except OSError:
+                        continue  # 所属进程仍在运行
+                    try:
+                        # 打开之后、加锁之前，所属进程可能已经写库并删除了该段
+                        if os.stat(path).st_ino != os.fstat(f.fileno()).st_ino:
+                            continue
+                    except FileNotFoundError:
+                        continue
+                entries = _read_segment(path)
+                try:
+                    if entries:
+                        self._write(entries)
+                except Exception as e:
+                    print(f"重放消息日志 {os.path.basename(path)} 失败: {str(e)}")
+                    continue
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    continue
+                recovered += len(entries)
+        if recovered:
+            with self._lock:
+                self.replayed += recovered
+            print(f"已重放遗留的消息日志 {recovered} 条")
+        return recovered
+
+    def _run(self):
+        recovered_at = 0.0
+        while not self._stopped:
+            delay = min(self.flush_interval * (2 ** self._failures), 10)
+            self._wakeup.wait(delay)
+            self._wakeup.clear()
+            try:
+                with self.app.app_context():
+                    self.flush()
+                    if time.monotonic() - recovered_at >= self.recover_interval:
+                        recovered_at = time.monotonic()
+                        self.recover()
+            except Exception as e:
+                print(f"消息日志后台线程出错: {str(e)}")
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="message-journal", daemon=True)
+            self._thread.start()
+
+    def close(self):
+        """进程退出前把剩余的日志写库"""
+        self._stopped = True
+        self._wakeup.set()
+        try:
+            with self.app.app_context():
+                self.flush()
+        except Exception as e:
+            print(f"退出前写入消息日志失败: {str(e)}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "pending": self.appended - self.flushed,
+                "sealed_segments": len(self._sealed),
+                "appended": self.appended,
+                "flushed": self.flushed,
+                "batches": self.batches,
+                "replayed": self.replayed,
+                "errors": self.errors,
+            }
+
+
+_journal: Optional[MessageJournal] = None
+_journal_lock = threading.Lock()
+
+
+def init_message_journal(app) -> Optional[MessageJournal]:
+    """创建并启动当前 worker 进程的消息日志"""
+    global _journal
+    if multiprocessing.parent_process() is not None:
+        return None
+    with _journal_lock:
+        if _journal is None:
+            config = app.config
+            _journal = MessageJournal(
+                app,
+                directory=config.get('MESSAGE_JOURNAL_DIRECTORY', 'message_journal'),
+                batch_size=int(config.get('MESSAGE_JOURNAL_BATCH_SIZE', 100)),
+                flush_interval=float(config.get('MESSAGE_JOURNAL_FLUSH_MS', 200)) / 1000,
+                max_pending=int(config.get('MESSAGE_JOURNAL_MAX_PENDING', 5000)),
+                fsync=bool(config.get('MESSAGE_JOURNAL_FSYNC', False)),
+            )
+            _journal.start()
+            atexit.register(_journal.close)
+    return _journal
+
+
+def get_message_journal() -> Optional[MessageJournal]:
+    """当前进程的消息日志，未开启时返回 None（回答直接写库）"""
+    return _journal
@@ -0,0 +1,477 @@
+import atexit
+import json
+import math
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows 开发环境没有 fcntl，只在单进程内运行
+    fcntl = None
+
+# 已退出 worker 的计数累计到这个快照中，目录中的文件数不随 worker 重启增长
+RETIRED_SNAPSHOT = "retired.json"
+
+# 默认的耗时分桶（秒），覆盖数据库查询的毫秒级到完整回答的数十秒
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# (指标名, 类型, 说明, [(标签字典, 值), ...])
+Family = Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def state(self) -> dict:
+        with self._lock:
+            return {"\x1f".join(key): value if not isinstance(value, list) else list(value)
+                    for key, value in self._values.items()}
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Histogram(_Metric):
+    """按标签累计各分桶的计数、总和与次数，值为 [桶1, ..., 桶n, +Inf, sum, count]"""
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            values = self._values.get(key)
+            if values is None:
+                values = self._values[key] = [0] * (len(self.buckets) + 3)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    values[i] += 1
+            values[len(self.buckets)] += 1
+            values[-2] += value
+            values[-1] += 1
+
+
+class Registry:
+    """当前进程的指标
+
+    计数器和直方图在进程内累加；仪表值（连接池占用、队列长度等）由采集函数在导出快照时读取。
+    gunicorn 多 worker 时每个进程定期（以及退出时）把快照写到共享目录，/metrics 合并全部快照：
+    计数器和直方图按标签求和，仪表值只合并存活的 worker。采集函数产出的 counter 类型指标
+    （例如连接池取连接次数）和计数器一样处理。已退出 worker 的最后一份快照被合并进 retired.json
+    后删除，保证计数器单调递增。只有 /metrics 所在进程计算一次的全局仪表值（例如导入任务队列长度）
+    由 global 采集函数提供。
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], Iterable[Family]]] = []
+        self._global_collectors: List[Callable[[], Iterable[Family]]] = []
+        self._lock = threading.Lock()
+        self.directory: Optional[str] = None
+        self._thread = None
+
+    def _register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def add_collector(self, collector: Callable[[], Iterable[Family]], scope: str = "process"):
+        """注册仪表值采集函数；scope 为 global 时只在响应 /metrics 的进程中调用一次"""
+        with self._lock:
+            (self._global_collectors if scope == "global" else self._collectors).append(collector)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors)
+        gauges = []
+        for collector in collectors:
+            try:
+                gauges.extend(collector())
+            except Exception as e:
+                print(f"采集指标时出错: {str(e)}")
+        return {
+            "pid": os.getpid(),
+            "metrics": {metric.name: {"kind": metric.kind, "help": metric.documentation,
+                                      "labels": metric.labelnames,
+                                      "buckets": getattr(metric, "buckets", None),
+                                      "values": metric.state()} for metric in metrics},
+            "gauges": [[name, kind, documentation, samples] for name, kind, documentation, samples in gauges],
+        }
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _write_snapshot(self):
+        _write_json(self._path(f"{os.getpid()}.json"), self.snapshot())
+
+    @contextmanager
+    def _locked(self, exclusive: bool, blocking: bool = True):
+        """快照目录的读写锁：合并已退出 worker 的快照时独占，读取全部快照时共享；返回是否拿到锁"""
+        if fcntl is None:
+            yield True
+            return
+        with open(self._path("retired.lock"), "a") as f:
+            try:
+                fcntl.flock(f, (fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH) | (0 if blocking else fcntl.LOCK_NB))
+            except OSError:
+                yield False
+                return
+            yield True
+
+    def _read_snapshots(self) -> List[Tuple[dict, bool]]:
+        """各 worker 的快照及其进程是否存活；未开启多进程合并时只有本进程"""
+        if not self.directory:
+            return [(self.snapshot(), True)]
+        self._write_snapshot()
+        snapshots, exited = [], []
+        with self._locked(exclusive=False):
+            retired = _load_json(self._path(RETIRED_SNAPSHOT))
+            folded = set()
+            if retired is not None:
+                snapshots.append((retired, False))
+                folded = set(retired.get("folded", ()))
+            for name in os.listdir(self.directory):
+                if not name.endswith(".json") or name == RETIRED_SNAPSHOT:
+                    continue
+                if name in folded:
+                    exited.append(name)  # 已经累加过，只需删除
+                    continue
+                snapshot = _load_json(self._path(name))
+                if snapshot is None:
+                    continue
+                alive = _alive(snapshot.get("pid"))
+                snapshots.append((snapshot, alive))
+                if not alive:
+                    exited.append(name)
+        if exited:
+            self._retire(exited)
+        return snapshots
+
+    def _retire(self, names: List[str]):
+        """把已退出 worker 的快照累加进 retired.json 并删除
+
+        folded 记录已经累加过的文件名，删除前进程崩溃时读取方据此跳过，不会重复计数。
+        其他 worker 正在合并时直接返回，下次读取时再合并。
+        """
+        with self._locked(exclusive=True, blocking=False) as locked:
+            if not locked:
+                return
+            retired = _load_json(self._path(RETIRED_SNAPSHOT)) or {"metrics": {}, "gauges": []}
+            folded = [name for name in retired.get("folded", ()) if os.path.exists(self._path(name))]
+            families: Dict[str, dict] = {}
+            _merge(families, retired, alive=False)
+            for name in names:
+                snapshot = _load_json(self._path(name))
+                if name in folded or snapshot is None or _alive(snapshot.get("pid")):
+                    continue
+                _merge(families, snapshot, alive=False)
+                folded.append(name)
+            _write_json(self._path(RETIRED_SNAPSHOT), dict(_dump(families), pid=None, folded=folded))
+            for name in folded:
+                try:
+                    os.remove(self._path(name))
+                except FileNotFoundError:
+                    pass
+
+    def _flush(self):
+        try:
+            self._write_snapshot()
+        except Exception as e:
+            print(f"写入指标快照时出错: {str(e)}")
+
+    def _run(self, interval: float):
+        while True:
+            time.sleep(interval)
+            self._flush()
+
+    def start(self, directory: str, interval: float):
+        """开启多 worker 合并：每 interval 秒以及进程退出时把本进程的快照写到 directory"""
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        path = self._path(f"{os.getpid()}.json")
+        if os.path.exists(path):
+            # PID 被复用：同名快照属于已退出的 worker，改名并标记为已退出，不被本进程覆盖
+            with self._locked(exclusive=True):
+                snapshot = _load_json(path)
+                if snapshot is not None:
+                    _write_json(self._path(f"exited-{uuid.uuid4().hex}.json"), dict(snapshot, pid=None))
+                    os.remove(path)
+        if self._thread is None:
+            atexit.register(self._flush)
+            self._thread = threading.Thread(target=self._run, args=(interval,), name="metrics-snapshot",
+                                            daemon=True)
+            self._thread.start()
+
+    def render(self) -> str:
+        """合并所有 worker 的快照，按 Prometheus 文本格式输出"""
+        families: Dict[str, dict] = {}
+        for snapshot, alive in self._read_snapshots():
+            _merge(families, snapshot, alive)
+        with self._lock:
+            global_collectors = list(self._global_collectors)
+        for collector in global_collectors:
+            try:
+                for name, kind, documentation, samples in collector():
+                    family = families.setdefault(name, {"kind": kind, "help": documentation, "samples": {}})
+                    for labels, value in samples:
+                        family["samples"][tuple(sorted(labels.items()))] = value
+            except Exception as e:
+                print(f"采集指标时出错: {str(e)}")
+
+        lines = []
+        for name in sorted(families):
+            family = families[name]
+            lines.append(f"# HELP {name} {family['help']}")
+            lines.append(f"# TYPE {name} {family['kind']}")
+            if "samples" in family:
+                for key, value in sorted(family["samples"].items()):
+                    lines.append(f"{name}{_labels(dict(key))} {_number(value)}")
+                continue
+            labelnames = family["labels"]
+            for key, value in sorted(family["values"].items()):
+                labels = dict(zip(labelnames, key.split("\x1f"))) if labelnames else {}
+                if family["kind"] != "histogram":
+                    lines.append(f"{name}{_labels(labels)} {_number(value)}")
+                    continue
+                buckets = family["buckets"]
+                for bound, count in zip(list(buckets) + [math.inf], value):
+                    lines.append(f"{name}_bucket{_labels(dict(labels, le=_number(bound)))} {_number(count)}")
+                lines.append(f"{name}_sum{_labels(labels)} {_number(value[-2])}")
+                lines.append(f"{name}_count{_labels(labels)} {_number(value[-1])}")
+        return "\n".join(lines) + "\n"
+
+
+def _merge(families: Dict[str, dict], snapshot: dict, alive: bool):
+    """把一个快照按标签累加到 families；已退出的 worker 只累加计数器和直方图，不计仪表值"""
+    for name, metric in snapshot["metrics"].items():
+        family = families.setdefault(name, dict(metric, values={}))
+        for key, value in metric["values"].items():
+            if isinstance(value, list):
+                current = family["values"].get(key)
+                family["values"][key] = value if current is None else [a + b for a, b in zip(current, value)]
+            else:
+                family["values"][key] = family["values"].get(key, 0) + value
+    for name, kind, documentation, samples in snapshot["gauges"]:
+        if not alive and kind != "counter":
+            continue
+        family = families.setdefault(name, {"kind": kind, "help": documentation, "samples": {}})
+        for labels, value in samples:
+            key = tuple(sorted(labels.items()))
+            family["samples"][key] = family["samples"].get(key, 0) + value
+
+
+def _dump(families: Dict[str, dict]) -> dict:
+    """_merge 的结果转换回快照格式"""
+    return {
+        "metrics": {name: family for name, family in families.items() if "samples" not in family},
+        "gauges": [[name, family["kind"], family["help"], [[dict(key), value] for key, value in family["samples"].items()]]
+                   for name, family in families.items() if "samples" in family],
+    }
+
+
+def _load_json(path: str) -> Optional[dict]:
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_json(path: str, data: dict):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+def _alive(pid) -> bool:
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except (OSError, TypeError, ValueError):
+        return False
+    return True
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+def _number(value) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+REGISTRY = Registry()
+
+HTTP_REQUESTS = REGISTRY.counter(
+    "http_requests_total", "HTTP 请求数", ("method", "endpoint", "status"))
+HTTP_LATENCY = REGISTRY.histogram(
+    "http_request_duration_seconds", "HTTP 请求耗时（流式接口只计到响应头返回）", ("method", "endpoint"))
+CHAT_STAGE_LATENCY = REGISTRY.histogram(
+    "chat_stage_duration_seconds", "一轮聊天各阶段的耗时", ("stage",),
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120))
+CHAT_TURNS = REGISTRY.counter(
+    "chat_turns_total", "聊天回答数", ("model", "outcome"))
+CHAT_TOKENS = REGISTRY.counter(
+    "chat_tokens_total", "估算的 token 数（prompt 为发给模型的上下文，completion 为回答）", ("model", "kind"))
+RETRIEVALS = REGISTRY.counter(
+    "retrieval_total", "知识库检索次数，按检索方式（lexical/hybrid/vector）", ("path",))
+
+# 一轮聊天的阶段：依次为鉴权、数据库读取、模型与向量库句柄准备、查询向量化、关键词检索、
+# 向量检索、重排、首 token、生成、写库
+CHAT_STAGES = ("auth", "db_read", "model_setup", "query_embedding", "lexical_search", "vector_search",
+               "rerank", "ttft", "generation", "persistence")
+
+
+def observe_request(response):
+    """记录一次 HTTP 请求，endpoint 取路由规则（例如 /chat/chats/<int:chat_id>/messages），避免标签数量随 ID 增长"""
+    from flask import g, request
+    started = g.get('request_started')
+    if started is None:
+        return
+    endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    HTTP_REQUESTS.inc(method=request.method, endpoint=endpoint, status=response.status_code)
+    HTTP_LATENCY.observe(time.perf_counter() - started, method=request.method, endpoint=endpoint)
+
+
+def add_timing(timings: Optional[dict], stage: str, seconds: float):
+    """累加一轮聊天某个阶段的耗时，timings 为 None 时忽略"""
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+def observe_chat_turn(model: str, timings: dict, completed: bool, prompt_tokens: int, completion_tokens: int):
+    """一轮聊天结束后记录各阶段耗时、回答数和 token 数"""
+    for stage in CHAT_STAGES:
+        if stage in timings:
+            CHAT_STAGE_LATENCY.observe(timings[stage], stage=stage)
+    CHAT_TURNS.inc(model=model, outcome="completed" if completed else "failed")
+    if prompt_tokens:
+        CHAT_TOKENS.inc(prompt_tokens, model=model, kind="prompt")
+    if completion_tokens:
+        CHAT_TOKENS.inc(completion_tokens, model=model, kind="completion")
+
+
+def family(name: str, documentation: str, value=None, samples=None, kind: str = "gauge") -> Family:
+    """采集函数用来构造一个指标；samples 为 [(标签字典, 值), ...]，不带标签时直接传 value
+
+    kind 为 counter 时值必须是进程内单调递增的累计值，worker 退出后仍计入合并结果。
+    """
+    return name, kind, documentation, samples if samples is not None else [({}, value)]
+
+
+def _process_families(config) -> List[Family]:
+    """当前 worker 进程内各组件的状态：数据库连接池、向量库句柄、向量缓存、模型客户端池、消息日志"""
+    from app.services import chat_service
+    from app.services.db_pool import get_pool_metrics
+    from app.services.message_journal import get_message_journal
+    from app.services.model_pool import get_model_pool
+    from app.services.vector_store_cache import get_vector_store_cache
+
+    pool = get_pool_metrics().stats()
+    vector_stores = get_vector_store_cache(config).stats()
+    families = [
+        family("db_pool_size", "连接池大小（不含溢出连接）", pool.get("size", 0)),
+        family("db_pool_checked_out", "当前被占用的连接数", pool.get("checked_out", 0)),
+        family("db_pool_overflow", "当前的溢出连接数", pool.get("overflow", 0)),
+        family("db_pool_checkouts_total", "取连接次数", pool["checkouts"], kind="counter"),
+        family("db_pool_timeouts_total", "等待空闲连接超时的次数", pool["timeouts"], kind="counter"),
+        family("db_pool_wait_seconds_total", "等待取得连接的总秒数", pool["wait_seconds_total"], kind="counter"),
+        family("vector_store_open_collections", "已打开的 Chroma 集合句柄数", vector_stores["size"]),
+        family("vector_store_cache_lookups_total", "Chroma 集合句柄缓存的查找次数", kind="counter",
+               samples=[({"result": "hit"}, vector_stores["hits"]), ({"result": "miss"}, vector_stores["misses"])]),
+        family("model_client_pool_size", "已创建的模型客户端数", get_model_pool(config).stats()["size"]),
+    ]
+    if chat_service.embeddings is not None:
+        cache = chat_service.embeddings.stats()
+        families.append(family("query_embedding_cache_lookups_total", "查询向量缓存的查找次数", kind="counter",
+                               samples=[({"result": "memory_hit"}, cache["memory_hits"]),
+                                        ({"result": "disk_hit"}, cache["disk_hits"]),
+                                        ({"result": "miss"}, cache["misses"])]))
+        families.append(family("chunk_embedding_cache_lookups_total", "文档块向量缓存的查找次数", kind="counter",
+                               samples=[({"result": "hit"}, cache["chunk_hits"]),
+                                        ({"result": "miss"}, cache["chunk_misses"])]))
+    journal = get_message_journal()
+    if journal is not None:
+        stats = journal.stats()
+        families.append(family("message_journal_pending", "消息日志中尚未写库的回答数", stats["pending"]))
+        families.append(family("message_journal_errors_total", "消息日志写库失败次数", stats["errors"], kind="counter"))
+    return families
+
+
+def _global_families(config) -> List[Family]:
+    """全局状态，只在响应 /metrics 时查询一次：导入任务队列、知识库块数和 Chroma 集合数"""
+    from app import db
+    from app.models import IngestionJob, RepositoryFile
+    from app.services.vector_store_cache import get_vector_store_cache
+
+    jobs = dict(db.session.query(IngestionJob.status, db.func.count(IngestionJob.id))
+                .group_by(IngestionJob.status).all())
+    jobs.setdefault("queued", 0)
+    chunks = db.session.query(db.func.coalesce(db.func.sum(RepositoryFile.chunk_count), 0)) \
+        .filter(RepositoryFile.status == "ready").scalar()
+    db.session.commit()
+    return [
+        family("ingestion_jobs", "知识库导入任务数，按状态；queued 即排队中的任务数",
+               samples=[({"status": status}, count) for status, count in jobs.items()]),
+        family("repository_chunks", "已导入知识库的文档块数", int(chunks or 0)),
+        family("vector_store_collections", "Chroma 中的集合数", get_vector_store_cache(config).client.count_collections()),
+    ]
+
+
+_initialized = False
+
+
+def init_metrics(app) -> Registry:
+    """注册各组件的采集函数；配置了 METRICS_DIRECTORY（gunicorn 启动时自动设置）时合并各 worker 的指标"""
+    global _initialized
+    config = app.config
+    if _initialized:
+        return REGISTRY
+    _initialized = True
+    REGISTRY.add_collector(lambda: _process_families(config))
+    REGISTRY.add_collector(lambda: _global_families(config), scope="global")
+    if config.get('METRICS_DIRECTORY'):
+        REGISTRY.start(config['METRICS_DIRECTORY'], float(config.get('METRICS_FLUSH_SECONDS', 5)))
+    return REGISTRY
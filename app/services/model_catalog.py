@@ -0,0 +1,112 @@
+import hashlib
+import json
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from app import db
+from app.models import CacheVersion, Model
+from app.services.model_pool import get_model_pool
+
+# cache_version 表中模型目录对应的行
+CATALOG_NAME = 'model'
+
+
+class ModelEntry(NamedTuple):
+    id: int
+    name: str
+    description: Optional[str]
+    is_active: bool
+
+
+def bump_catalog_version():
+    """在写模型表的同一事务中递增目录版本，提交后各 worker 会重新加载目录"""
+    updated = CacheVersion.query.filter_by(name=CATALOG_NAME).update(
+        {'version': CacheVersion.version + 1}, synchronize_session=False)
+    if not updated:
+        db.session.add(CacheVersion(name=CATALOG_NAME, version=1))
+
+
+class ModelCatalog:
+    """进程内的模型目录缓存
+
+    模型列表接口和发送消息时按 ID 查模型都从这里读取。每隔 check_interval 秒
+    读一次 cache_version 中的目录版本（一条主键查询），版本变化时才重新加载模型表，
+    因此其他 worker 修改模型后最多延迟 check_interval 秒生效；本进程修改后调用 invalidate 立即生效。
+    重新加载时名称或状态变化的模型会从模型客户端池中移除。
+    """
+
+    def __init__(self, check_interval: float = 5):
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._version = None
+        self._checked_at = 0.0
+        self._models: Dict[int, ModelEntry] = {}
+        self._active: List[dict] = []
+        self.etag = ''
+        self.reloads = 0
+
+    def _refresh(self):
+        now = time.monotonic()
+        if self._version is not None and now - self._checked_at < self.check_interval:
+            return
+        version = db.session.query(CacheVersion.version).filter_by(name=CATALOG_NAME).scalar() or 0
+        with self._lock:
+            if version == self._version:
+                self._checked_at = now
+                return
+
+        models = {model.id: ModelEntry(model.id, model.name, model.description, bool(model.is_active))
+                  for model in Model.query.order_by(Model.id).all()}
+        active = [{'id': entry.id, 'name': entry.name, 'description': entry.description}
+                  for entry in models.values() if entry.is_active]
+        etag = hashlib.sha1(json.dumps(active, ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()
+        with self._lock:
+            previous, first_load = self._models, self._version is None
+            self._models, self._active, self.etag = models, active, etag
+            self._version, self._checked_at = version, now
+            self.reloads += 1
+        if not first_load:
+            # 其他 worker 修改了模型记录，丢弃本进程池中按旧配置创建的客户端
+            pool = get_model_pool()
+            for model_id, entry in previous.items():
+                if models.get(model_id) != entry:
+                    pool.invalidate(entry.name)
+
+    def active(self) -> Tuple[List[dict], str]:
+        """启用的模型列表及其 ETag"""
+        self._refresh()
+        with self._lock:
+            return self._active, self.etag
+
+    def find(self, model_id) -> Optional[ModelEntry]:
+        """按 ID 查找模型（含未启用的），不存在时返回 None"""
+        self._refresh()
+        try:
+            return self._models.get(int(model_id))
+        except (TypeError, ValueError):
+            return None
+
+    def invalidate(self):
+        """本进程写入模型表后调用，下次读取时重新检查版本"""
+        with self._lock:
+            self._checked_at = 0.0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"version": self._version, "models": len(self._models), "reloads": self.reloads}
+
+
+_catalog: Optional[ModelCatalog] = None
+_catalog_lock = threading.Lock()
+
+
+def get_model_catalog(config=None) -> ModelCatalog:
+    """获取当前 worker 进程的模型目录缓存（首次调用时按配置创建）"""
+    global _catalog
+    if _catalog is None:
+        with _catalog_lock:
+            if _catalog is None:
+                config = config or {}
+                _catalog = ModelCatalog(check_interval=float(config.get('MODEL_CATALOG_CHECK_SECONDS', 5)))
+    return _catalog
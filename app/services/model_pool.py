@@ -0,0 +1,120 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Hashable, Optional, Tuple
+
+from langchain.chat_models import init_chat_model
+
+
+class _PooledClient:
+    __slots__ = ("client", "created_at", "last_used")
+
+    def __init__(self, client):
+        now = time.monotonic()
+        self.client = client
+        self.created_at = now
+        self.last_used = now
+
+
+class ModelPool:
+    """进程内的聊天模型客户端池
+
+    按 (模型名, 提供方, base_url, 采样参数) 复用 init_chat_model 创建的客户端，
+    这样底层 HTTP 客户端及其 keep-alive 连接可以跨请求复用，
+    而不是每条消息都重新建立连接和 TLS 握手。
+    """
+
+    def __init__(self, max_size: int = 8, idle_ttl: float = 600):
+        self.max_size = max_size
+        self.idle_ttl = idle_ttl
+        self._clients: "OrderedDict[Tuple[Hashable, ...], _PooledClient]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(model_name: str, model_provider: str, base_url: Optional[str],
+                 temperature: float, top_p: float) -> Tuple[Hashable, ...]:
+        return (model_name, model_provider, base_url, temperature, top_p)
+
+    def get(self, model_name: str, model_provider: str, base_url: Optional[str] = None,
+            api_key: Optional[str] = None, temperature: float = 0.95, top_p: float = 0.7):
+        """获取（必要时创建）一个模型客户端"""
+        key = self.make_key(model_name, model_provider, base_url, temperature, top_p)
+        with self._lock:
+            self._evict_idle()
+            pooled = self._clients.get(key)
+            if pooled is not None:
+                pooled.last_used = time.monotonic()
+                self._clients.move_to_end(key)
+                self.hits += 1
+                return pooled.client
+
+            self.misses += 1
+            kwargs = {}
+            # 直接把密钥传给客户端，避免每次请求都改写 os.environ
+            if api_key and model_provider == "openai":
+                kwargs["api_key"] = api_key
+            client = init_chat_model(base_url=base_url,
+                                     model=model_name,
+                                     temperature=temperature,
+                                     top_p=top_p,
+                                     model_provider=model_provider,
+                                     **kwargs)
+            self._clients[key] = _PooledClient(client)
+            while len(self._clients) > self.max_size:
+                self._clients.popitem(last=False)
+                self.evictions += 1
+            return client
+
+    def invalidate(self, model_name: Optional[str] = None) -> int:
+        """模型表中的记录变化时调用，丢弃对应客户端；不传 model_name 则清空整个池"""
+        with self._lock:
+            if model_name is None:
+                removed = len(self._clients)
+                self._clients.clear()
+            else:
+                keys = [key for key in self._clients if key[0] == model_name]
+                for key in keys:
+                    del self._clients[key]
+                removed = len(keys)
+            self.evictions += removed
+            return removed
+
+    def _evict_idle(self):
+        if not self.idle_ttl:
+            return
+        deadline = time.monotonic() - self.idle_ttl
+        # OrderedDict 按最近使用排序，最旧的在前面
+        while self._clients:
+            key, pooled = next(iter(self._clients.items()))
+            if pooled.last_used >= deadline:
+                break
+            del self._clients[key]
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._clients),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+_pool: Optional[ModelPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_model_pool(config=None) -> ModelPool:
+    """获取当前 worker 进程的模型客户端池（首次调用时按配置创建）"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                config = config or {}
+                _pool = ModelPool(max_size=int(config.get('MODEL_POOL_MAX_SIZE', 8)),
+                                  idle_ttl=float(config.get('MODEL_POOL_IDLE_TTL', 600)))
+    return _pool
@@ -0,0 +1,131 @@
+import json
+from typing import List, Optional, Sequence, Tuple
+
+from langchain.schema import SystemMessage
+from langchain_core.messages import BaseMessage, HumanMessage
+
+SUMMARY_PROMPT = (
+    "你负责维护一段对话的摘要。请把“已有摘要”和“新增对话”合并成一段新的摘要，"
+    "保留用户的身份信息、诉求、已经给出的关键结论和尚未解决的问题，省略寒暄，"
+    "不超过{max_chars}字，只输出摘要正文。"
+)
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算 token 数：中日韩字符按 1 个 token 计，其余字符按 4 个字符 1 个 token 计"""
+    if not text:
+        return 0
+    cjk = sum(1 for ch in text if ch >= "⺀")
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def message_tokens(message: BaseMessage) -> int:
+    # 每条消息额外计入角色等格式开销
+    content = message.content if isinstance(message.content, str) else str(message.content)
+    return estimate_tokens(content) + 4
+
+
+def message_db_id(message: BaseMessage) -> Optional[int]:
+    """从检查点消息 ID（message-<id>）中取出 message 表主键；本轮输入的消息返回 None"""
+    message_id = getattr(message, "id", None) or ""
+    if message_id.startswith("message-"):
+        return int(message_id[len("message-"):])
+    return None
+
+
+def get_token_budget(config, model_name: Optional[str]) -> int:
+    """按模型返回提示词 token 预算，MODEL_TOKEN_BUDGETS 中没有配置的模型使用 PROMPT_TOKEN_BUDGET"""
+    budgets = config.get('MODEL_TOKEN_BUDGETS') or {}
+    if isinstance(budgets, str):
+        budgets = json.loads(budgets)
+    return int(budgets.get(model_name, config.get('PROMPT_TOKEN_BUDGET', 4000)))
+
+
+def assemble_prompt(system_prompt: str, messages: Sequence[BaseMessage], token_budget: int,
+                    summary: Optional[str] = None, summary_until_id: int = 0) -> List[BaseMessage]:
+    """按 token 预算组装提示词
+
+    系统提示词和会话摘要总是保留；已并入摘要的消息（ID <= summary_until_id）不再发送；
+    其余消息从最新往前逐条加入，直到预算用完。最新一条用户消息总会被保留。
+    """
+    system_content = system_prompt or ""
+    if summary:
+        system_content = f"{system_content}\n\n以下是之前对话的摘要：\n{summary}"
+    system_message = SystemMessage(system_content)
+    remaining = token_budget - message_tokens(system_message)
+
+    kept = []
+    for message in reversed(messages):
+        db_id = message_db_id(message)
+        if db_id is not None and db_id <= summary_until_id:
+            break
+        cost = message_tokens(message)
+        if kept and cost > remaining:
+            break
+        kept.append(message)
+        remaining -= cost
+    kept.reverse()
+    return [system_message] + kept
+
+
+def plan_summary(rows: Sequence[Tuple], token_budget: int, summary_until_id: int = 0,
+                 max_rows: Optional[int] = None, high_watermark: float = 0.75,
+                 low_watermark: float = 0.4) -> List[Tuple]:
+    """决定哪些消息需要并入摘要
+
+    rows 为会话中尚未摘要的全部消息 (id, role, content, created_at)，按 ID 升序，
+    应直接从 message 表读取，而不是取最近的消息窗口。以下任一情况触发摘要：
+      - 未摘要消息的 token 数超过预算的 high_watermark，assemble_prompt 会开始丢弃旧消息；
+      - 未摘要消息超过 max_rows 条（会话历史窗口的大小），更早的消息已经不在提示词里。
+    触发后只保留最新的一段原文（不超过预算的 low_watermark，且不超过 max_rows 的一半），
+    更早的消息全部并入摘要；水位之间留有余量，摘要不会每轮都重新计算。
+    单次并入的消息不超过 token_budget，更早积压的消息在之后几轮继续并入。
+    """
+    pending = [row for row in rows if row[0] > summary_until_id]
+    costs = [estimate_tokens(row[2]) + 4 for row in pending]
+    total = sum(costs)
+    over_rows = max_rows is not None and len(pending) > max_rows
+    if total <= token_budget * high_watermark and not over_rows:
+        return []
+
+    # 从最新的消息往前保留原文，直到 token 或条数达到下限
+    tail_tokens = token_budget * low_watermark
+    tail_rows = max(2, max_rows // 2) if max_rows is not None else len(pending)
+    tail = 0
+    kept = 0
+    for cost in reversed(costs):
+        if kept >= tail_rows or tail + cost > tail_tokens:
+            break
+        tail += cost
+        kept += 1
+    folded_count = len(pending) - kept
+
+    # 单次摘要的输入不超过预算
+    folded_tokens = 0
+    for index in range(folded_count):
+        if index and folded_tokens + costs[index] > token_budget:
+            folded_count = index
+            break
+        folded_tokens += costs[index]
+    folded = pending[:folded_count]
+    # 摘要边界放在一轮完整的问答之后，避免把问题和回答拆开
+    while folded and folded[-1][1] == "user" and len(folded) < len(pending):
+        folded.append(pending[len(folded)])
+    # 最新的问题可能还没有回答（回答还在消息日志中），不并入摘要
+    while folded and folded[-1][1] == "user":
+        folded.pop()
+    return folded
+
+
+def summarize(model, summary: Optional[str], rows: Sequence[Tuple], max_chars: int = 500) -> str:
+    """把新增对话合并进已有摘要"""
+    dialogue = "\n".join(
+        f"{'助手' if role == 'assistant' else '用户'}: {content}"
+        for _, role, content, _ in rows
+    )
+    prompt = [
+        SystemMessage(SUMMARY_PROMPT.format(max_chars=max_chars)),
+        HumanMessage(f"已有摘要：\n{summary or '（无）'}\n\n新增对话：\n{dialogue}"),
+    ]
+    response = model.invoke(prompt)
+    return response.content.strip()
@@ -0,0 +1,177 @@
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+from app.services.lexical_index import LexicalIndex
+
+
+def rrf_scores(rankings: Sequence[Sequence[str]], k: int = 60) -> Dict[str, float]:
+    """倒数排名融合（Reciprocal Rank Fusion）的分数：Σ 1/(k + 名次)"""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, chunk_id in enumerate(ranking):
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (k + rank + 1)
+    return scores
+
+
+def rrf_fuse(rankings: Sequence[Sequence[str]], k: int = 60) -> List[str]:
+    """按 RRF 分数从高到低合并多个排序"""
+    scores = rrf_scores(rankings, k)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+def mmr(relevance: np.ndarray, vectors: np.ndarray, k: int, lambda_mult: float = 0.5) -> List[int]:
+    """最大边际相关性（MMR）重排，返回选中候选的下标
+
+    每一步选择 lambda_mult * 相关性 - (1 - lambda_mult) * 与已选结果的最大相似度 最高的候选。
+    候选之间的相似度矩阵一次算好，循环内只做长度为候选数的向量运算。
+    """
+    n = len(relevance)
+    if n == 0:
+        return []
+    k = min(k, n)
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    vectors = vectors / np.where(norms == 0, 1, norms)
+    similarity = vectors @ vectors.T
+    relevance = np.asarray(relevance, dtype=np.float32)
+
+    selected = [int(np.argmax(relevance))]
+    max_similarity = similarity[selected[0]].copy()
+    available = np.ones(n, dtype=bool)
+    available[selected[0]] = False
+    for _ in range(k - 1):
+        scores = lambda_mult * relevance - (1 - lambda_mult) * max_similarity
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        np.maximum(max_similarity, similarity[best], out=max_similarity)
+    return selected
+
+
+class HybridRetriever:
+    """知识库检索：BM25 关键词检索与向量检索融合
+
+    关键词检索的最佳结果覆盖了查询中的全部关键词（按 IDF 加权的覆盖率不低于
+    fast_path_threshold）时，直接返回关键词结果，不再请求向量化服务；
+    否则两路各取 fetch_k 个候选，用 RRF 融合。
+    最后用候选块已存储的向量做 MMR 重排，去掉 chunk_overlap 造成的近似重复块后返回 k 个，
+    重排不会产生额外的向量化请求。MMR 的相关性取融合后的分数，只被关键词检索命中的块
+    （例如编号、错误码）不会因为向量相似度低而被挤出结果。各阶段耗时记录在 timings 中。
+    """
+
+    def __init__(self, vector_store, lexical_index: Optional[LexicalIndex] = None, k: int = 2,
+                 fetch_k: int = 20, fast_path_threshold: float = 0.9, mmr_lambda: float = 0.5):
+        self.vector_store = vector_store
+        self.lexical_index = lexical_index
+        self.k = k
+        self.fetch_k = max(fetch_k, k)
+        self.fast_path_threshold = fast_path_threshold
+        self.mmr_lambda = mmr_lambda
+        self.last_path = None
+        self.timings: Dict[str, float] = {}
+
+    @property
+    def collection(self):
+        return self.vector_store._collection
+
+    def ensure_lexical_index(self) -> bool:
+        """关键词索引不存在时用向量库中已有的块构建（兼容本功能上线前导入的知识库）"""
+        if self.lexical_index is None or self.lexical_index.exists():
+            return False
+
+        def load() -> Tuple[List[str], List[str], List[str]]:
+            data = self.collection.get(include=["documents", "metadatas"])
+            files = [(metadata or {}).get("file_id", "") for metadata in data["metadatas"]]
+            return data["ids"], data["documents"], files
+
+        return self.lexical_index.rebuild(load)
+
+    def _lexical(self, query: str) -> Tuple[List[Tuple[str, float]], float]:
+        if self.lexical_index is None:
+            return [], 0.0
+        try:
+            self.ensure_lexical_index()
+            return self.lexical_index.search(query, self.fetch_k)
+        except Exception as e:
+            print(f"关键词检索出错: {str(e)}")
+            return [], 0.0
+
+    @staticmethod
+    def _candidates(ids, documents, metadatas, embeddings) -> Dict[str, Tuple[Document, np.ndarray]]:
+        return {
+            chunk_id: (Document(page_content=text, metadata=metadata or {}), vector)
+            for chunk_id, text, metadata, vector in zip(ids, documents, metadatas, embeddings)
+        }
+
+    def _fetch(self, ids: Sequence[str]) -> Dict[str, Tuple[Document, np.ndarray]]:
+        """按 ID 读取块的文本、元数据和已存储的向量"""
+        if not ids:
+            return {}
+        data = self.collection.get(ids=list(ids), include=["documents", "metadatas", "embeddings"])
+        return self._candidates(data["ids"], data["documents"], data["metadatas"], data["embeddings"])
+
+    def search(self, query: str) -> List[Document]:
+        timings = {}
+        started = stage = time.perf_counter()
+
+        def mark(name):
+            nonlocal stage
+            now = time.perf_counter()
+            timings[name] = round((now - stage) * 1000, 3)
+            stage = now
+
+        lexical_hits, coverage = self._lexical(query)
+        mark("lexical_ms")
+
+        query_vector = None
+        fused = None
+        if lexical_hits and coverage >= self.fast_path_threshold:
+            # 关键词快速路径，不请求向量化服务
+            self.last_path = "lexical"
+            order = [chunk_id for chunk_id, _ in lexical_hits]
+            candidates = self._fetch(order)
+            mark("fetch_ms")
+        else:
+            self.last_path = "hybrid" if lexical_hits else "vector"
+            query_vector = np.asarray(self.vector_store.embeddings.embed_query(query), dtype=np.float32)
+            mark("embed_ms")
+            result = self.collection.query(query_embeddings=[query_vector.tolist()], n_results=self.fetch_k,
+                                           include=["documents", "metadatas", "embeddings"])
+            vector_ids = result["ids"][0]
+            candidates = self._candidates(vector_ids, result["documents"][0],
+                                          result["metadatas"][0], result["embeddings"][0])
+            mark("vector_ms")
+            order = vector_ids
+            if lexical_hits:
+                fused = rrf_scores([vector_ids, [chunk_id for chunk_id, _ in lexical_hits]])
+                order = sorted(fused, key=fused.get, reverse=True)[:self.fetch_k]
+                candidates.update(self._fetch([chunk_id for chunk_id in order if chunk_id not in candidates]))
+                mark("fetch_ms")
+
+        order = [chunk_id for chunk_id in order if chunk_id in candidates]
+        docs = []
+        if order:
+            vectors = np.vstack([np.asarray(candidates[chunk_id][1], dtype=np.float32) for chunk_id in order])
+            if query_vector is None:
+                # 相关性取归一化的 BM25 分数
+                bm25 = dict(lexical_hits)
+                relevance = np.asarray([bm25[chunk_id] for chunk_id in order], dtype=np.float32)
+                relevance /= relevance.max() or 1
+            elif fused is not None:
+                # 相关性取归一化的 RRF 融合分数
+                relevance = np.asarray([fused[chunk_id] for chunk_id in order], dtype=np.float32)
+                relevance /= relevance.max() or 1
+            else:
+                # 相关性取候选与查询向量的余弦相似度
+                norms = np.linalg.norm(vectors, axis=1) * (np.linalg.norm(query_vector) or 1)
+                relevance = vectors @ query_vector / np.where(norms == 0, 1, norms)
+            docs = [candidates[order[i]][0] for i in mmr(relevance, vectors, self.k, self.mmr_lambda)]
+        mark("rerank_ms")
+        timings["total_ms"] = round((time.perf_counter() - started) * 1000, 3)
+        timings["candidates"] = len(order)
+        self.timings = timings
+        return docs
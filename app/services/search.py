@@ -0,0 +1,170 @@
+import re
+from typing import List, Optional, Tuple
+
+from sqlalchemy import and_, literal
+from sqlalchemy.dialects.mysql import match
+
+from app import db
+from app.models import Chat, Message, Repository
+
+# 可搜索的类型
+SEARCH_TYPES = ('chat', 'message', 'repository')
+# 一次搜索最多使用的关键词数和每个关键词的最大长度
+MAX_TERMS = 8
+MAX_TERM_CHARS = 64
+
+
+def parse_terms(keyword: Optional[str]) -> List[str]:
+    """按空白拆分搜索词，去重后最多保留 MAX_TERMS 个"""
+    terms = []
+    for term in (keyword or '').replace('"', ' ').split():
+        term = term[:MAX_TERM_CHARS]
+        if term.lower() not in (t.lower() for t in terms):
+            terms.append(term)
+    return terms[:MAX_TERMS]
+
+
+def _boolean_query(terms: List[str]) -> str:
+    # 每个词作为必须出现的短语：ngram 分词下短语匹配等价于子串匹配，不会因为拆成二元组而召回无关内容
+    return ' '.join(f'+"{term}"' for term in terms)
+
+
+def use_fulltext(terms: List[str], config) -> bool:
+    """MySQL 且每个词都不短于 ngram_token_size 时走全文索引
+
+    ngram 索引中没有比 ngram_token_size 短的词（例如单个汉字），这类查询只能退回 LIKE。
+    """
+    if db.session.get_bind().dialect.name != 'mysql':
+        return False
+    token_size = int(config.get('SEARCH_NGRAM_TOKEN_SIZE', 2))
+    return all(len(term) >= token_size for term in terms)
+
+
+def match_condition(columns, terms: List[str], config):
+    """columns 中包含全部搜索词的过滤条件，以及相关度表达式 (condition, score)
+
+    全文索引按 columns 的组合建立（MATCH 的列必须与索引定义完全一致）；
+    不能使用全文索引时退回逐列 LIKE，相关度恒为 0。
+    """
+    if use_fulltext(terms, config):
+        score = match(*columns, against=_boolean_query(terms)).in_boolean_mode()
+        return score, score
+    condition = and_(*[db.or_(*[column.contains(term, autoescape=True) for column in columns])
+                       for term in terms])
+    return condition, literal(0)
+
+
+def make_snippet(text: Optional[str], terms: List[str], width: int = 80) -> Tuple[str, List[List[int]]]:
+    """截取第一个命中词附近的片段，返回 (片段, 命中位置列表 [[起, 止], ...])
+
+    高亮用字符偏移表示，由客户端渲染，不在服务端拼接 HTML。
+    """
+    text = re.sub(r'\s+', ' ', text or '').strip()
+    lowered = text.lower()
+    positions = [lowered.find(term.lower()) for term in terms]
+    positions = [pos for pos in positions if pos >= 0]
+    start = max(0, min(positions) - width // 4) if positions else 0
+    end = min(len(text), start + width)
+    start = max(0, min(start, end - width))
+    snippet = text[start:end]
+    prefix = '…' if start > 0 else ''
+    suffix = '…' if end < len(text) else ''
+
+    highlights = []
+    lowered_snippet = snippet.lower()
+    for term in terms:
+        needle = term.lower()
+        pos = lowered_snippet.find(needle)
+        while pos >= 0 and needle:
+            highlights.append([pos + len(prefix), pos + len(prefix) + len(needle)])
+            pos = lowered_snippet.find(needle, pos + len(needle))
+    # 合并重叠的高亮区间
+    merged = []
+    for begin, finish in sorted(highlights):
+        if merged and begin <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], finish)
+        else:
+            merged.append([begin, finish])
+    return prefix + snippet + suffix, merged
+
+
+def _page(query, score, order_column, id_column, limit: int, offset: int):
+    # 全文检索按相关度排序，LIKE 退化时相关度都是 0，按时间倒序
+    rows = (query.add_columns(score.label('score'))
+            .order_by(db.desc('score'), order_column.desc(), id_column.desc())
+            .offset(offset).limit(limit + 1).all())
+    return rows[:limit], len(rows) > limit
+
+
+def search_chats(user_id: int, terms: List[str], config, limit: int = 20, offset: int = 0):
+    condition, score = match_condition([Chat.title], terms, config)
+    query = db.session.query(Chat.id, Chat.title, Chat.created_at).filter(Chat.user_id == user_id, condition)
+    rows, has_more = _page(query, score, Chat.created_at, Chat.id, limit, offset)
+    width = int(config.get('SEARCH_SNIPPET_CHARS', 80))
+    items = []
+    for row in rows:
+        snippet, highlights = make_snippet(row.title, terms, width)
+        items.append({
+            'type': 'chat',
+            'id': row.id,
+            'title': row.title,
+            'created_at': row.created_at.isoformat(),
+            'score': float(row.score or 0),
+            'snippet': snippet,
+            'highlights': highlights,
+        })
+    return items, has_more
+
+
+def search_messages(user_id: int, terms: List[str], config, limit: int = 20, offset: int = 0):
+    condition, score = match_condition([Message.content], terms, config)
+    query = (db.session.query(Message.id, Message.chat_id, Message.role, Message.content,
+                              Message.created_at, Chat.title.label('chat_title'))
+             .join(Chat, Chat.id == Message.chat_id)
+             .filter(Chat.user_id == user_id, condition))
+    rows, has_more = _page(query, score, Message.created_at, Message.id, limit, offset)
+    width = int(config.get('SEARCH_SNIPPET_CHARS', 80))
+    items = []
+    for row in rows:
+        snippet, highlights = make_snippet(row.content, terms, width)
+        items.append({
+            'type': 'message',
+            'id': row.id,
+            'chat_id': row.chat_id,
+            'chat_title': row.chat_title,
+            'role': row.role,
+            'created_at': row.created_at.isoformat(),
+            'score': float(row.score or 0),
+            'snippet': snippet,
+            'highlights': highlights,
+        })
+    return items, has_more
+
+
+def search_repositories(user_id: int, terms: List[str], config, limit: int = 20, offset: int = 0):
+    condition, score = match_condition([Repository.name, Repository.remark], terms, config)
+    query = (db.session.query(Repository.id, Repository.name, Repository.remark, Repository.created_at)
+             .filter(Repository.user_id == user_id, condition))
+    rows, has_more = _page(query, score, Repository.created_at, Repository.id, limit, offset)
+    width = int(config.get('SEARCH_SNIPPET_CHARS', 80))
+    items = []
+    for row in rows:
+        snippet, highlights = make_snippet(f"{row.name} {row.remark or ''}", terms, width)
+        items.append({
+            'type': 'repository',
+            'id': row.id,
+            'name': row.name,
+            'remark': row.remark,
+            'created_at': row.created_at.isoformat(),
+            'score': float(row.score or 0),
+            'snippet': snippet,
+            'highlights': highlights,
+        })
+    return items, has_more
+
+
+SEARCHERS = {
+    'chat': search_chats,
+    'message': search_messages,
+    'repository': search_repositories,
+}
@@ -0,0 +1,158 @@
+import json
+import threading
+import time
+from typing import Iterator, List, Optional, Tuple
+
+
+def format_event(event: str, data, event_id: Optional[str] = None) -> str:
+    """按 text/event-stream 格式编码一个事件"""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    payload = json.dumps(data, ensure_ascii=False)
+    lines.extend(f"data: {line}" for line in payload.split("\n"))
+    return "\n".join(lines) + "\n\n"
+
+
+class StreamBuffer:
+    """单次回答的事件缓冲
+
+    生成线程依次追加原始事件（每个 token 一条），响应线程按序号读取。
+    回答结束后缓冲保留一段时间，客户端断线重连时可以按 Last-Event-ID 续传。
+    """
+
+    def __init__(self, stream_id: str, chat_id: Optional[int] = None):
+        self.stream_id = stream_id
+        self.chat_id = chat_id
+        self.items: List[Tuple[int, str, object]] = []
+        self.closed = False
+        self.closed_at = None
+        self._cond = threading.Condition()
+
+    def append(self, event: str, data):
+        with self._cond:
+            self.items.append((len(self.items) + 1, event, data))
+            self._cond.notify_all()
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self.closed_at = time.monotonic()
+            self._cond.notify_all()
+
+    def wait_after(self, seq: int, timeout: float) -> Tuple[List[Tuple[int, str, object]], bool]:
+        """返回序号大于 seq 的事件；没有新事件时最多等待 timeout 秒"""
+        with self._cond:
+            if len(self.items) <= seq and not self.closed and timeout > 0:
+                self._cond.wait(timeout)
+            return self.items[seq:], self.closed
+
+
+class StreamRegistry:
+    """当前 worker 进程中各次回答的事件缓冲，结束后保留 ttl 秒用于续传"""
+
+    def __init__(self, ttl: float = 300):
+        self.ttl = ttl
+        self._buffers = {}
+        self._lock = threading.Lock()
+
+    def create(self, stream_id: str, chat_id: Optional[int] = None) -> StreamBuffer:
+        with self._lock:
+            now = time.monotonic()
+            expired = [key for key, buffer in self._buffers.items()
+                       if buffer.closed and now - buffer.closed_at > self.ttl]
+            for key in expired:
+                del self._buffers[key]
+            buffer = StreamBuffer(stream_id, chat_id)
+            self._buffers[stream_id] = buffer
+            return buffer
+
+    def get(self, stream_id: str) -> Optional[StreamBuffer]:
+        with self._lock:
+            return self._buffers.get(stream_id)
+
+
+def parse_event_id(event_id: Optional[str]) -> Tuple[Optional[str], int]:
+    """解析 “<stream_id>:<序号>” 格式的事件 ID"""
+    if not event_id or ":" not in event_id:
+        return None, 0
+    stream_id, _, seq = event_id.rpartition(":")
+    try:
+        return stream_id, int(seq)
+    except ValueError:
+        return None, 0
+
+
+def iter_frames(buffer: StreamBuffer, after_seq: int = 0, coalesce_chars: int = 32,
+                coalesce_delay: float = 0.05, heartbeat: float = 15) -> Iterator[str]:
+    """把缓冲中的事件编码成 SSE 帧
+
+    相邻的 token 按时间（coalesce_delay）和长度（coalesce_chars）合并为一帧，
+    减少系统调用和帧数；第一帧 token 立即发送以降低首字节时间。
+    长时间没有数据时发送注释形式的心跳，防止代理或客户端断开空闲连接。
+    """
+    seq = after_seq
+    pending, pending_seq, pending_since = "", seq, None
+    frames = 0
+    sent_token = False
+    last_write = time.monotonic()
+
+    def flush():
+        nonlocal pending, pending_since, frames, sent_token, last_write
+        frame = format_event("token", {"content": pending}, f"{buffer.stream_id}:{pending_seq}")
+        pending, pending_since = "", None
+        frames += 1
+        sent_token = True
+        last_write = time.monotonic()
+        return frame
+
+    while True:
+        now = time.monotonic()
+        if pending:
+            timeout = max(0.0, pending_since + coalesce_delay - now)
+        else:
+            timeout = max(0.0, last_write + heartbeat - now)
+        items, closed = buffer.wait_after(seq, timeout)
+
+        for item_seq, event, data in items:
+            seq = item_seq
+            if event == "token":
+                if not pending:
+                    pending_since = time.monotonic()
+                pending += data
+                pending_seq = item_seq
+                if not sent_token or len(pending) >= coalesce_chars:
+                    yield flush()
+                continue
+            if pending:
+                yield flush()
+            if event == "done":
+                data = dict(data, frames=frames + 1)
+            frames += 1
+            last_write = time.monotonic()
+            yield format_event(event, data, f"{buffer.stream_id}:{item_seq}")
+
+        now = time.monotonic()
+        if pending and (closed or now - pending_since >= coalesce_delay):
+            yield flush()
+        if closed and len(items) == 0:
+            return
+        if not items and not pending and now - last_write >= heartbeat:
+            last_write = now
+            yield ": ping\n\n"
+
+
+_registry: Optional[StreamRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_stream_registry(config=None) -> StreamRegistry:
+    """获取当前 worker 进程的事件缓冲登记表（首次调用时按配置创建）"""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                config = config or {}
+                _registry = StreamRegistry(ttl=float(config.get('SSE_REPLAY_TTL', 300)))
+    return _registry
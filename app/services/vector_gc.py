@@ -0,0 +1,169 @@
+import os
+import re
+import shutil
+from typing import Dict, List
+
+from chromadb.db.impl.sqlite import SqliteDB
+
+from app import db
+from app.models import IngestionJob, Repository, RepositoryFile
+from app.services.lexical_index import get_lexical_indexes
+from app.services.vector_store_cache import get_vector_store_cache
+
+# 知识库集合名 user_{repository_id}_benefits，见 vector_store_cache.collection_name
+COLLECTION_PATTERN = re.compile(r"^user_(\d+)_benefits$")
+SEGMENT_DIR_PATTERN = re.compile(r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$")
+
+
+def directory_size(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, name))
+               for root, _, names in os.walk(path) for name in names
+               if os.path.exists(os.path.join(root, name)))
+
+
+class VectorGC:
+    """向量库对账与垃圾回收
+
+    以 repository_file 为准对账 Chroma：
+      - 知识库已删除但集合仍在的，删除整个集合和关键词索引
+      - 集合中 file_id 在清单中不存在的块（孤立块），分批删除，同时从关键词索引中删除
+      - 清单中块数为 0 的旧文件按实际块数回填，块数不一致的文件写入报告
+    之后清除 Chroma 已应用的预写日志、删除不再被引用的 HNSW 段目录并 VACUUM，报告回收的空间。
+    apply 为 False 时只报告，不做任何修改。
+    """
+
+    def __init__(self, config, batch_size: int = 500, apply: bool = False):
+        self.config = config
+        self.batch_size = batch_size
+        self.apply = apply
+        self.cache = get_vector_store_cache(config)
+        self.client = self.cache.client
+        self.lexical_indexes = get_lexical_indexes(config)
+        self.persist_directory = self.cache.persist_directory
+
+    def run(self, vacuum: bool = True) -> Dict:
+        report = {
+            "apply": self.apply,
+            "collections": 0,
+            "orphan_collections": [],
+            "orphan_chunks": 0,
+            "orphan_files": [],
+            "manifest_backfilled": [],
+            "manifest_mismatches": [],
+            "orphan_segment_dirs": [],
+            "bytes_before": directory_size(self.persist_directory),
+        }
+        live = {repository_id for (repository_id,) in db.session.query(Repository.id)}
+
+        for collection in self.client.list_collections():
+            match = COLLECTION_PATTERN.match(collection.name)
+            if match is None:
+                continue
+            report["collections"] += 1
+            repository_id = int(match.group(1))
+            if repository_id not in live:
+                report["orphan_collections"].append({"repository_id": repository_id, "chunks": collection.count()})
+                if self.apply:
+                    self.cache.drop(repository_id)
+                    self.lexical_indexes.drop(repository_id)
+                continue
+            self._reconcile(repository_id, collection, report)
+
+        if self.apply:
+            self._drop_orphan_lexical_indexes(live)
+        report["orphan_segment_dirs"] = self._orphan_segment_dirs()
+        if self.apply:
+            for name in report["orphan_segment_dirs"]:
+                shutil.rmtree(os.path.join(self.persist_directory, name), ignore_errors=True)
+            if vacuum:
+                self._compact()
+
+        report["bytes_after"] = directory_size(self.persist_directory)
+        report["bytes_reclaimed"] = report["bytes_before"] - report["bytes_after"]
+        return report
+
+    def _reconcile(self, repository_id: int, collection, report: Dict):
+        files = RepositoryFile.query.filter_by(repository_id=repository_id).all()
+        expected = {}
+        for file in files:
+            expected[file.file_id] = max(expected.get(file.file_id, 0), file.chunk_count or 0)
+
+        # 分页只读取元数据，统计每个 file_id 的块数并收集孤立块
+        counts: Dict[str, int] = {}
+        orphans: Dict[str, List[str]] = {}
+        offset = 0
+        while True:
+            page = collection.get(include=["metadatas"], limit=self.batch_size, offset=offset)
+            if not page["ids"]:
+                break
+            for chunk_id, metadata in zip(page["ids"], page["metadatas"]):
+                file_id = (metadata or {}).get("file_id", "")
+                counts[file_id] = counts.get(file_id, 0) + 1
+                if file_id not in expected:
+                    orphans.setdefault(file_id, []).append(chunk_id)
+            offset += len(page["ids"])
+
+        if orphans:
+            # 扫描期间新上传的文件可能还不在快照中，删除前再确认一次
+            candidates = list(orphans)
+            current = {file_id for (file_id,) in db.session.query(RepositoryFile.file_id).filter(
+                RepositoryFile.repository_id == repository_id, RepositoryFile.file_id.in_(candidates))}
+            current |= {file_id for (file_id,) in db.session.query(IngestionJob.file_id).filter(
+                IngestionJob.repository_id == repository_id, IngestionJob.file_id.in_(candidates))}
+            for file_id in current:
+                orphans.pop(file_id, None)
+
+        lexical_index = self.lexical_indexes.get(repository_id)
+        for file_id, ids in orphans.items():
+            report["orphan_chunks"] += len(ids)
+            report["orphan_files"].append({"repository_id": repository_id, "file_id": file_id, "chunks": len(ids)})
+            if not self.apply:
+                continue
+            for start in range(0, len(ids), self.batch_size):
+                collection.delete(ids=ids[start:start + self.batch_size])
+            if file_id:
+                lexical_index.delete_file(file_id)
+
+        for file in files:
+            if file.status != 'ready':
+                continue
+            actual = counts.get(file.file_id, 0)
+            if not file.chunk_count and actual:
+                # 清单上线前导入的文件没有块数，按向量库回填
+                report["manifest_backfilled"].append({"id": file.id, "chunks": actual})
+                if self.apply:
+                    file.chunk_count = actual
+            elif (file.chunk_count or 0) != actual:
+                report["manifest_mismatches"].append({"id": file.id, "file_id": file.file_id,
+                                                      "expected": file.chunk_count or 0, "actual": actual})
+        if self.apply:
+            db.session.commit()
+
+    def _drop_orphan_lexical_indexes(self, live):
+        directory = self.lexical_indexes.directory
+        if not os.path.isdir(directory):
+            return
+        for name in os.listdir(directory):
+            if name.isdigit() and int(name) not in live:
+                self.lexical_indexes.drop(int(name))
+
+    def _sqlite(self) -> SqliteDB:
+        return self.client._system.instance(SqliteDB)
+
+    def _orphan_segment_dirs(self) -> List[str]:
+        """持久化目录中没有对应段记录的 HNSW 段目录"""
+        with self._sqlite().tx() as cur:
+            segments = {row[0] for row in cur.execute("SELECT id FROM segments").fetchall()}
+        return sorted(name for name in os.listdir(self.persist_directory)
+                      if SEGMENT_DIR_PATTERN.match(name) and name not in segments
+                      and os.path.isdir(os.path.join(self.persist_directory, name)))
+
+    def _compact(self):
+        """清除已应用到各段的预写日志并 VACUUM，之后让 Chroma 自动清理日志"""
+        sqlite = self._sqlite()
+        for collection in self.client.list_collections():
+            sqlite.purge_log(collection_id=collection.id)
+        sqlite.vacuum()
+        config = sqlite.config
+        config.set_parameter("automatically_purge", True)
+        sqlite.set_config(config)
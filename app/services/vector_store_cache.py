@@ -0,0 +1,135 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+import chromadb
+from chromadb.config import Settings
+from langchain_chroma import Chroma
+
+
+def collection_name(repository_id: int) -> str:
+    """知识库对应的 Chroma 集合名"""
+    return f"user_{repository_id}_benefits"
+
+
+class _CachedStore:
+    __slots__ = ("store", "opened_at", "last_used")
+
+    def __init__(self, store: Chroma):
+        now = time.monotonic()
+        self.store = store
+        self.opened_at = now
+        self.last_used = now
+
+
+class VectorStoreCache:
+    """按知识库缓存已打开的 Chroma 集合句柄（LRU + TTL）
+
+    所有句柄共用同一个 PersistentClient；该客户端开启了 Chroma 自带的
+    LRU 段缓存，并按 memory_limit_bytes 限制常驻内存的 HNSW 索引大小，
+    因此句柄数量和索引内存分别受 max_size 和 memory_limit_bytes 约束。
+    """
+
+    def __init__(self, persist_directory: str, max_size: int = 32, ttl: float = 1800,
+                 memory_limit_bytes: int = 0):
+        self.persist_directory = persist_directory
+        self.max_size = max_size
+        self.ttl = ttl
+        self.memory_limit_bytes = memory_limit_bytes
+        self._client = None
+        self._stores: "OrderedDict[int, _CachedStore]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def client(self):
+        if self._client is None:
+            options = {"anonymized_telemetry": False}
+            if self.memory_limit_bytes:
+                options["chroma_segment_cache_policy"] = "LRU"
+                options["chroma_memory_limit_bytes"] = self.memory_limit_bytes
+            self._client = chromadb.PersistentClient(path=self.persist_directory,
+                                                     settings=Settings(**options))
+        return self._client
+
+    def get(self, repository_id: int, embedding_function) -> Chroma:
+        """获取知识库的向量存储句柄，未命中时才打开集合（不做任何全量扫描）"""
+        with self._lock:
+            self._evict_expired()
+            cached = self._stores.get(repository_id)
+            if cached is not None:
+                cached.last_used = time.monotonic()
+                self._stores.move_to_end(repository_id)
+                self.hits += 1
+                return cached.store
+
+            self.misses += 1
+            store = Chroma(collection_name=collection_name(repository_id),
+                           embedding_function=embedding_function,
+                           client=self.client)
+            self._stores[repository_id] = _CachedStore(store)
+            while len(self._stores) > self.max_size:
+                self._stores.popitem(last=False)
+                self.evictions += 1
+            return store
+
+    def invalidate(self, repository_id: Optional[int] = None) -> None:
+        """知识库被删除（或集合被重建）时丢弃缓存的句柄"""
+        with self._lock:
+            if repository_id is None:
+                self.evictions += len(self._stores)
+                self._stores.clear()
+            elif self._stores.pop(repository_id, None) is not None:
+                self.evictions += 1
+
+    def drop(self, repository_id: int) -> bool:
+        """删除知识库对应的 Chroma 集合（知识库被删除时调用），集合不存在时返回 False"""
+        self.invalidate(repository_id)
+        try:
+            self.client.delete_collection(collection_name(repository_id))
+            return True
+        except ValueError:
+            return False
+
+    def _evict_expired(self):
+        if not self.ttl:
+            return
+        deadline = time.monotonic() - self.ttl
+        while self._stores:
+            repository_id, cached = next(iter(self._stores.items()))
+            if cached.last_used >= deadline:
+                break
+            del self._stores[repository_id]
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._stores),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+_cache: Optional[VectorStoreCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_vector_store_cache(config=None) -> VectorStoreCache:
+    """获取当前 worker 进程的向量存储句柄缓存（首次调用时按配置创建）"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                config = config or {}
+                _cache = VectorStoreCache(
+                    persist_directory=config.get('CHROMA_PERSIST_DIRECTORY', 'chroma_db'),
+                    max_size=int(config.get('VECTOR_STORE_CACHE_SIZE', 32)),
+                    ttl=float(config.get('VECTOR_STORE_CACHE_TTL', 1800)),
+                    memory_limit_bytes=int(config.get('VECTOR_STORE_MEMORY_LIMIT_MB', 0)) * 1024 * 1024,
+                )
+    return _cache
@@ -1,9 +1,10 @@
 from flask import Blueprint, request, current_app
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask_jwt_extended import jwt_required, current_user
 import os
 from werkzeug.utils import secure_filename
 from app import db
 from app.models import User
+from app.services.identity import get_identity_cache, load_identity
 from common.result import Result
 
 bp = Blueprint('user', __name__)
@@ -17,8 +18,7 @@ def allowed_file(filename):
 @bp.route('/profile', methods=['GET'])
 @jwt_required()
 def get_profile():
-    user_id = get_jwt_identity()  # 获取字符串类型的用户 ID
-    user = User.query.get_or_404(int(user_id))  # 将字符串转换为整数后查询用户
+    user = current_user  # 请求开始时已加载的用户身份，不再查询数据库
     return Result.success(data={
         'id': user.id,
         'nickname': user.nickname,
@@ -29,8 +29,7 @@ def get_profile():
 @bp.route('/profile', methods=['PUT'])
 @jwt_required()
 def update_profile():
-    user_id = get_jwt_identity()
-    user = User.query.get_or_404(int(user_id))
+    user_id = current_user.id
     
     data = request.get_json()
     if not data:
@@ -38,9 +37,12 @@ def update_profile():
     
     try:
         if 'nickname' in data:
-            user.nickname = data['nickname']
+            User.query.filter_by(id=user_id).update({'nickname': data['nickname']})
         
         db.session.commit()
+        # 资料已修改，丢弃缓存的身份并重新读取
+        get_identity_cache(current_app.config).invalidate(user_id)
+        user = load_identity(user_id, current_app.config)
         return Result.success(data={
             'id': user.id,
             'nickname': user.nickname,
@@ -56,8 +58,7 @@ def update_profile():
 @bp.route('/avatar', methods=['POST'])
 @jwt_required()
 def upload_avatar():
-    user_id = get_jwt_identity()  # 获取字符串类型的用户 ID
-    user = User.query.get_or_404(int(user_id))  # 将字符串转换为整数后查询用户
+    user_id = current_user.id
     
     if 'file' not in request.files:
         return Result.bad_request(message="未上传文件").to_json()
@@ -85,11 +86,13 @@ def upload_avatar():
         file.save(file_path)
         
         # 更新用户头像
-        user.avatar = f"/static/avatars/{filename}"
+        avatar = f"/static/avatars/{filename}"
+        User.query.filter_by(id=user_id).update({'avatar': avatar})
         db.session.commit()
+        get_identity_cache(current_app.config).invalidate(user_id)
         
         return Result.success(data={
-            'avatar_url': user.avatar
+            'avatar_url': avatar
         }).to_json()
     
     except Exception as e:
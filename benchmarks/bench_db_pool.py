@@ -0,0 +1,198 @@
+"""数据库连接池基准：流式回答期间占用连接 与 归还连接 的对比
+
+用很小的连接池（默认 2 个连接、不允许溢出、等待 5 秒超时）同时发起 --streams 个流式聊天请求，
+期间持续请求会话列表接口。两种会话生命周期各在一个子进程中运行：
+  - held：回答开始时取得连接，直到回答保存后才释放（改动前只要生成期间访问过会话就会这样）
+  - released：流式输出前的读写完成后立即归还连接，回答结束后用短事务写入（当前实现）
+记录完成/失败的流式回答数、同时输出中的回答数峰值、首字节时间、会话列表接口延迟
+以及连接池的等待、占用时长和超时次数。
+
+用法: python benchmarks/bench_db_pool.py [--streams 50] [--pool-size 2] [--tokens 100] [--token-interval 0.02]
+"""
+import argparse
+import http.client
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def _percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(len(values) * p))] * 1000, 1)
+
+
+def _hold_connection_during_stream(db, chat_module):
+    """模拟改动前的生命周期：回答开始时在请求的会话中执行查询，连接一直占用到回答保存提交"""
+    start_turn = chat_module._start_turn
+
+    def holding(chat_id):
+        turn, error = start_turn(chat_id)
+        if turn is not None:
+            stream = turn['stream']
+
+            def held():
+                db.session.execute(db.text("SELECT 1"))
+                yield from stream
+
+            turn['stream'] = held()
+        return turn, error
+
+    chat_module._start_turn = holding
+
+
+def child(mode, args):
+    from werkzeug.serving import make_server
+
+    import app.chat as chat_module
+    from app import create_app, db
+    from app.models import Model
+    from app.services.db_pool import get_pool_metrics
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        db.session.add(Model(name="fake", description="bench", is_active=True))
+        db.session.commit()
+    client = app.test_client()
+    client.post("/auth/register", json={"username": "bench", "password": "bench", "password_confirm": "bench"})
+    token = client.post("/auth/login", json={"username": "bench", "password": "bench"}).json["data"]["access_token"]
+    headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
+    chats = [client.post("/chat/chats", json={"title": str(i)}, headers=headers).json["data"]["id"]
+             for i in range(args.streams)]
+    if mode == "held":
+        _hold_connection_during_stream(db, chat_module)
+
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_port
+
+    lock = threading.Lock()
+    state = {"active": 0, "peak": 0, "completed": 0, "failed": 0}
+    first_bytes, list_latencies, list_errors = [], [], [0]
+    expected = "".join(f"答{i % 10}" for i in range(args.tokens))
+
+    def stream(chat_id):
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=120)
+        start = time.perf_counter()
+        conn.request("POST", f"/chat/chats/{chat_id}/messages/stream",
+                     body=json.dumps({"content": "你好", "model_id": 1}), headers=headers)
+        response = conn.getresponse()
+        body = response.read(1)
+        with lock:
+            first_bytes.append(time.perf_counter() - start)
+            state["active"] += 1
+            state["peak"] = max(state["peak"], state["active"])
+        body += response.read()
+        conn.close()
+        with lock:
+            state["active"] -= 1
+            state["completed" if body.decode("utf-8", errors="ignore") == expected else "failed"] += 1
+
+    finished = threading.Event()
+
+    def poll_chats():
+        while not finished.is_set():
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=120)
+            start = time.perf_counter()
+            conn.request("GET", "/chat/chats?limit=20", headers=headers)
+            data = json.loads(conn.getresponse().read())
+            conn.close()
+            list_latencies.append(time.perf_counter() - start)
+            if data.get("code") != 200:
+                list_errors[0] += 1
+            time.sleep(0.05)
+
+    started = time.perf_counter()
+    poller = threading.Thread(target=poll_chats, daemon=True)
+    poller.start()
+    threads = [threading.Thread(target=stream, args=(chat_id,)) for chat_id in chats]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    finished.set()
+    poller.join()
+    wall = time.perf_counter() - started
+    server.shutdown()
+
+    pool = get_pool_metrics().stats()
+    print("RESULT" + json.dumps({
+        "mode": mode,
+        "streams_completed": state["completed"],
+        "streams_failed": state["failed"],
+        "peak_concurrent_streams": state["peak"],
+        "wall_seconds": round(wall, 2),
+        "stream_ttfb_p50_ms": _percentile(first_bytes, 0.5),
+        "stream_ttfb_p95_ms": _percentile(first_bytes, 0.95),
+        "chat_list_p50_ms": _percentile(list_latencies, 0.5),
+        "chat_list_p95_ms": _percentile(list_latencies, 0.95),
+        "chat_list_errors": list_errors[0],
+        "pool": {key: pool.get(key) for key in ("checkouts", "timeouts", "wait_p99_ms", "wait_max_ms",
+                                                "hold_p50_ms", "hold_p99_ms", "hold_max_ms")},
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--streams", type=int, default=50)
+    parser.add_argument("--pool-size", type=int, default=2)
+    parser.add_argument("--pool-timeout", type=int, default=5)
+    parser.add_argument("--tokens", type=int, default=100)
+    parser.add_argument("--ttft", type=float, default=0.2)
+    parser.add_argument("--token-interval", type=float, default=0.02)
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child, args)
+        return
+
+    from fake_servers import FakeOllamaServer, FakeOpenAIServer
+
+    embedder = FakeOllamaServer().start()
+    llm = FakeOpenAIServer(ttft=args.ttft, token_interval=args.token_interval, answer_tokens=args.tokens).start()
+    results = []
+    for mode in ("held", "released"):
+        workdir = tempfile.mkdtemp(prefix=f"bench_db_pool_{mode}_")
+        env = dict(os.environ,
+                   DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+                   EMBEDDINGS_URL=embedder.url,
+                   EMBEDDINGS_MODEL=embedder.model,
+                   CHROMA_PERSIST_DIRECTORY=os.path.join(workdir, "chroma_db"),
+                   QUERY_EMBEDDING_CACHE_PATH="",
+                   INGESTION_ENABLED="false",
+                   OPENAI_API_KEY="bench",
+                   OPENAI_API_URL=llm.url,
+                   PROMPT_TOKEN_BUDGET="100000",
+                   DB_POOL_SIZE=str(args.pool_size),
+                   DB_MAX_OVERFLOW="0",
+                   DB_POOL_TIMEOUT=str(args.pool_timeout))
+        output = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", mode,
+                                 "--streams", str(args.streams), "--tokens", str(args.tokens)],
+                                cwd=ROOT, env=env, capture_output=True, text=True, check=True).stdout
+        line = [line for line in output.splitlines() if line.startswith("RESULT")][-1]
+        results.append(json.loads(line[len("RESULT"):]))
+    llm.stop()
+    embedder.stop()
+    print(json.dumps({
+        "streams": args.streams,
+        "pool_size": args.pool_size,
+        "max_overflow": 0,
+        "pool_timeout_s": args.pool_timeout,
+        "answer_seconds": round(args.ttft + args.tokens * args.token_interval, 2),
+        "results": results,
+    }, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
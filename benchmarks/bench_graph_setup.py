@@ -0,0 +1,50 @@
+"""聊天图构建耗时基准
+
+对比每轮对话都构建并 compile() 一次 StateGraph（旧做法）
+与从进程内缓存取已编译图的耗时。这段时间位于首个流式 token 之前。
+
+用法: python benchmarks/bench_graph_setup.py [-n 500]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.chat_graph import build_chat_graph, get_chat_graph  # noqa: E402
+
+
+def _measure(fn, n):
+    samples = []
+    for _ in range(n):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return {
+        "mean_ms": round(statistics.mean(samples) * 1000, 4),
+        "p50_ms": round(samples[len(samples) // 2] * 1000, 4),
+        "p99_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1000, 4),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", type=int, default=500)
+    args = parser.parse_args()
+
+    results = {}
+    for with_retrieval in (False, True):
+        shape = "with_retrieval" if with_retrieval else "without_retrieval"
+        results[shape] = {
+            "compile_per_request": _measure(lambda: build_chat_graph(with_retrieval), args.n),
+            "compiled_once": _measure(lambda: get_chat_graph(with_retrieval), args.n),
+        }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""文档导入基准：整篇解析后再向量化 与 按页区间流水线 的对比
+
+生成一个大的合成 PDF（默认 500 页），在独立的子进程中分别用两种方式导入到临时向量库，
+向量化请求发往本地伪 Ollama 服务（带固定延迟）。记录：
+  - 总耗时、第一个块写入向量库的时间
+  - worker 进程的峰值 RSS 及相对导入前的增长、解析子进程的峰值 RSS（读取 /proc，仅限 Linux）
+
+用法: python benchmarks/bench_ingestion.py [--pages 500] [--embed-latency 0.05] [--parse-workers 2]
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+WORDS = ["residence", "permit", "social", "security", "card", "pension", "subsidy", "application",
+         "materials", "original", "identity", "document", "household", "register", "service", "center",
+         "window", "online", "declaration", "review", "working", "days", "form", "F-102", "approval"]
+
+
+def write_pdf(path: str, pages: int, lines_per_page: int = 50, seed: int = 42):
+    """写出只含 Helvetica 文本的最小 PDF，逐页写入文件"""
+    rng = random.Random(seed)
+    offsets = []
+    with open(path, "wb") as f:
+        def obj(number: int, body: bytes):
+            offsets.append((number, f.tell()))
+            f.write(b"%d 0 obj\n" % number + body + b"\nendobj\n")
+
+        f.write(b"%PDF-1.4\n")
+        kids = b" ".join(b"%d 0 R" % (4 + 2 * i) for i in range(pages))
+        obj(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+        obj(2, b"<< /Type /Pages /Kids [" + kids + b"] /Count %d >>" % pages)
+        obj(3, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+        for i in range(pages):
+            lines = [f"Article {i}.{n} " + " ".join(rng.choice(WORDS) for _ in range(10))
+                     for n in range(lines_per_page)]
+            stream = ("BT /F1 9 Tf 11 TL 36 806 Td " + " ".join(f"({line}) Tj T*" for line in lines)
+                      + " ET").encode("latin-1")
+            obj(4 + 2 * i, b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                           b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % (5 + 2 * i))
+            obj(5 + 2 * i, b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        xref = f.tell()
+        count = 4 + 2 * pages
+        positions = dict(offsets)
+        f.write(b"xref\n0 %d\n0000000000 65535 f \n" % count)
+        for number in range(1, count):
+            f.write(b"%010d 00000 n \n" % positions[number])
+        f.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (count, xref))
+
+
+def _status_mb(field: str, pid="self") -> float:
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def child(mode: str, pdf: str, pages: int, parse_workers: int, pages_per_task: int):
+    """在当前（全新的）进程中导入一次 PDF，输出 JSON 结果"""
+    from app import create_app
+    from app.services.chat_service import ChatService
+    from app.services.document_parser import parse_section, plan_sections
+    from app.services.ingestion import IngestionManager
+
+    app = create_app()
+    with app.app_context():
+        cs = ChatService(repository_id=1)
+        manager = IngestionManager(app, parse_workers=parse_workers, pages_per_task=pages_per_task)
+        # 常驻 worker 中解析进程池在多次导入之间复用，计时前先启动进程并导入解析模块
+        pool = manager._get_parse_pool()
+        for future in [pool.submit(plan_sections, pdf, 2) for _ in range(parse_workers * 2)]:
+            future.result()
+        baseline = _status_mb("VmRSS")
+        first = None
+        started = time.perf_counter()
+
+        def progress(done, total):
+            nonlocal first
+            if done and first is None:
+                first = time.perf_counter() - started
+
+        if mode == "streaming":
+            chunks = manager._iter_chunks(0, pdf, 2)
+        else:
+            # 改动前的做法：整篇文档在一个解析进程中解析、切分，全部块返回后再向量化
+            chunks = manager._wait(0, manager._get_parse_pool().submit(parse_section, pdf, 2, 0, pages))
+        count = cs.add_chunks("bench", pdf, chunks, progress=progress)
+        wall = time.perf_counter() - started
+        parser_peak = max(_status_mb("VmHWM", pid) for pid in manager._parse_pool._processes)
+        manager._parse_pool.shutdown(wait=True)
+
+    worker_peak = _status_mb("VmHWM")
+    print("RESULT" + json.dumps({
+        "mode": mode,
+        "chunks": count,
+        "wall_seconds": round(wall, 2),
+        "first_chunk_stored_seconds": round(first, 2) if first is not None else None,
+        "worker_peak_rss_mb": round(worker_peak, 1),
+        "worker_rss_growth_mb": round(worker_peak - baseline, 1),
+        "parser_peak_rss_mb": round(parser_peak, 1),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=500)
+    parser.add_argument("--embed-latency", type=float, default=0.05, help="每个向量化请求的固定延迟（秒）")
+    parser.add_argument("--parse-workers", type=int, default=2)
+    parser.add_argument("--pages-per-task", type=int, default=10)
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--pdf", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child, args.pdf, args.pages, args.parse_workers, args.pages_per_task)
+        return
+
+    from fake_servers import FakeOllamaServer
+
+    workdir = tempfile.mkdtemp(prefix="bench_ingestion_")
+    pdf = os.path.join(workdir, "regulations.pdf")
+    write_pdf(pdf, args.pages)
+    embedder = FakeOllamaServer(latency=args.embed_latency, dimensions=1024).start()
+    results = []
+    for mode in ("whole", "streaming"):
+        env = dict(os.environ,
+                   DATABASE_URL=f"sqlite:///{os.path.join(workdir, mode + '.db')}",
+                   CHROMA_PERSIST_DIRECTORY=os.path.join(workdir, f"chroma_{mode}"),
+                   EMBEDDINGS_URL=embedder.url,
+                   EMBEDDINGS_MODEL=embedder.model,
+                   # 关闭向量缓存，两种方式都要完整地向量化
+                   QUERY_EMBEDDING_CACHE_PATH="",
+                   INGESTION_ENABLED="false")
+        output = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", mode, "--pdf", pdf,
+                                 "--pages", str(args.pages), "--parse-workers", str(args.parse_workers),
+                                 "--pages-per-task", str(args.pages_per_task)],
+                                cwd=ROOT, env=env, capture_output=True, text=True, check=True).stdout
+        line = [line for line in output.splitlines() if line.startswith("RESULT")][-1]
+        results.append(json.loads(line[len("RESULT"):]))
+    embedder.stop()
+    print(json.dumps({
+        "pages": args.pages,
+        "pdf_mb": round(os.path.getsize(pdf) / 1024 / 1024, 1),
+        "embed_latency_s": args.embed_latency,
+        "results": results,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""关键词索引基准
+
+用合成的政策文档块构建 BM25 索引（分多个文件增量写入，触发段合并），记录构建耗时、
+磁盘占用、新进程打开索引（内存映射）的耗时和查询延迟。
+
+用法: python benchmarks/bench_lexical_index.py [--chunks 50000] [--files 50] [--queries 500]
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from app.services.lexical_index import LexicalIndex  # noqa: E402
+
+PHRASES = ["居住证", "社保卡", "医保报销", "养老金", "低保申请", "残疾人补贴", "公积金提取", "营业执照",
+           "身份证原件", "户口簿", "街道便民服务中心", "窗口办理", "线上申报", "审核时限", "工作日"]
+
+
+def _chunk(rng: random.Random, i: int) -> str:
+    words = rng.sample(PHRASES, 6)
+    return f"第{i}条 表格编号 F-{i % 997:03d}。" + "，".join(words) + "。需要携带相关材料到指定地点办理。"
+
+
+def _dir_size(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=50000)
+    parser.add_argument("--files", type=int, default=50)
+    parser.add_argument("--queries", type=int, default=500)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    directory = tempfile.mkdtemp(prefix="bench_lexical_")
+    index = LexicalIndex(directory)
+    per_file = args.chunks // args.files
+
+    start = time.perf_counter()
+    for f in range(args.files):
+        ids = [f"file{f}-{i}" for i in range(per_file)]
+        texts = [_chunk(rng, f * per_file + i) for i in range(per_file)]
+        index.add(f"file{f}", ids, texts)
+    build_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    reader = LexicalIndex(directory)
+    reader.search("居住证")
+    open_ms = (time.perf_counter() - start) * 1000
+
+    queries = [f"F-{rng.randrange(997):03d}" if i % 2 else " ".join(rng.sample(PHRASES, 2))
+               for i in range(args.queries)]
+    latencies = []
+    fast_path = 0
+    for query in queries:
+        start = time.perf_counter()
+        hits, coverage = reader.search(query, 10)
+        latencies.append((time.perf_counter() - start) * 1000)
+        fast_path += bool(hits) and coverage >= 0.9
+    latencies.sort()
+
+    print(json.dumps({
+        "chunks": per_file * args.files,
+        "files": args.files,
+        "segments": len(reader._read_manifest()["segments"]),
+        "build_seconds": round(build_seconds, 2),
+        "disk_mb": round(_dir_size(directory) / 1024 / 1024, 1),
+        "open_and_first_query_ms": round(open_ms, 1),
+        "query_p50_ms": round(statistics.median(latencies), 2),
+        "query_p99_ms": round(latencies[int(len(latencies) * 0.99) - 1], 2),
+        "fast_path_rate": round(fast_path / len(queries), 3),
+    }, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
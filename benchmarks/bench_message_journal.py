@@ -0,0 +1,203 @@
+"""回答消息写入基准：逐条提交 与 消息日志批量写入 的对比，以及崩溃后的重放
+
+--threads 个线程各保存 --replies 条回答：
+  - direct：每条回答一个 INSERT + COMMIT（关闭消息日志时的写法）
+  - journal：追加到消息日志后立即返回，后台线程用多行 INSERT 批量写库
+记录保存一条回答的调用耗时、全部回答写入数据库的总耗时、执行的 SQL 语句数和提交次数。
+
+crash 场景在子进程中追加 --crash-replies 条回答后直接 os._exit 退出（不写库、不执行退出处理），
+再启动一个进程重放遗留的日志段，确认条数一致；再重放一次确认不会重复写入。
+
+用法: python benchmarks/bench_message_journal.py [--threads 8] [--replies 500] [--database-url mysql+pymysql://...]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def _percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(len(values) * p))] * 1000, 3)
+
+
+def _create_app():
+    from app import create_app, db
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+def _seed_chat(app) -> int:
+    from app import db
+    from app.models import Chat, User
+    with app.app_context():
+        user = User(username=f"bench-{time.time_ns()}", password="x")
+        db.session.add(user)
+        db.session.flush()
+        chat = Chat(user_id=user.id, title="bench")
+        db.session.add(chat)
+        db.session.commit()
+        return chat.id
+
+
+def child_write(mode, args):
+    from sqlalchemy import event
+
+    from app import db
+    from app.models import Message
+    from app.services.message_journal import get_message_journal
+
+    app = _create_app()
+    chat_id = _seed_chat(app)
+    statements, commits = [0], [0]
+    with app.app_context():
+        event.listen(db.engine, "before_cursor_execute", lambda *a: statements.__setitem__(0, statements[0] + 1))
+        event.listen(db.engine, "commit", lambda *a: commits.__setitem__(0, commits[0] + 1))
+        before = Message.query.filter_by(chat_id=chat_id).count()
+    statements[0] = commits[0] = 0
+
+    journal = get_message_journal()
+    latencies = []
+    lock = threading.Lock()
+
+    def worker(index):
+        with app.app_context():
+            for i in range(args.replies):
+                content = f"回答 {index}-{i} " + "内容" * 200
+                started = time.perf_counter()
+                if journal is not None:
+                    journal.append(chat_id, "assistant", content)
+                else:
+                    db.session.add(Message(chat_id=chat_id, role="assistant", content=content))
+                    db.session.commit()
+                elapsed = time.perf_counter() - started
+                with lock:
+                    latencies.append(elapsed)
+
+    total = args.threads * args.replies
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    call_seconds = time.perf_counter() - started
+    with app.app_context():
+        # 等后台线程把日志全部写入数据库
+        while Message.query.filter_by(chat_id=chat_id).count() - before < total:
+            db.session.commit()
+            time.sleep(0.01)
+        durable_seconds = time.perf_counter() - started
+        db.session.commit()
+    print("RESULT" + json.dumps({
+        "mode": mode,
+        "replies": total,
+        "save_call_p50_ms": _percentile(latencies, 0.5),
+        "save_call_p99_ms": _percentile(latencies, 0.99),
+        "save_calls_per_second": round(total / call_seconds),
+        "all_rows_in_db_seconds": round(durable_seconds, 3),
+        # 包含等待期间的计数查询，数量很少
+        "sql_statements": statements[0],
+        "commits": commits[0],
+        "journal": journal.stats() if journal is not None else None,
+    }))
+
+
+def child_crash(args):
+    from app.services.message_journal import get_message_journal
+
+    app = _create_app()
+    chat_id = _seed_chat(app)
+    journal = get_message_journal()
+    journal._stopped = True  # 后台线程不再写库，模拟写库前进程被杀
+    time.sleep(journal.flush_interval * 2)
+    for i in range(args.crash_replies):
+        journal.append(chat_id, "assistant", f"崩溃前的回答 {i}")
+    print("RESULT" + json.dumps({"chat_id": chat_id, "segments": os.listdir(journal.directory)}), flush=True)
+    os._exit(9)
+
+
+def child_recover(args):
+    from app import db
+    from app.models import Message
+    from app.services.message_journal import get_message_journal
+
+    app = _create_app()
+    journal = get_message_journal()
+    with app.app_context():
+        replayed = journal.recover()
+        rows = db.session.query(Message).filter(Message.journal_key.isnot(None)).count()
+        replayed_again = journal.recover()
+        rows_again = db.session.query(Message).filter(Message.journal_key.isnot(None)).count()
+    print("RESULT" + json.dumps({
+        "replayed": replayed,
+        "rows": rows,
+        "replayed_again": replayed_again,
+        "rows_after_second_replay": rows_again,
+        "segments_left": os.listdir(journal.directory),
+    }))
+
+
+def _run_child(args, env, *child_args):
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), *child_args,
+                             "--threads", str(args.threads), "--replies", str(args.replies),
+                             "--crash-replies", str(args.crash_replies)],
+                            cwd=ROOT, env=env, capture_output=True, text=True).stdout
+    line = [line for line in output.splitlines() if line.startswith("RESULT")][-1]
+    return json.loads(line[len("RESULT"):])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--replies", type=int, default=500, help="每个线程保存的回答数")
+    parser.add_argument("--crash-replies", type=int, default=1000)
+    parser.add_argument("--database-url", help="默认在临时目录中使用 SQLite")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child == "crash":
+        child_crash(args)
+        return
+    if args.child == "recover":
+        child_recover(args)
+        return
+    if args.child:
+        child_write(args.child, args)
+        return
+
+    results = {}
+    for mode in ("direct", "journal", "crash"):
+        workdir = tempfile.mkdtemp(prefix=f"bench_message_journal_{mode}_")
+        env = dict(os.environ,
+                   DATABASE_URL=args.database_url or f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+                   CHROMA_PERSIST_DIRECTORY=os.path.join(workdir, "chroma_db"),
+                   QUERY_EMBEDDING_CACHE_PATH="",
+                   INGESTION_ENABLED="false",
+                   MESSAGE_JOURNAL_ENABLED="false" if mode == "direct" else "true",
+                   MESSAGE_JOURNAL_DIRECTORY=os.path.join(workdir, "journal"))
+        if mode == "crash":
+            crashed = _run_child(args, env, "--child", "crash")
+            # 重放进程的后台线程推迟到 60 秒后才检查，由 child_recover 显式重放
+            recovered = _run_child(args, dict(env, MESSAGE_JOURNAL_FLUSH_MS="60000"), "--child", "recover")
+            results[mode] = {"appended_before_crash": args.crash_replies,
+                             "segments_after_crash": len(crashed["segments"]),
+                             **recovered}
+        else:
+            results[mode] = _run_child(args, env, "--child", mode)
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""检索重排基准：向量化 MMR 的耗时
+
+模拟检索阶段拿到的 fetch_k 个候选（含已存储的向量，其中一部分是 chunk_overlap
+造成的近似重复块），测量整个重排（拼接向量、余弦相关性、MMR 选出 k 个结果）
+以及其中 MMR 本身的耗时。
+
+用法: python benchmarks/bench_mmr.py [--dimensions 1024] [--repeat 2000]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from app.services.retrieval import mmr  # noqa: E402
+
+
+def _candidates(rng, fetch_k, dimensions):
+    base = rng.standard_normal((fetch_k, dimensions)).astype(np.float32)
+    # 每两个候选中有一个是前一个的轻微扰动，模拟重叠切分产生的近似重复块
+    base[1::2] = base[0::2][:len(base[1::2])] + 0.05 * rng.standard_normal((len(base[1::2]), dimensions))
+    # Chroma 返回的已存储向量是 numpy 数组
+    return list(base)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dimensions", type=int, default=1024)
+    parser.add_argument("--repeat", type=int, default=2000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    query = rng.standard_normal(args.dimensions).astype(np.float32)
+    results = []
+    for fetch_k in (10, 20, 50, 100):
+        stored = _candidates(rng, fetch_k, args.dimensions)
+        for k in (2, 4, 8):
+            samples, mmr_samples = [], []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                vectors = np.vstack([np.asarray(vector, dtype=np.float32) for vector in stored])
+                norms = np.linalg.norm(vectors, axis=1) * np.linalg.norm(query)
+                relevance = vectors @ query / norms
+                mmr_start = time.perf_counter()
+                selected = mmr(relevance, vectors, k)
+                end = time.perf_counter()
+                samples.append((end - start) * 1e6)
+                mmr_samples.append((end - mmr_start) * 1e6)
+            # 选中的结果里同一对近似重复块出现两次的次数
+            pairs = [index // 2 for index in selected]
+            duplicates = len(pairs) - len(set(pairs))
+            samples.sort()
+            results.append({
+                "fetch_k": fetch_k,
+                "k": k,
+                "rerank_p50_us": round(statistics.median(samples), 1),
+                "rerank_p99_us": round(samples[int(len(samples) * 0.99) - 1], 1),
+                "mmr_only_p50_us": round(statistics.median(mmr_samples), 1),
+                "near_duplicates_selected": duplicates,
+            })
+    print(json.dumps({"dimensions": args.dimensions, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""模型客户端池微基准
+
+对比每条消息都调用 init_chat_model（旧做法）与从 ModelPool 取客户端的耗时：
+1. 仅客户端构建耗时；
+2. 对本地伪 OpenAI 服务端发起一次完整调用的耗时（新客户端每次都要重新建连）。
+
+用法: python benchmarks/bench_model_pool.py [-n 200]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain.chat_models import init_chat_model  # noqa: E402
+
+from app.services.model_pool import ModelPool  # noqa: E402
+
+
+class _FakeOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    connections = set()
+
+    def do_POST(self):
+        _FakeOpenAIHandler.connections.add(self.client_address)
+        length = int(self.headers.get("Content-Length", 0))
+        self.rfile.read(length)
+        body = json.dumps({
+            "id": "chatcmpl-bench",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": "bench",
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": "ok"}}],
+            "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def _summary(samples):
+    samples = sorted(samples)
+    return {
+        "mean_ms": round(statistics.mean(samples) * 1000, 3),
+        "p50_ms": round(samples[len(samples) // 2] * 1000, 3),
+        "p99_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1000, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", type=int, default=200)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _FakeOpenAIHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    params = dict(model="bench", model_provider="openai", base_url=base_url,
+                  temperature=0.95, top_p=0.7)
+    pool = ModelPool()
+
+    def fresh():
+        return init_chat_model(api_key="bench", **params)
+
+    def pooled():
+        return pool.get("bench", "openai", base_url, api_key="bench", temperature=0.95, top_p=0.7)
+
+    results = {}
+    for name, factory in (("init_chat_model", fresh), ("model_pool", pooled)):
+        setup, total = [], []
+        _FakeOpenAIHandler.connections = set()
+        for _ in range(args.n):
+            start = time.perf_counter()
+            client = factory()
+            built = time.perf_counter()
+            client.invoke("hi")
+            setup.append(built - start)
+            total.append(time.perf_counter() - start)
+        results[name] = {"setup": _summary(setup), "setup_plus_call": _summary(total),
+                         "tcp_connections": len(_FakeOpenAIHandler.connections)}
+
+    server.shutdown()
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
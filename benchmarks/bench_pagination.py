@@ -0,0 +1,202 @@
+"""会话列表与消息分页基准：全量返回、OFFSET 分页 与 键集（游标）分页的对比
+
+向数据库灌入大量消息（默认 200 万条，其中一个会话 20 万条，其余分散在其他用户的会话中），
+分别在没有和有 (chat_id, created_at, id) / (user_id, created_at, id) 组合索引时测量：
+  - GET /chat/chats 全量、第一页、深处的一页
+  - GET /chat/chats/<id>/messages 全量、latest=50、深处的 before 游标页
+  - 同一深度下 OFFSET 分页与键集分页的 SQL 耗时
+每项记录 p50/p95 耗时和响应字节数。
+
+用法: python benchmarks/bench_pagination.py [--messages 2000000] [--big-chat 200000] [--repeat 20]
+      [--database-url mysql+pymysql://...]（默认使用临时 SQLite 数据库）
+"""
+import argparse
+import json
+import math
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+SEED_BATCH = 20000
+
+
+def _percentiles(samples):
+    samples = sorted(samples)
+    return {
+        "p50_ms": round(statistics.median(samples), 2),
+        "p95_ms": round(samples[math.ceil(len(samples) * 0.95) - 1], 2),
+    }
+
+
+def seed(db, models, args):
+    """灌入数据：压测用户的 chats 个会话（第一个是大会话），其余消息分散在其他用户的会话中"""
+    User, Chat, Message = models
+    base = datetime(2024, 1, 1)
+    users = [{"id": 1, "username": "bench", "password": "x", "created_at": base}]
+    users += [{"id": i, "username": f"user{i}", "password": "x", "created_at": base}
+              for i in range(2, args.users + 2)]
+    db.session.execute(User.__table__.insert(), users)
+
+    other_chats = max(1, (args.messages - args.big_chat) // args.messages_per_chat)
+    chats = []
+    for i in range(args.chats + other_chats):
+        owner = 1 if i < args.chats else 2 + i % args.users
+        # 每 3 个会话共用一个创建时间，覆盖 created_at 相同时按 id 排序的情况
+        chats.append({"id": i + 1, "user_id": owner, "title": f"会话 {i + 1}",
+                      "created_at": base + timedelta(seconds=i // 3)})
+    for start in range(0, len(chats), SEED_BATCH):
+        db.session.execute(Chat.__table__.insert(), chats[start:start + SEED_BATCH])
+
+    def messages():
+        for n in range(args.messages):
+            if n < args.big_chat:
+                chat_id, position = 1, n
+            else:
+                # 其他会话的消息交错写入，和真实库一样同一会话的消息在表中并不连续
+                offset = n - args.big_chat
+                chat_id, position = args.chats + 1 + offset % other_chats, offset // other_chats
+            yield {"chat_id": chat_id, "role": "user" if position % 2 == 0 else "assistant",
+                   "content": f"消息 {position}：" + "办理居住证需要哪些材料" * 4,
+                   "created_at": base + timedelta(seconds=position // 2)}
+
+    batch = []
+    for row in messages():
+        batch.append(row)
+        if len(batch) == SEED_BATCH:
+            db.session.execute(Message.__table__.insert(), batch)
+            batch = []
+    if batch:
+        db.session.execute(Message.__table__.insert(), batch)
+    db.session.commit()
+
+
+def create_indexes(db, models):
+    """创建与 migrations/006 相同的组合索引"""
+    from sqlalchemy import Index
+
+    _, Chat, Message = models
+    Index("user_created", Chat.user_id, Chat.created_at, Chat.id).create(bind=db.engine)
+    Index("chat_created", Message.chat_id, Message.created_at, Message.id).create(bind=db.engine)
+    if db.engine.dialect.name == "sqlite":
+        db.session.execute(db.text("ANALYZE"))
+        db.session.commit()
+
+
+def measure(client, headers, path, repeat):
+    samples, size = [], 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = client.get(path, headers=headers)
+        samples.append((time.perf_counter() - start) * 1000)
+        size = len(response.data)
+        assert response.json["code"] == 200, response.json
+    return dict(_percentiles(samples), bytes=size)
+
+
+def measure_sql(db, query, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        query.all()
+        samples.append((time.perf_counter() - start) * 1000)
+        db.session.rollback()
+    return _percentiles(samples)
+
+
+def run_scenarios(app, db, models, client, headers, args):
+    from app.chat import _keyset_page
+    from common.pagination import encode_cursor
+
+    _, Chat, Message = models
+    with app.app_context():
+        # 深处的游标：大会话中距最新消息 90% 处、会话列表 90% 处
+        depth = int(args.big_chat * 0.9)
+        deep_message = (Message.query.filter_by(chat_id=1)
+                        .order_by(Message.created_at.desc(), Message.id.desc()).offset(depth).first())
+        message_cursor = encode_cursor(deep_message.created_at, deep_message.id)
+        chat_depth = int(args.chats * 0.9)
+        deep_chat = (Chat.query.filter_by(user_id=1)
+                     .order_by(Chat.created_at.desc(), Chat.id.desc()).offset(chat_depth).first())
+        chat_cursor = encode_cursor(deep_chat.created_at, deep_chat.id)
+        db.session.rollback()
+
+    results = {
+        "chats_all": measure(client, headers, "/chat/chats", max(1, args.repeat // 4)),
+        "chats_first_page": measure(client, headers, "/chat/chats?limit=20", args.repeat),
+        "chats_deep_page": measure(client, headers, f"/chat/chats?limit=20&cursor={chat_cursor}", args.repeat),
+        "messages_all": measure(client, headers, "/chat/chats/1/messages", max(1, args.repeat // 10)),
+        "messages_latest_50": measure(client, headers, "/chat/chats/1/messages?latest=50", args.repeat),
+        "messages_deep_before": measure(client, headers,
+                                        f"/chat/chats/1/messages?before={message_cursor}&limit=50", args.repeat),
+    }
+    with app.app_context():
+        query = Message.query.filter_by(chat_id=1)
+        results["sql_offset_deep_page"] = measure_sql(
+            db, query.order_by(Message.created_at.desc(), Message.id.desc()).offset(depth).limit(50), args.repeat)
+        samples = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            _keyset_page(query, Message, 50, message_cursor, descending=True)
+            samples.append((time.perf_counter() - start) * 1000)
+            db.session.rollback()
+        results["sql_keyset_deep_page"] = _percentiles(samples)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=2000000)
+    parser.add_argument("--big-chat", type=int, default=200000, help="压测会话中的消息数")
+    parser.add_argument("--chats", type=int, default=5000, help="压测用户的会话数")
+    parser.add_argument("--users", type=int, default=1000, help="其他用户数")
+    parser.add_argument("--messages-per-chat", type=int, default=100, help="其他会话的平均消息数")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--database-url", help="空库的连接地址，默认使用临时 SQLite 数据库")
+    args = parser.parse_args()
+    args.big_chat = min(args.big_chat, args.messages)
+
+    workdir = tempfile.mkdtemp(prefix="bench_pagination_")
+    os.environ.update({
+        "DATABASE_URL": args.database_url or f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        "CHROMA_PERSIST_DIRECTORY": os.path.join(workdir, "chroma_db"),
+        "QUERY_EMBEDDING_CACHE_PATH": "",
+        "INGESTION_ENABLED": "false",
+    })
+
+    from flask_jwt_extended import create_access_token
+
+    from app import create_app, db
+    from app.models import Chat, Message, User
+
+    models = (User, Chat, Message)
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        started = time.perf_counter()
+        seed(db, models, args)
+        seed_seconds = time.perf_counter() - started
+        headers = {"Authorization": f"Bearer {create_access_token(identity=db.session.get(User, 1))}"}
+    client = app.test_client()
+
+    report = {
+        "backend": os.environ["DATABASE_URL"].split(":")[0],
+        "messages": args.messages,
+        "big_chat_messages": args.big_chat,
+        "user_chats": args.chats,
+        "seed_seconds": round(seed_seconds, 1),
+    }
+    report["without_composite_index"] = run_scenarios(app, db, models, client, headers, args)
+    with app.app_context():
+        create_indexes(db, models)
+    report["with_composite_index"] = run_scenarios(app, db, models, client, headers, args)
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""提示词窗口基准
+
+模拟一个持续数百轮的会话，按聊天接口的流程逐轮组装提示词并增量更新摘要，
+输出每隔若干轮的提示词 token 数和累计摘要次数，用来确认提示词大小有上界。
+摘要由一个截断拼接的假模型生成，不需要真实的 LLM。
+
+用法: python benchmarks/bench_prompt_window.py [--turns 300] [--budget 4000]
+"""
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.messages import AIMessage, HumanMessage  # noqa: E402
+
+from app.services.prompt_assembler import (  # noqa: E402
+    assemble_prompt, message_tokens, plan_summary, summarize,
+)
+
+
+class _FakeSummaryModel:
+    def invoke(self, prompt):
+        return AIMessage(content=prompt[-1].content[-500:])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=300)
+    parser.add_argument("--budget", type=int, default=4000)
+    parser.add_argument("--window", type=int, default=40)
+    args = parser.parse_args()
+
+    model = _FakeSummaryModel()
+    rows, summary, summary_until_id, summaries = [], None, 0, 0
+    report = []
+    next_id = 1
+    for turn in range(1, args.turns + 1):
+        question = f"第{turn}个问题：请问办理居住证需要准备哪些材料，在哪里办理？" * 2
+        window = rows[-args.window:]
+        history = [
+            (AIMessage if role == "assistant" else HumanMessage)(content=content, id=f"message-{row_id}")
+            for row_id, role, content, _ in window
+        ]
+        prompt = assemble_prompt("你是政务助手", history + [HumanMessage(question)],
+                                 args.budget, summary, summary_until_id)
+        prompt_tokens = sum(message_tokens(message) for message in prompt)
+
+        rows.append((next_id, "user", question, None))
+        rows.append((next_id + 1, "assistant", "需要身份证、户口本和居住证明，到街道便民服务中心办理。" * 6, None))
+        next_id += 2
+
+        # 与聊天接口一致：规划摘要时读取水位之后的全部消息，而不只是历史窗口
+        folded = plan_summary([row for row in rows if row[0] > summary_until_id], args.budget,
+                              summary_until_id, max_rows=args.window)
+        if folded:
+            summary = summarize(model, summary, folded)
+            summary_until_id = folded[-1][0]
+            summaries += 1
+        if turn == 1 or turn % 25 == 0:
+            report.append({"turn": turn, "prompt_messages": len(prompt),
+                           "prompt_tokens": prompt_tokens, "summaries": summaries})
+
+    print(json.dumps({"budget": args.budget, "turns": report}, indent=2))
+    assert all(item["prompt_tokens"] <= args.budget for item in report)
+
+
+if __name__ == "__main__":
+    main()
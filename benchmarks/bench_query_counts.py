@@ -0,0 +1,78 @@
+"""接口 SQL 语句数统计：每个需要登录的接口在一次请求中执行了多少条 SQL
+
+用 SQLAlchemy 的 before_cursor_execute 事件计数，分别统计用户身份缓存未命中（cold）
+和命中（warm）时的语句数，其中 user 表查询单独列出。修改资料后再次请求，
+确认缓存已失效、返回的是新资料。
+
+用法: python benchmarks/bench_query_counts.py
+"""
+import json
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def main():
+    workdir = tempfile.mkdtemp(prefix="bench_query_counts_")
+    os.environ.update({
+        "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        "CHROMA_PERSIST_DIRECTORY": os.path.join(workdir, "chroma_db"),
+        "QUERY_EMBEDDING_CACHE_PATH": "",
+        "INGESTION_ENABLED": "false",
+    })
+
+    from sqlalchemy import event
+
+    from app import create_app, db
+    from app.services.identity import get_identity_cache
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+    client = app.test_client()
+    client.post("/auth/register", json={"username": "bench", "password": "bench", "password_confirm": "bench"})
+    token = client.post("/auth/login", json={"username": "bench", "password": "bench"}).json["data"]["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    chat_id = client.post("/chat/chats", json={"title": "bench"}, headers=headers).json["data"]["id"]
+
+    statements = []
+    with app.app_context():
+        event.listen(db.engine, "before_cursor_execute",
+                     lambda conn, cursor, statement, *args: statements.append(statement))
+
+    endpoints = [
+        ("GET", "/user/profile", None),
+        ("GET", "/chat/chats", None),
+        ("GET", "/chat/chats?limit=20", None),
+        ("GET", f"/chat/chats/{chat_id}/messages?latest=50", None),
+        ("GET", "/repository/repositories", None),
+        ("PUT", "/user/profile", {"nickname": "renamed"}),
+    ]
+    results = []
+    for method, path, body in endpoints:
+        row = {"endpoint": f"{method} {path}"}
+        for phase in ("cold", "warm"):
+            if phase == "cold":
+                get_identity_cache(app.config).invalidate(1)
+            statements.clear()
+            response = client.open(path, method=method, json=body, headers=headers)
+            assert response.json["code"] == 200, response.json
+            row[f"{phase}_queries"] = len(statements)
+            row[f"{phase}_user_queries"] = sum(1 for s in statements if "FROM user" in s)
+        results.append(row)
+
+    # 修改资料后缓存失效：紧接着的读取返回新昵称
+    client.put("/user/profile", json={"nickname": "after-update"}, headers=headers)
+    nickname = client.get("/user/profile", headers=headers).json["data"]["nickname"]
+    print(json.dumps({
+        "results": results,
+        "profile_after_update": nickname,
+        "identity_cache": get_identity_cache(app.config).stats(),
+    }, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""流式聊天接口基准：纯文本流与 SSE 的首字节时间和帧数
+
+使用本地伪 OpenAI 服务（可配置首 token 延迟和 token 间隔）启动应用的 HTTP 服务，
+分别请求 /messages/stream 和 /messages/sse，记录首字节时间、首个回答片段的时间、
+总耗时以及客户端收到的帧（chunk）数。
+
+用法: python benchmarks/bench_sse.py [--rounds 5] [--tokens 200] [--token-interval 0.01]
+"""
+import argparse
+import http.client
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_servers import FakeOllamaServer, FakeOpenAIServer  # noqa: E402
+
+
+def _read_chunks(response):
+    """逐个读取 chunked 响应的数据块，返回 (到达时间, 数据) 列表"""
+    chunks = []
+    while True:
+        size_line = response.fp.readline()
+        size = int(size_line.split(b";")[0].strip() or b"0", 16)
+        if size == 0:
+            response.fp.readline()
+            break
+        data = response.fp.read(size)
+        response.fp.readline()
+        chunks.append((time.perf_counter(), data))
+    return chunks
+
+
+def _measure(port, path, body, headers, sse):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=120)
+    start = time.perf_counter()
+    conn.request("POST", path, body=json.dumps(body), headers=headers)
+    response = conn.getresponse()
+    chunks = _read_chunks(response)
+    conn.close()
+    if not chunks:
+        return None
+    first_content = None
+    frames = 0
+    for arrived, data in chunks:
+        text = data.decode("utf-8", errors="ignore")
+        if sse:
+            frames += text.count("\n\n")
+            if first_content is None and "event: token" in text:
+                first_content = arrived
+        else:
+            frames += 1
+            if first_content is None and text:
+                first_content = arrived
+    return {
+        "ttfb_ms": (chunks[0][0] - start) * 1000,
+        "first_content_ms": ((first_content or chunks[-1][0]) - start) * 1000,
+        "total_ms": (chunks[-1][0] - start) * 1000,
+        "frames": frames,
+        "network_chunks": len(chunks),
+    }
+
+
+def _summary(samples):
+    return {key: round(statistics.median(sample[key] for sample in samples), 1) for key in samples[0]}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--tokens", type=int, default=200)
+    parser.add_argument("--ttft", type=float, default=0.2)
+    parser.add_argument("--token-interval", type=float, default=0.01)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_sse_")
+    embedder = FakeOllamaServer().start()
+    llm = FakeOpenAIServer(ttft=args.ttft, token_interval=args.token_interval, answer_tokens=args.tokens).start()
+    os.environ.update({
+        "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        "EMBEDDINGS_URL": embedder.url,
+        "EMBEDDINGS_MODEL": embedder.model,
+        "CHROMA_PERSIST_DIRECTORY": os.path.join(workdir, "chroma_db"),
+        "QUERY_EMBEDDING_CACHE_PATH": "",
+        "INGESTION_ENABLED": "false",
+        "OPENAI_API_KEY": "bench",
+        "OPENAI_API_URL": llm.url,
+        # 每轮都在同一会话里提问，避免历史过长时触发摘要请求
+        "PROMPT_TOKEN_BUDGET": "100000",
+    })
+
+    from werkzeug.serving import make_server
+
+    from app import create_app, db
+    from app.models import Model
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        db.session.add(Model(name="fake", description="bench", is_active=True))
+        db.session.commit()
+    client = app.test_client()
+    client.post("/auth/register", json={"username": "bench", "password": "bench", "password_confirm": "bench"})
+    token = client.post("/auth/login", json={"username": "bench", "password": "bench"}).json["data"]["access_token"]
+    headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
+    chat = client.post("/chat/chats", json={"title": "bench"}, headers=headers).json["data"]
+
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_port
+
+    results = {}
+    for name, sse in (("stream", False), ("sse", True)):
+        samples = []
+        for i in range(args.rounds):
+            sample = _measure(port, f"/chat/chats/{chat['id']}/messages/{name}",
+                              {"content": f"问题{i}", "model_id": 1}, headers, sse)
+            if sample:
+                samples.append(sample)
+        results[name] = _summary(samples) if samples else None
+
+    print(json.dumps({
+        "tokens_per_answer": args.tokens,
+        "ttft_s": args.ttft,
+        "token_interval_s": args.token_interval,
+        "coalesce_chars": app.config["SSE_COALESCE_CHARS"],
+        "coalesce_ms": app.config["SSE_COALESCE_MS"],
+        "median": results,
+    }, indent=2, ensure_ascii=False))
+    server.shutdown()
+    llm.stop()
+    embedder.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+"""本地替身服务，供基准脚本在没有真实模型服务时使用
+
+FakeOllamaServer 实现 Ollama 的 /api/embed 接口：根据文本哈希生成确定的向量，
+可以配置每次请求的延迟和失败率，用来模拟慢速或不稳定的向量化服务。
+FakeOpenAIServer 实现 OpenAI 兼容的 /chat/completions 接口，按配置的首 token 延迟和
+token 间隔流式返回固定长度的回答。
+"""
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def fake_embedding(text: str, dimensions: int = 64):
+    digest = b""
+    counter = 0
+    while len(digest) < dimensions:
+        digest += hashlib.sha256(f"{counter}:{text}".encode("utf-8")).digest()
+        counter += 1
+    return [byte / 255.0 - 0.5 for byte in digest[:dimensions]]
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, handler, owner):
+        super().__init__(address, handler)
+        self.owner = owner
+
+
+class _OllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self._send_json(200, {"models": [{"name": self.server.owner.model}]})
+
+    def do_POST(self):
+        owner = self.server.owner
+        length = int(self.headers.get("Content-Length", 0))
+        data = json.loads(self.rfile.read(length) or b"{}")
+        texts = data.get("input", [])
+        if isinstance(texts, str):
+            texts = [texts]
+        owner.record(len(texts))
+        time.sleep(owner.latency + owner.latency_per_text * len(texts))
+        if owner.failure_rate and random.random() < owner.failure_rate:
+            self._send_json(503, {"error": "fake embedding failure"})
+            return
+        self._send_json(200, {
+            "model": data.get("model"),
+            "embeddings": [fake_embedding(text, owner.dimensions) for text in texts],
+        })
+
+
+class FakeOllamaServer:
+    def __init__(self, latency: float = 0.0, latency_per_text: float = 0.0, failure_rate: float = 0.0,
+                 dimensions: int = 64, model: str = "bge-m3"):
+        self.latency = latency
+        self.latency_per_text = latency_per_text
+        self.failure_rate = failure_rate
+        self.dimensions = dimensions
+        self.model = model
+        self.requests = 0
+        self.texts = 0
+        self._lock = threading.Lock()
+        self._server = None
+
+    def record(self, texts: int):
+        with self._lock:
+            self.requests += 1
+            self.texts += texts
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def start(self) -> "FakeOllamaServer":
+        self._server = _Server(("127.0.0.1", 0), _OllamaHandler, self)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+
+class _OpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _chunk(self, payload: bytes):
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(payload), payload))
+        self.wfile.flush()
+
+    def _event(self, delta: dict, finish_reason=None):
+        chunk = {"id": "fake", "object": "chat.completion.chunk", "created": 0, "model": "fake",
+                 "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+        self._chunk(("data: " + json.dumps(chunk, ensure_ascii=False) + "\n\n").encode("utf-8"))
+
+    def do_POST(self):
+        owner = self.server.owner
+        length = int(self.headers.get("Content-Length", 0))
+        data = json.loads(self.rfile.read(length) or b"{}")
+        owner.record(1)
+        tokens = owner.answer_tokens()
+        time.sleep(owner.ttft)
+        if not data.get("stream"):
+            body = json.dumps({
+                "id": "fake", "object": "chat.completion", "created": 0, "model": "fake",
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": "".join(tokens)}}],
+                "usage": {"prompt_tokens": 1, "completion_tokens": len(tokens), "total_tokens": len(tokens) + 1},
+            }, ensure_ascii=False).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for i, token in enumerate(tokens):
+            if i:
+                time.sleep(owner.token_interval)
+            self._event({"content": token})
+        self._event({}, "stop")
+        self._chunk(b"data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+
+class FakeOpenAIServer:
+    def __init__(self, ttft: float = 0.2, token_interval: float = 0.01, answer_tokens: int = 200):
+        self.ttft = ttft
+        self.token_interval = token_interval
+        self.tokens = answer_tokens
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server = None
+
+    def answer_tokens(self):
+        return [f"答{i % 10}" for i in range(self.tokens)]
+
+    def record(self, count: int):
+        with self._lock:
+            self.requests += count
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_address[1]}/v1"
+
+    def start(self) -> "FakeOpenAIServer":
+        self._server = _Server(("127.0.0.1", 0), _OpenAIHandler, self)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
@@ -0,0 +1,201 @@
+"""并发流式回答的负载测试：同步 worker 与 gevent worker 对比
+
+对每种配置用 gunicorn 启动应用（本地伪 OpenAI 服务按固定节奏流式返回回答），
+同时发起 --streams 个流式聊天请求，并持续请求会话列表这一非流式接口，记录：
+  - 同时处于输出中的流式回答数峰值、完成数
+  - 非流式接口的 p50/p95/p99 延迟
+
+用法: python benchmarks/load_test.py [--setups sync:4,gevent:1] [--streams 100] [--tokens 100]
+"""
+import argparse
+import http.client
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_servers import FakeOllamaServer, FakeOpenAIServer  # noqa: E402
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(len(values) * p))] * 1000, 1)
+
+
+def _prepare(env, streams):
+    """在独立进程中建表并创建用户、模型和会话，返回 (token, 会话 ID 列表)"""
+    script = (
+        "import json\n"
+        "from app import create_app, db\n"
+        "from app.models import Model\n"
+        "app = create_app()\n"
+        "with app.app_context():\n"
+        "    db.create_all()\n"
+        "    db.session.add(Model(name='fake', description='load', is_active=True))\n"
+        "    db.session.commit()\n"
+        "c = app.test_client()\n"
+        "c.post('/auth/register', json={'username': 'load', 'password': 'load', 'password_confirm': 'load'})\n"
+        "token = c.post('/auth/login', json={'username': 'load', 'password': 'load'}).json['data']['access_token']\n"
+        "h = {'Authorization': 'Bearer ' + token}\n"
+        f"chats = [c.post('/chat/chats', json={{'title': str(i)}}, headers=h).json['data']['id'] for i in range({streams})]\n"
+        "print('RESULT' + json.dumps({'token': token, 'chats': chats}))\n"
+    )
+    output = subprocess.run([sys.executable, "-c", script], cwd=ROOT, env=env, capture_output=True,
+                            text=True, check=True).stdout
+    line = [line for line in output.splitlines() if line.startswith("RESULT")][-1]
+    data = json.loads(line[len("RESULT"):])
+    return data["token"], data["chats"]
+
+
+def _wait_ready(port, headers, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+            conn.request("GET", "/chat/chats", headers=headers)
+            conn.getresponse().read()
+            conn.close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("gunicorn 未能启动")
+
+
+def run_setup(worker_class, workers, args, llm, embedder):
+    workdir = tempfile.mkdtemp(prefix=f"load_{worker_class}_")
+    port = _free_port()
+    env = dict(os.environ,
+               DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'load.db')}",
+               EMBEDDINGS_URL=embedder.url,
+               EMBEDDINGS_MODEL=embedder.model,
+               CHROMA_PERSIST_DIRECTORY=os.path.join(workdir, "chroma_db"),
+               QUERY_EMBEDDING_CACHE_PATH="",
+               INGESTION_ENABLED="false",
+               OPENAI_API_KEY="load",
+               OPENAI_API_URL=llm.url,
+               PROMPT_TOKEN_BUDGET="100000",
+               GUNICORN_BIND=f"127.0.0.1:{port}",
+               GUNICORN_WORKER_CLASS=worker_class,
+               GUNICORN_WORKERS=str(workers))
+    token, chats = _prepare(env, args.streams)
+    headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
+
+    server = subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "run:app"],
+                              cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        _wait_ready(port, headers)
+        lock = threading.Lock()
+        state = {"active": 0, "peak": 0, "completed": 0, "failed": 0}
+        first_bytes = []
+        finished = threading.Event()
+
+        def stream(chat_id):
+            try:
+                conn = http.client.HTTPConnection("127.0.0.1", port, timeout=args.timeout)
+                start = time.perf_counter()
+                conn.request("POST", f"/chat/chats/{chat_id}/messages/stream",
+                             body=json.dumps({"content": "你好", "model_id": 1}), headers=headers)
+                response = conn.getresponse()
+                response.read(1)
+                with lock:
+                    first_bytes.append(time.perf_counter() - start)
+                    state["active"] += 1
+                    state["peak"] = max(state["peak"], state["active"])
+                response.read()
+                conn.close()
+                with lock:
+                    state["active"] -= 1
+                    state["completed"] += 1
+            except Exception:
+                with lock:
+                    state["failed"] += 1
+
+        probes = []
+
+        def probe():
+            while not finished.is_set():
+                start = time.perf_counter()
+                try:
+                    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=args.timeout)
+                    conn.request("GET", "/chat/chats", headers=headers)
+                    conn.getresponse().read()
+                    conn.close()
+                    probes.append(time.perf_counter() - start)
+                except Exception:
+                    probes.append(args.timeout)
+                time.sleep(args.probe_interval)
+
+        started = time.perf_counter()
+        prober = threading.Thread(target=probe, daemon=True)
+        prober.start()
+        threads = [threading.Thread(target=stream, args=(chat_id,), daemon=True) for chat_id in chats]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(max(0.0, args.timeout - (time.perf_counter() - started)))
+        finished.set()
+        prober.join()
+        wall = time.perf_counter() - started
+
+        return {
+            "setup": f"{worker_class}:{workers}",
+            "streams": args.streams,
+            "completed": state["completed"],
+            "failed_or_timed_out": args.streams - state["completed"],
+            "peak_concurrent_streams": state["peak"],
+            "wall_seconds": round(wall, 2),
+            "stream_first_byte_p50_ms": _percentile(first_bytes, 0.5),
+            "stream_first_byte_p99_ms": _percentile(first_bytes, 0.99),
+            "probe_requests": len(probes),
+            "probe_p50_ms": _percentile(probes, 0.5),
+            "probe_p95_ms": _percentile(probes, 0.95),
+            "probe_p99_ms": _percentile(probes, 0.99),
+            "probe_mean_ms": round(statistics.mean(probes) * 1000, 1) if probes else None,
+        }
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--setups", default="sync:4,gevent:1",
+                        help="逗号分隔的 worker类型:进程数，例如 sync:4,gevent:1")
+    parser.add_argument("--streams", type=int, default=100)
+    parser.add_argument("--tokens", type=int, default=100)
+    parser.add_argument("--token-interval", type=float, default=0.02)
+    parser.add_argument("--ttft", type=float, default=0.2)
+    parser.add_argument("--probe-interval", type=float, default=0.05)
+    parser.add_argument("--timeout", type=float, default=120)
+    args = parser.parse_args()
+
+    llm = FakeOpenAIServer(ttft=args.ttft, token_interval=args.token_interval, answer_tokens=args.tokens).start()
+    embedder = FakeOllamaServer().start()
+    results = []
+    for setup in args.setups.split(","):
+        worker_class, _, workers = setup.partition(":")
+        results.append(run_setup(worker_class, int(workers or 1), args, llm, embedder))
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+    llm.stop()
+    embedder.stop()
+
+
+if __name__ == "__main__":
+    main()
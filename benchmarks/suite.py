@@ -0,0 +1,468 @@
+"""基准测试套件：用本地替身服务压测主要接口，输出可跨提交对比的 JSON
+
+启动伪 OpenAI 流式服务（可配置首 token 延迟和每秒 token 数）和伪 Ollama 向量化服务，
+在临时 SQLite（或 --database-url 指定的空库）中灌入用户、会话和历史消息，
+用 gunicorn 按 gunicorn.conf.py 启动应用后依次运行场景：
+  - login：POST /auth/login
+  - list_chats：GET /chat/chats?limit=20
+  - list_messages：GET /chat/chats/<id>/messages?latest=50
+  - chat_stream：POST /chat/chats/<id>/messages/sse，不带知识库
+  - chat_stream_rag：同上，带知识库（检索 + 生成）
+  - ingest：上传文件并轮询导入任务直到完成
+每个场景记录请求数、错误数和错误率、吞吐量、p50/p95/p99 延迟；流式场景另外记录
+首 token 时间（客户端收到第一个 token 事件）、单个回答的 token/s 和总的 token/s。
+
+结果写到 --output（默认打印到标准输出），带当前提交号和参数；
+--compare 传入另一次的结果文件时，附上各指标相对基线的变化。
+
+用法: python benchmarks/suite.py [--scenarios login,list_chats,...] [--concurrency 8] [--requests 200]
+      [--streams 20] [--ttft 0.2] [--tokens-per-second 50] [--output result.json] [--compare base.json]
+"""
+import argparse
+import http.client
+import json
+import math
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_servers import FakeOllamaServer, FakeOpenAIServer  # noqa: E402
+
+SCENARIOS = ["login", "list_chats", "list_messages", "chat_stream", "chat_stream_rag", "ingest"]
+PASSWORD = "bench-password"
+DOCUMENT_LINE = "办理居住证需要身份证、户口本和租房合同，材料齐全后到社区服务中心提交申请。\n"
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _distribution(values_ms):
+    if not values_ms:
+        return None
+    values = sorted(values_ms)
+
+    def pick(p):
+        return round(values[max(0, math.ceil(len(values) * p) - 1)], 2)
+
+    return {"p50": pick(0.5), "p95": pick(0.95), "p99": pick(0.99),
+            "mean": round(statistics.mean(values), 2), "max": round(values[-1], 2)}
+
+
+class Recorder:
+    """一个场景的计时结果（线程安全）"""
+
+    def __init__(self, name):
+        self.name = name
+        self.latencies = []
+        self.errors = 0
+        self.error_samples = []
+        self.ttfts = []
+        self.stream_rates = []
+        self.tokens = 0
+        self._lock = threading.Lock()
+        self.started = self.finished = None
+
+    def ok(self, seconds, ttft=None, tokens=0, generation_seconds=None):
+        with self._lock:
+            self.latencies.append(seconds * 1000)
+            if ttft is not None:
+                self.ttfts.append(ttft * 1000)
+            self.tokens += tokens
+            if tokens and generation_seconds:
+                self.stream_rates.append(tokens / generation_seconds)
+
+    def fail(self, reason):
+        with self._lock:
+            self.errors += 1
+            if len(self.error_samples) < 5:
+                self.error_samples.append(str(reason)[:200])
+
+    def summary(self):
+        wall = (self.finished or time.perf_counter()) - (self.started or time.perf_counter())
+        total = len(self.latencies) + self.errors
+        result = {
+            "requests": total,
+            "errors": self.errors,
+            "error_rate": round(self.errors / total, 4) if total else None,
+            "wall_seconds": round(wall, 2),
+            "throughput_rps": round(len(self.latencies) / wall, 2) if wall > 0 else None,
+            "latency_ms": _distribution(self.latencies),
+        }
+        if self.ttfts or self.stream_rates:
+            result.update({
+                "ttft_ms": _distribution(self.ttfts),
+                "tokens_per_second_per_stream": _distribution(self.stream_rates),
+                "tokens_delivered": self.tokens,
+                "tokens_per_second_total": round(self.tokens / wall, 1) if wall > 0 else None,
+            })
+        if self.error_samples:
+            result["error_samples"] = self.error_samples
+        return result
+
+
+class Client:
+    def __init__(self, port, timeout):
+        self.port = port
+        self.timeout = timeout
+
+    def request(self, method, path, body=None, headers=None):
+        """发送请求，返回 (HTTP 状态码, 解析后的 JSON)"""
+        conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=self.timeout)
+        try:
+            headers = dict(headers or {})
+            if isinstance(body, (dict, list)):
+                body = json.dumps(body)
+                headers["Content-Type"] = "application/json"
+            conn.request(method, path, body=body, headers=headers)
+            response = conn.getresponse()
+            raw = response.read()
+            return response.status, json.loads(raw) if raw else None
+        finally:
+            conn.close()
+
+    def upload(self, path, filename, content: bytes, headers):
+        boundary = uuid.uuid4().hex
+        body = (f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"{filename}\"\r\n"
+                f"Content-Type: text/plain\r\n\r\n").encode() + content + f"\r\n--{boundary}--\r\n".encode()
+        return self.request("POST", path, body=body,
+                            headers=dict(headers, **{"Content-Type": f"multipart/form-data; boundary={boundary}"}))
+
+    def sse(self, path, body, headers):
+        """请求 SSE 聊天接口，返回 (首 token 时间, 最后一个 token 时间, done 事件数据)"""
+        conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=self.timeout)
+        try:
+            conn.request("POST", path, body=json.dumps(body),
+                         headers=dict(headers, **{"Content-Type": "application/json"}))
+            response = conn.getresponse()
+            if response.status != 200 or "event-stream" not in (response.getheader("Content-Type") or ""):
+                raise RuntimeError(f"HTTP {response.status}: {response.read()[:200]!r}")
+            first_token = last_token = None
+            event, data_lines = None, []
+            while True:
+                line = response.readline()
+                if not line:
+                    raise RuntimeError("事件流在 done 之前结束")
+                line = line.decode("utf-8").rstrip("\r\n")
+                if line.startswith("event: "):
+                    event = line[len("event: "):]
+                elif line.startswith("data: "):
+                    data_lines.append(line[len("data: "):])
+                elif not line and event:
+                    data = json.loads("\n".join(data_lines)) if data_lines else None
+                    if event == "token":
+                        last_token = time.perf_counter()
+                        first_token = first_token or last_token
+                    elif event == "error":
+                        raise RuntimeError(f"error 事件: {data}")
+                    elif event == "done":
+                        return first_token, last_token, data
+                    event, data_lines = None, []
+        finally:
+            conn.close()
+
+
+def _run_closed_loop(recorder, concurrency, total, task):
+    """concurrency 个客户端循环执行 task，共 total 次"""
+    counter = iter(range(total))
+    counter_lock = threading.Lock()
+
+    def worker():
+        while True:
+            with counter_lock:
+                index = next(counter, None)
+            if index is None:
+                return
+            started = time.perf_counter()
+            try:
+                extra = task(index) or {}
+                recorder.ok(time.perf_counter() - started, **extra)
+            except Exception as e:
+                recorder.fail(e)
+
+    recorder.started = time.perf_counter()
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    recorder.finished = time.perf_counter()
+    return recorder.summary()
+
+
+def _expect_ok(status, data):
+    if status != 200 or not data or data.get("code") != 200:
+        raise RuntimeError(f"HTTP {status}: {json.dumps(data, ensure_ascii=False)[:200]}")
+    return data["data"]
+
+
+def _ingest_file(client, headers, repository_id, index, args, tag):
+    content = (f"{tag} 文档 {index}\n" + DOCUMENT_LINE * args.document_lines).encode("utf-8")
+    data = _expect_ok(*client.upload(f"/repository/repositories/{repository_id}/files?name=bench-{tag}-{index}",
+                                     f"bench-{tag}-{index}.txt", content, headers))
+    deadline = time.perf_counter() + args.timeout
+    while time.perf_counter() < deadline:
+        job = _expect_ok(*client.request("GET", f"/repository/repositories/{repository_id}/jobs/{data['job_id']}",
+                                         headers=headers))
+        if job["status"] == "done":
+            return
+        if job["status"] == "failed":
+            raise RuntimeError(f"导入失败: {job.get('error')}")
+        time.sleep(0.1)
+    raise RuntimeError("导入超时")
+
+
+def run_scenarios(port, seeded, args, llm):
+    client = Client(port, args.timeout)
+    headers = {"Authorization": f"Bearer {seeded['token']}"}
+    chats = seeded["chats"]
+    results = {}
+
+    # 知识库问答和导入场景共用一个知识库，先导入一份文档作为检索语料
+    repository_id = None
+    if {"chat_stream_rag", "ingest"} & set(args.scenarios):
+        repository_id = _expect_ok(*client.request("POST", "/repository/repositories",
+                                                   {"name": "bench", "remark": "suite"}, headers))["id"]
+        _ingest_file(client, headers, repository_id, 0, args, "warmup")
+
+    for name in args.scenarios:
+        recorder = Recorder(name)
+        if name == "login":
+            users = seeded["users"]
+            results[name] = _run_closed_loop(recorder, args.concurrency, args.requests, lambda i: _expect_ok(
+                *client.request("POST", "/auth/login", {"username": users[i % len(users)], "password": PASSWORD}))
+                and None)
+        elif name == "list_chats":
+            results[name] = _run_closed_loop(recorder, args.concurrency, args.requests, lambda i: _expect_ok(
+                *client.request("GET", "/chat/chats?limit=20", headers=headers)) and None)
+        elif name == "list_messages":
+            results[name] = _run_closed_loop(recorder, args.concurrency, args.requests, lambda i: _expect_ok(
+                *client.request("GET", f"/chat/chats/{chats[i % len(chats)]}/messages?latest=50",
+                                headers=headers)) and None)
+        elif name in ("chat_stream", "chat_stream_rag"):
+            def stream(i, rag=(name == "chat_stream_rag")):
+                body = {"content": "居住证需要什么材料" if rag else "你好", "model_id": seeded["model_id"]}
+                if rag:
+                    body["repository_id"] = repository_id
+                started = time.perf_counter()
+                first_token, last_token, done = client.sse(f"/chat/chats/{chats[i % len(chats)]}/messages/sse",
+                                                           body, headers)
+                if not done.get("completed") or first_token is None:
+                    raise RuntimeError(f"回答未完成: {done}")
+                tokens = done.get("usage", {}).get("tokens") or 0
+                return {"ttft": first_token - started, "tokens": tokens,
+                        "generation_seconds": (last_token - first_token) or None}
+
+            # 每个并发流使用自己的会话，轮数乘以流数为总请求数
+            results[name] = _run_closed_loop(recorder, args.streams, args.streams * args.stream_rounds, stream)
+        elif name == "ingest":
+            tag = uuid.uuid4().hex[:8]  # 文件内容按哈希去重，每次运行用不同的内容
+            results[name] = _run_closed_loop(recorder, args.ingest_concurrency, args.ingest_files,
+                                             lambda i: _ingest_file(client, headers, repository_id, i + 1, args, tag))
+    results["_fake_llm_requests"] = llm.requests
+
+    if repository_id is not None:
+        # 删除知识库同时删除上传的文件和向量集合
+        client.request("DELETE", f"/repository/repositories/{repository_id}", headers=headers)
+    return results
+
+
+def child_seed(args):
+    """建表并灌入数据：--users 个用户，用户 1 有 --chats 个会话，每个会话 --history 条历史消息"""
+    from app import create_app, db
+    from app.models import Chat, Message, Model
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        model = Model(name="fake", description="bench", is_active=True)
+        db.session.add(model)
+        db.session.commit()
+        model_id = model.id
+    client = app.test_client()
+    users = [f"bench{i}" for i in range(args.users)]
+    for username in users:
+        client.post("/auth/register", json={"username": username, "password": PASSWORD,
+                                            "password_confirm": PASSWORD})
+    token = client.post("/auth/login", json={"username": users[0], "password": PASSWORD}).json["data"]["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    chats = [client.post("/chat/chats", json={"title": f"会话 {i}"}, headers=headers).json["data"]["id"]
+             for i in range(args.chats)]
+    base = datetime.now(timezone.utc) - timedelta(days=1)
+    with app.app_context():
+        rows = [{"chat_id": chat_id, "role": "user" if n % 2 == 0 else "assistant",
+                 "content": f"历史消息 {n}：" + "办理居住证需要哪些材料" * 3,
+                 "created_at": base + timedelta(seconds=n)}
+                for chat_id in chats for n in range(args.history)]
+        for start in range(0, len(rows), 5000):
+            db.session.execute(Message.__table__.insert(), rows[start:start + 5000])
+        Chat.query.filter(Chat.id.in_(chats)).update({"titled": True}, synchronize_session=False)
+        db.session.commit()
+    print("RESULT" + json.dumps({"token": token, "users": users, "chats": chats, "model_id": model_id}))
+
+
+def _git_revision():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT,
+                                    capture_output=True, text=True).stdout.strip())
+        return commit or None, dirty
+    except OSError:
+        return None, None
+
+
+# 对比时使用的指标：(路径, 越小越好)
+COMPARED_METRICS = [
+    (("latency_ms", "p50"), True), (("latency_ms", "p95"), True), (("latency_ms", "p99"), True),
+    (("ttft_ms", "p50"), True), (("ttft_ms", "p95"), True),
+    (("tokens_per_second_total",), False), (("throughput_rps",), False), (("error_rate",), True),
+]
+
+
+def compare(current, baseline):
+    """各场景指标相对基线的变化：{场景: {指标: {base, current, change}}}，change 为相对变化比例"""
+    diff = {}
+    for name, result in current["scenarios"].items():
+        base = baseline.get("scenarios", {}).get(name)
+        if not isinstance(result, dict) or not isinstance(base, dict):
+            continue
+        rows = {}
+        for path, lower_is_better in COMPARED_METRICS:
+            old, new = base, result
+            for key in path:
+                old = old.get(key) if isinstance(old, dict) else None
+                new = new.get(key) if isinstance(new, dict) else None
+            if old is None or new is None:
+                continue
+            change = round((new - old) / old, 4) if old else None
+            rows[".".join(path)] = {"base": old, "current": new, "change": change,
+                                    "better": None if change is None or change == 0
+                                    else (change < 0) == lower_is_better}
+        diff[name] = rows
+    return {"baseline_commit": baseline.get("meta", {}).get("commit"), "scenarios": diff}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--database-url", help="空数据库地址，默认使用临时 SQLite")
+    parser.add_argument("--worker-class", default="gevent")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--users", type=int, default=5)
+    parser.add_argument("--chats", type=int, default=50)
+    parser.add_argument("--history", type=int, default=20, help="每个会话的历史消息数")
+    parser.add_argument("--concurrency", type=int, default=8, help="非流式场景的并发客户端数")
+    parser.add_argument("--requests", type=int, default=200, help="非流式场景的请求总数")
+    parser.add_argument("--streams", type=int, default=20, help="流式场景的并发数")
+    parser.add_argument("--stream-rounds", type=int, default=2)
+    parser.add_argument("--ingest-files", type=int, default=10)
+    parser.add_argument("--ingest-concurrency", type=int, default=2)
+    parser.add_argument("--document-lines", type=int, default=200)
+    parser.add_argument("--ttft", type=float, default=0.2, help="伪模型的首 token 延迟（秒）")
+    parser.add_argument("--tokens-per-second", type=float, default=50, help="伪模型每个回答的输出速度")
+    parser.add_argument("--answer-tokens", type=int, default=100)
+    parser.add_argument("--embed-latency", type=float, default=0.01, help="伪向量化服务每次请求的延迟（秒）")
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--output", help="结果 JSON 文件，默认打印到标准输出")
+    parser.add_argument("--compare", help="作为基线的另一次结果文件")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    args.scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"未知场景: {', '.join(sorted(unknown))}")
+
+    if args.child == "seed":
+        child_seed(args)
+        return
+
+    llm = FakeOpenAIServer(ttft=args.ttft, token_interval=1 / args.tokens_per_second,
+                           answer_tokens=args.answer_tokens).start()
+    embedder = FakeOllamaServer(latency=args.embed_latency).start()
+    workdir = tempfile.mkdtemp(prefix="bench_suite_")
+    port = _free_port()
+    env = dict(os.environ,
+               DATABASE_URL=args.database_url or f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+               EMBEDDINGS_URL=embedder.url,
+               EMBEDDINGS_MODEL=embedder.model,
+               CHROMA_PERSIST_DIRECTORY=os.path.join(workdir, "chroma_db"),
+               LEXICAL_INDEX_DIRECTORY=os.path.join(workdir, "chroma_db", "lexical"),
+               MESSAGE_JOURNAL_DIRECTORY=os.path.join(workdir, "message_journal"),
+               QUERY_EMBEDDING_CACHE_PATH="",
+               OPENAI_API_KEY="bench",
+               OPENAI_API_URL=llm.url,
+               INGESTION_POLL_INTERVAL="1",
+               GUNICORN_BIND=f"127.0.0.1:{port}",
+               GUNICORN_WORKER_CLASS=args.worker_class,
+               GUNICORN_WORKERS=str(args.workers))
+
+    # 灌数据的进程不启动导入调度，避免和 gunicorn worker 抢同一批任务
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", "seed",
+                             "--users", str(args.users), "--chats", str(args.chats), "--history", str(args.history)],
+                            cwd=ROOT, env=dict(env, INGESTION_ENABLED="false"), capture_output=True, text=True)
+    lines = [line for line in output.stdout.splitlines() if line.startswith("RESULT")]
+    if not lines:
+        sys.exit(f"灌入数据失败:\n{output.stderr[-2000:]}")
+    seeded = json.loads(lines[-1][len("RESULT"):])
+
+    server = subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "run:app"],
+                              cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        client = Client(port, 5)
+        deadline = time.time() + 60
+        while True:
+            try:
+                client.request("GET", "/model/models")
+                break
+            except OSError:
+                if time.time() > deadline or server.poll() is not None:
+                    sys.exit("gunicorn 未能启动")
+                time.sleep(0.2)
+        results = run_scenarios(port, seeded, args, llm)
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+        llm.stop()
+        embedder.stop()
+
+    commit, dirty = _git_revision()
+    report = {
+        "meta": {
+            "commit": commit,
+            "dirty": dirty,
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "cpus": os.cpu_count(),
+            "database": (args.database_url or "sqlite").split(":", 1)[0],
+            "args": {key: value for key, value in vars(args).items()
+                     if key not in ("output", "compare", "child", "database_url")},
+        },
+        "scenarios": {name: value for name, value in results.items() if not name.startswith("_")},
+        "fake_llm_requests": results.get("_fake_llm_requests"),
+    }
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            report["comparison"] = compare(report, json.load(f))
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
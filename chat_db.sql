@@ -17,6 +17,21 @@
 SET NAMES utf8mb4;
 SET FOREIGN_KEY_CHECKS = 0;
 
+-- ----------------------------
+-- Table structure for cache_version
+-- ----------------------------
+DROP TABLE IF EXISTS `cache_version`;
+CREATE TABLE `cache_version`  (
+  `name` varchar(50) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci NOT NULL,
+  `version` int NOT NULL DEFAULT 0,
+  PRIMARY KEY (`name`) USING BTREE
+) ENGINE = InnoDB CHARACTER SET = utf8mb4 COLLATE = utf8mb4_0900_ai_ci ROW_FORMAT = Dynamic;
+
+-- ----------------------------
+-- Records of cache_version
+-- ----------------------------
+INSERT INTO `cache_version` VALUES ('model', 0);
+
 -- ----------------------------
 -- Table structure for chat
 -- ----------------------------
@@ -25,9 +40,14 @@ CREATE TABLE `chat`  (
   `id` int NOT NULL AUTO_INCREMENT,
   `user_id` int NOT NULL,
   `title` varchar(100) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci NOT NULL,
+  `summary` text CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci NULL,
+  `summary_until_id` int NULL DEFAULT 0,
+  `titled` tinyint(1) NOT NULL DEFAULT 0,
   `created_at` datetime NULL DEFAULT NULL,
   PRIMARY KEY (`id`) USING BTREE,
   INDEX `user_id`(`user_id` ASC) USING BTREE,
+  INDEX `user_created`(`user_id` ASC, `created_at` ASC, `id` ASC) USING BTREE,
+  FULLTEXT INDEX `ft_title`(`title`) WITH PARSER `ngram`,
   CONSTRAINT `chat_ibfk_1` FOREIGN KEY (`user_id`) REFERENCES `user` (`id`) ON DELETE RESTRICT ON UPDATE RESTRICT
 ) ENGINE = InnoDB CHARACTER SET = utf8mb4 COLLATE = utf8mb4_0900_ai_ci ROW_FORMAT = Dynamic;
 
@@ -35,6 +55,33 @@ CREATE TABLE `chat`  (
 -- Records of chat
 -- ----------------------------
 
+-- ----------------------------
+-- Table structure for ingestion_job
+-- ----------------------------
+DROP TABLE IF EXISTS `ingestion_job`;
+CREATE TABLE `ingestion_job`  (
+  `id` int NOT NULL AUTO_INCREMENT,
+  `repository_id` int NOT NULL,
+  `repository_file_id` int NOT NULL,
+  `file_id` varchar(255) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci NOT NULL,
+  `file_path` varchar(512) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci NOT NULL,
+  `file_type` int NOT NULL,
+  `status` varchar(20) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci NOT NULL DEFAULT 'queued',
+  `total_chunks` int NULL DEFAULT 0,
+  `processed_chunks` int NULL DEFAULT 0,
+  `attempts` int NULL DEFAULT 0,
+  `error` varchar(1000) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci NULL DEFAULT NULL,
+  `created_at` datetime NULL DEFAULT NULL,
+  `updated_at` datetime NULL DEFAULT NULL,
+  PRIMARY KEY (`id`) USING BTREE,
+  INDEX `status_updated_at`(`status` ASC, `updated_at` ASC) USING BTREE,
+  INDEX `repository_file_id`(`repository_file_id` ASC) USING BTREE
+) ENGINE = InnoDB CHARACTER SET = utf8mb4 COLLATE = utf8mb4_0900_ai_ci ROW_FORMAT = Dynamic;
+
+-- ----------------------------
+-- Records of ingestion_job
+-- ----------------------------
+
 -- ----------------------------
 -- Table structure for message
 -- ----------------------------
@@ -45,8 +92,12 @@ CREATE TABLE `message`  (
   `role` varchar(20) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci NOT NULL,
   `content` text CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci NOT NULL,
   `created_at` datetime NULL DEFAULT NULL,
+  `journal_key` varchar(32) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci NULL DEFAULT NULL,
   PRIMARY KEY (`id`) USING BTREE,
+  UNIQUE INDEX `journal_key`(`journal_key` ASC) USING BTREE,
   INDEX `chat_id`(`chat_id` ASC) USING BTREE,
+  INDEX `chat_created`(`chat_id` ASC, `created_at` ASC, `id` ASC) USING BTREE,
+  FULLTEXT INDEX `ft_content`(`content`) WITH PARSER `ngram`,
   CONSTRAINT `message_ibfk_1` FOREIGN KEY (`chat_id`) REFERENCES `chat` (`id`) ON DELETE RESTRICT ON UPDATE RESTRICT
 ) ENGINE = InnoDB CHARACTER SET = utf8mb4 COLLATE = utf8mb4_0900_ai_ci ROW_FORMAT = Dynamic;
 
@@ -83,7 +134,9 @@ CREATE TABLE `repository`  (
   `remark` varchar(255) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci NULL DEFAULT NULL,
   `created_at` datetime NULL DEFAULT NULL,
   `user_id` int NOT NULL,
-  PRIMARY KEY (`id`) USING BTREE
+  `content_version` int NULL DEFAULT 0,
+  PRIMARY KEY (`id`) USING BTREE,
+  FULLTEXT INDEX `ft_name_remark`(`name`, `remark`) WITH PARSER `ngram`
 ) ENGINE = InnoDB CHARACTER SET = utf8mb4 COLLATE = utf8mb4_0900_ai_ci ROW_FORMAT = Dynamic;
 
 -- ----------------------------
@@ -102,9 +155,13 @@ CREATE TABLE `repository_file`  (
   `size` int NOT NULL,
   `type` int NOT NULL,
   `file_id` varchar(255) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci NOT NULL,
+  `content_hash` varchar(64) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci NULL DEFAULT NULL,
+  `chunk_count` int NULL DEFAULT 0,
+  `status` varchar(20) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci NOT NULL DEFAULT 'queued',
   `created_at` datetime NULL DEFAULT NULL,
   PRIMARY KEY (`id`) USING BTREE,
   INDEX `repository_id`(`repository_id` ASC) USING BTREE,
+  INDEX `repository_content_hash`(`repository_id` ASC, `content_hash` ASC) USING BTREE,
   CONSTRAINT `repository_file_ibfk_1` FOREIGN KEY (`repository_id`) REFERENCES `repository` (`id`) ON DELETE RESTRICT ON UPDATE RESTRICT
 ) ENGINE = InnoDB CHARACTER SET = utf8mb4 COLLATE = utf8mb4_0900_ai_ci ROW_FORMAT = Dynamic;
 
@@ -0,0 +1,48 @@
+import base64
+from datetime import datetime
+from typing import Optional, Tuple
+
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    """把排序键 (created_at, id) 编码为不透明的游标"""
+    raw = f"{created_at.replace(tzinfo=None).isoformat()}|{row_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """解析游标，格式不正确时抛出 ValueError"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, row_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(created_at), int(row_id)
+    except Exception:
+        raise ValueError("分页游标无效")
+
+
+def parse_limit(value: Optional[str], default: int = 20, maximum: int = 100) -> int:
+    """解析每页条数，限制在 1 到 maximum 之间"""
+    if value in (None, ""):
+        return default
+    try:
+        return max(1, min(int(value), maximum))
+    except ValueError:
+        raise ValueError("limit 必须是整数")
+
+
+def encode_offset(offset: int) -> str:
+    """按相关度排序的结果没有稳定的排序键，游标只记录偏移量"""
+    return base64.urlsafe_b64encode(f"offset|{offset}".encode()).decode().rstrip("=")
+
+
+def decode_offset(cursor: Optional[str]) -> int:
+    """解析偏移量游标，空游标返回 0，格式不正确时抛出 ValueError"""
+    if not cursor:
+        return 0
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        kind, offset = raw.split("|", 1)
+        if kind != "offset" or int(offset) < 0:
+            raise ValueError
+        return int(offset)
+    except Exception:
+        raise ValueError("分页游标无效")
@@ -8,6 +8,15 @@ class Config:
     SECRET_KEY = os.getenv('SECRET_KEY', 'dev')
     SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # 数据库连接池（每个 worker 进程一个）：流式回答期间不占用连接，少量连接即可支撑大量并发回答；
+    # 连接数上限为 worker 数 ×（DB_POOL_SIZE + DB_MAX_OVERFLOW），需小于 MySQL 的 max_connections
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_size': int(os.getenv('DB_POOL_SIZE', 10)),
+        'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', 10)),
+        'pool_timeout': int(os.getenv('DB_POOL_TIMEOUT', 10)),  # 等待空闲连接的最长秒数
+        'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', 1800)),  # 连接使用超过该秒数后重建，需小于 MySQL 的 wait_timeout
+        'pool_pre_ping': os.getenv('DB_POOL_PRE_PING', 'true').lower() == 'true',  # 取出连接时先检测是否可用
+    }
     # OpenAI配置
     OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
     OPENAI_API_URL = os.getenv('OPENAI_API_URL')
@@ -15,6 +24,81 @@ class Config:
     MODULE_PROMPT = os.getenv('MODULE_PROMPT')
     EMBEDDINGS_URL = os.getenv('EMBEDDINGS_URL')
     EMBEDDINGS_MODEL = os.getenv('EMBEDDINGS_MODEL')
+    # 模型客户端池配置（每个 worker 进程一个池）
+    MODEL_POOL_MAX_SIZE = int(os.getenv('MODEL_POOL_MAX_SIZE', 8))
+    MODEL_POOL_IDLE_TTL = int(os.getenv('MODEL_POOL_IDLE_TTL', 600))
+    # 模型目录缓存：每隔多少秒检查一次目录版本，其他 worker 修改模型后最多延迟这么久生效
+    MODEL_CATALOG_CHECK_SECONDS = int(os.getenv('MODEL_CATALOG_CHECK_SECONDS', 5))
+    # 会话历史窗口：每个会话在内存中保留的消息条数，以及每个 worker 最多缓存的会话数
+    CHAT_HISTORY_WINDOW = int(os.getenv('CHAT_HISTORY_WINDOW', 40))
+    CHAT_HISTORY_MAX_THREADS = int(os.getenv('CHAT_HISTORY_MAX_THREADS', 1024))
+    # 提示词 token 预算，MODEL_TOKEN_BUDGETS 为按模型名配置的 JSON，例如 {"qwen": 8000}
+    PROMPT_TOKEN_BUDGET = int(os.getenv('PROMPT_TOKEN_BUDGET', 4000))
+    MODEL_TOKEN_BUDGETS = os.getenv('MODEL_TOKEN_BUDGETS', '{}')
+    # 向量数据库配置
+    CHROMA_PERSIST_DIRECTORY = os.getenv('CHROMA_PERSIST_DIRECTORY', 'chroma_db')
+    VECTOR_STORE_CACHE_SIZE = int(os.getenv('VECTOR_STORE_CACHE_SIZE', 32))
+    VECTOR_STORE_CACHE_TTL = int(os.getenv('VECTOR_STORE_CACHE_TTL', 1800))
+    VECTOR_STORE_MEMORY_LIMIT_MB = int(os.getenv('VECTOR_STORE_MEMORY_LIMIT_MB', 0))  # 0 表示不限制
+    # 知识库文件后台导入
+    INGESTION_ENABLED = os.getenv('INGESTION_ENABLED', 'true').lower() == 'true'
+    INGESTION_PARSE_WORKERS = int(os.getenv('INGESTION_PARSE_WORKERS', 2))  # 解析进程数
+    INGESTION_EMBED_WORKERS = int(os.getenv('INGESTION_EMBED_WORKERS', 2))  # 同时向量化的任务数
+    INGESTION_POLL_INTERVAL = int(os.getenv('INGESTION_POLL_INTERVAL', 5))
+    INGESTION_JOB_LEASE = int(os.getenv('INGESTION_JOB_LEASE', 600))  # 超过该秒数无心跳的任务重新排队
+    INGESTION_MAX_ATTEMPTS = int(os.getenv('INGESTION_MAX_ATTEMPTS', 3))
+    INGESTION_PAGES_PER_TASK = int(os.getenv('INGESTION_PAGES_PER_TASK', 10))  # 每个解析任务的 PDF 页数
+    # 文档向量化：每批块数、同时在途的请求数、失败批次的最大重试次数
+    EMBEDDING_BATCH_SIZE = int(os.getenv('EMBEDDING_BATCH_SIZE', 32))
+    EMBEDDING_MAX_IN_FLIGHT = int(os.getenv('EMBEDDING_MAX_IN_FLIGHT', 4))
+    EMBEDDING_MAX_RETRIES = int(os.getenv('EMBEDDING_MAX_RETRIES', 5))
+    # 查询向量缓存：进程内条数上限；QUERY_EMBEDDING_CACHE_PATH 非空时启用跨 worker 共享的磁盘缓存
+    QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv('QUERY_EMBEDDING_CACHE_SIZE', 2048))
+    QUERY_EMBEDDING_CACHE_PATH = os.getenv('QUERY_EMBEDDING_CACHE_PATH', 'chroma_db/query_embedding_cache.sqlite3')
+    QUERY_EMBEDDING_CACHE_DISK_MAX = int(os.getenv('QUERY_EMBEDDING_CACHE_DISK_MAX', 100000))
+    # 文档块向量按内容寻址存放在同一磁盘缓存文件中，相同的块不重复向量化；此为最多保留的块数
+    CHUNK_EMBEDDING_CACHE_DISK_MAX = int(os.getenv('CHUNK_EMBEDDING_CACHE_DISK_MAX', 200000))
+    # 知识库问答的语义答案缓存（默认关闭）
+    ANSWER_CACHE_ENABLED = os.getenv('ANSWER_CACHE_ENABLED', 'false').lower() == 'true'
+    ANSWER_CACHE_THRESHOLD = float(os.getenv('ANSWER_CACHE_THRESHOLD', 0.95))  # 问题向量的余弦相似度阈值
+    ANSWER_CACHE_MAX_ENTRIES = int(os.getenv('ANSWER_CACHE_MAX_ENTRIES', 256))  # 每个命名空间的答案数上限
+    ANSWER_CACHE_MAX_NAMESPACES = int(os.getenv('ANSWER_CACHE_MAX_NAMESPACES', 128))
+    ANSWER_CACHE_TTL = int(os.getenv('ANSWER_CACHE_TTL', 86400))
+    ANSWER_CACHE_PROMPT_VERSION = os.getenv('ANSWER_CACHE_PROMPT_VERSION', '1')  # 修改后旧答案全部失效
+    # 知识库检索：关键词（BM25）与向量检索各取 RETRIEVAL_FETCH_K 个候选，融合并经 MMR 去重后返回 RETRIEVAL_K 个
+    RETRIEVAL_K = int(os.getenv('RETRIEVAL_K', 2))
+    RETRIEVAL_FETCH_K = int(os.getenv('RETRIEVAL_FETCH_K', 20))
+    RETRIEVAL_MMR_LAMBDA = float(os.getenv('RETRIEVAL_MMR_LAMBDA', 0.5))  # 越大越看重相关性，越小越看重多样性
+    LEXICAL_INDEX_ENABLED = os.getenv('LEXICAL_INDEX_ENABLED', 'true').lower() == 'true'
+    LEXICAL_INDEX_DIRECTORY = os.getenv('LEXICAL_INDEX_DIRECTORY', '')  # 默认在 CHROMA_PERSIST_DIRECTORY/lexical 下
+    LEXICAL_INDEX_MAX_SEGMENTS = int(os.getenv('LEXICAL_INDEX_MAX_SEGMENTS', 8))  # 段数超过后合并
+    # 关键词结果覆盖全部查询词的比例不低于该值时跳过向量检索（设为大于 1 的值则关闭）
+    LEXICAL_FAST_PATH_THRESHOLD = float(os.getenv('LEXICAL_FAST_PATH_THRESHOLD', 0.9))
+    # SSE 聊天接口：token 按长度或时间合并成帧，空闲时发送心跳，结束后的事件保留一段时间用于续传
+    SSE_COALESCE_CHARS = int(os.getenv('SSE_COALESCE_CHARS', 32))
+    SSE_COALESCE_MS = int(os.getenv('SSE_COALESCE_MS', 50))
+    SSE_HEARTBEAT_SECONDS = int(os.getenv('SSE_HEARTBEAT_SECONDS', 15))
+    SSE_REPLAY_TTL = int(os.getenv('SSE_REPLAY_TTL', 300))
+
+    # 搜索：需与 MySQL 的 ngram_token_size 一致，短于它的搜索词退回 LIKE 查询
+    SEARCH_NGRAM_TOKEN_SIZE = int(os.getenv('SEARCH_NGRAM_TOKEN_SIZE', 2))
+    SEARCH_SNIPPET_CHARS = int(os.getenv('SEARCH_SNIPPET_CHARS', 80))  # 结果片段的字符数
+
+    # 回答消息的后写日志：先追加到本地日志文件，再由后台线程批量写库；关闭时回答直接写库
+    MESSAGE_JOURNAL_ENABLED = os.getenv('MESSAGE_JOURNAL_ENABLED', 'true').lower() == 'true'
+    MESSAGE_JOURNAL_DIRECTORY = os.getenv('MESSAGE_JOURNAL_DIRECTORY', 'message_journal')  # 需持久化，崩溃后据此重放
+    MESSAGE_JOURNAL_BATCH_SIZE = int(os.getenv('MESSAGE_JOURNAL_BATCH_SIZE', 100))  # 每条 INSERT 的最大行数
+    MESSAGE_JOURNAL_FLUSH_MS = int(os.getenv('MESSAGE_JOURNAL_FLUSH_MS', 200))  # 写库间隔，也是其他 worker 读到回答的最大延迟
+    MESSAGE_JOURNAL_MAX_PENDING = int(os.getenv('MESSAGE_JOURNAL_MAX_PENDING', 5000))  # 内存队列上限，超出部分只写日志文件
+    MESSAGE_JOURNAL_FSYNC = os.getenv('MESSAGE_JOURNAL_FSYNC', 'false').lower() == 'true'  # 每条消息 fsync，防断电丢失
+
+    # 指标与健康检查：/metrics 输出 Prometheus 文本格式，gunicorn 启动时自动设置 METRICS_DIRECTORY 用于合并各 worker 的指标
+    METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+    METRICS_DIRECTORY = os.getenv('METRICS_DIRECTORY', '')
+    METRICS_FLUSH_SECONDS = float(os.getenv('METRICS_FLUSH_SECONDS', 5))  # 各 worker 写出指标快照的间隔
+    METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')  # 非空时 /metrics 和 /ops/* 需要携带 Bearer 令牌
+    HEALTH_CHECK_TIMEOUT = float(os.getenv('HEALTH_CHECK_TIMEOUT', 2))  # /health/ready 等待各项检查的最长秒数
+    HEALTH_READY_CACHE_SECONDS = float(os.getenv('HEALTH_READY_CACHE_SECONDS', 5))
 
     # Wechat配置
     WECHAT_APPID = os.getenv('WECHAT_APPID')
@@ -23,3 +107,6 @@ class Config:
     JWT_SECRET_KEY = os.getenv('JWT_SECRET_KEY', 'dev')
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(days=1)
     JWT_REFRESH_TOKEN_EXPIRES = timedelta(days=30)
+    # 已登录用户身份缓存（每个 worker 进程一份）：其他 worker 修改资料后最多延迟 USER_CACHE_TTL 秒可见，设为 0 关闭
+    USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', 10000))
+    USER_CACHE_TTL = int(os.getenv('USER_CACHE_TTL', 60))
@@ -0,0 +1,47 @@
+"""gunicorn 配置
+
+默认使用 gevent worker：模型流式输出、向量化请求（httpx）和 PyMySQL 的网络 I/O
+在协程之间切换，单个进程可以同时保持数百个流式回答，其他接口不会排在长连接后面。
+文档解析等 CPU 密集的工作已经放在导入任务的进程池中执行，不会阻塞事件循环。
+
+GUNICORN_WORKER_CLASS=sync 可以回到原来的同步 worker（每个 worker 同时只处理一个请求）。
+"""
+import os
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:5000')
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gevent')
+workers = int(os.getenv('GUNICORN_WORKERS', 4))
+# gevent worker 每个进程同时处理的连接数上限
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', 1000))
+# 仅对 gthread worker 生效
+threads = int(os.getenv('GUNICORN_THREADS', 1))
+# 异步 worker 中 timeout 只用于检测卡死的进程，不限制单个流式请求的时长
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 120))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 5))
+
+
+def on_starting(server):
+    """为本次启动准备合并各 worker 指标的快照目录（见 app/services/metrics.py）
+
+    未配置 METRICS_DIRECTORY 时按主进程 PID 在临时目录下创建；配置了则清空上一次启动遗留的快照，
+    避免已退出 worker 的计数混入本次启动。worker 在 fork 后才加载应用，从环境变量读取该目录。
+    """
+    import glob
+    import tempfile
+    directory = os.environ.get('METRICS_DIRECTORY')
+    if not directory:
+        directory = os.path.join(tempfile.gettempdir(), f"chat-metrics-{os.getpid()}")
+        os.environ['METRICS_DIRECTORY'] = directory
+    os.makedirs(directory, exist_ok=True)
+    for path in glob.glob(os.path.join(directory, '*.json')):
+        os.remove(path)
+
+
+def on_exit(server):
+    import shutil
+    import tempfile
+    directory = os.environ.get('METRICS_DIRECTORY', '')
+    if os.path.basename(directory) == f"chat-metrics-{os.getpid()}" and \
+            os.path.dirname(directory) == tempfile.gettempdir():
+        shutil.rmtree(directory, ignore_errors=True)
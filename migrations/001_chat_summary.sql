@@ -0,0 +1,4 @@
+-- 会话滚动摘要：已有数据库执行本脚本，新库由 chat_db.sql 直接创建
+ALTER TABLE `chat`
+  ADD COLUMN `summary` text CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci NULL AFTER `title`,
+  ADD COLUMN `summary_until_id` int NULL DEFAULT 0 AFTER `summary`;
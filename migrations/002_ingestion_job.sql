@@ -0,0 +1,19 @@
+-- 知识库文件后台导入任务表
+CREATE TABLE IF NOT EXISTS `ingestion_job`  (
+  `id` int NOT NULL AUTO_INCREMENT,
+  `repository_id` int NOT NULL,
+  `repository_file_id` int NOT NULL,
+  `file_id` varchar(255) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci NOT NULL,
+  `file_path` varchar(512) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci NOT NULL,
+  `file_type` int NOT NULL,
+  `status` varchar(20) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci NOT NULL DEFAULT 'queued',
+  `total_chunks` int NULL DEFAULT 0,
+  `processed_chunks` int NULL DEFAULT 0,
+  `attempts` int NULL DEFAULT 0,
+  `error` varchar(1000) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci NULL DEFAULT NULL,
+  `created_at` datetime NULL DEFAULT NULL,
+  `updated_at` datetime NULL DEFAULT NULL,
+  PRIMARY KEY (`id`) USING BTREE,
+  INDEX `status_updated_at`(`status` ASC, `updated_at` ASC) USING BTREE,
+  INDEX `repository_file_id`(`repository_file_id` ASC) USING BTREE
+) ENGINE = InnoDB CHARACTER SET = utf8mb4 COLLATE = utf8mb4_0900_ai_ci ROW_FORMAT = Dynamic;
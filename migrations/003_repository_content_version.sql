@@ -0,0 +1,3 @@
+-- 知识库内容版本：文件增删时递增，用于答案缓存失效
+ALTER TABLE `repository`
+  ADD COLUMN `content_version` int NULL DEFAULT 0 AFTER `user_id`;
@@ -0,0 +1,4 @@
+-- 知识库文件内容哈希：相同内容的文件复用已有向量
+ALTER TABLE `repository_file`
+  ADD COLUMN `content_hash` varchar(64) NULL DEFAULT NULL AFTER `file_id`,
+  ADD INDEX `repository_content_hash`(`repository_id` ASC, `content_hash` ASC) USING BTREE;
@@ -0,0 +1,15 @@
+-- 知识库文件清单：块数和导入状态，列表、统计和校验读取清单而不是扫描向量库
+ALTER TABLE `repository_file`
+  ADD COLUMN `chunk_count` int NULL DEFAULT 0 AFTER `content_hash`,
+  ADD COLUMN `status` varchar(20) NOT NULL DEFAULT 'queued' AFTER `chunk_count`;
+
+-- 按导入任务回填；没有导入任务的文件是同步导入时代上传的，视为已完成（块数未知，记为 0）
+UPDATE `repository_file` f
+  JOIN `ingestion_job` j ON j.`repository_file_id` = f.`id`
+  SET f.`chunk_count` = j.`total_chunks`,
+      f.`status` = CASE j.`status` WHEN 'done' THEN 'ready' WHEN 'failed' THEN 'failed'
+                   WHEN 'queued' THEN 'queued' ELSE 'ingesting' END;
+UPDATE `repository_file` f
+  LEFT JOIN `ingestion_job` j ON j.`repository_file_id` = f.`id`
+  SET f.`status` = 'ready'
+  WHERE j.`id` IS NULL;
@@ -0,0 +1,7 @@
+-- 会话列表和消息按 (created_at, id) 键集分页，组合索引让游标定位和排序都走索引
+-- 保留 message.chat_id 索引：摘要窗口按 (chat_id, id) 读取消息时依赖它的隐含主键顺序
+ALTER TABLE `chat`
+  ADD INDEX `user_created`(`user_id` ASC, `created_at` ASC, `id` ASC) USING BTREE;
+
+ALTER TABLE `message`
+  ADD INDEX `chat_created`(`chat_id` ASC, `created_at` ASC, `id` ASC) USING BTREE;
@@ -0,0 +1,8 @@
+-- 进程内缓存的版本号：写入对应的表时在同一事务中递增，各 worker 发现版本变化后重新加载
+CREATE TABLE IF NOT EXISTS `cache_version`  (
+  `name` varchar(50) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci NOT NULL,
+  `version` int NOT NULL DEFAULT 0,
+  PRIMARY KEY (`name`) USING BTREE
+) ENGINE = InnoDB CHARACTER SET = utf8mb4 COLLATE = utf8mb4_0900_ai_ci ROW_FORMAT = Dynamic;
+
+INSERT IGNORE INTO `cache_version` VALUES ('model', 0);
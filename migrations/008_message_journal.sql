@@ -0,0 +1,11 @@
+-- 会话是否已经按第一条消息设置过标题，发送消息时不再 COUNT(*) 消息表
+ALTER TABLE `chat`
+  ADD COLUMN `titled` tinyint(1) NOT NULL DEFAULT 0 AFTER `summary_until_id`;
+
+UPDATE `chat` SET `titled` = 1
+WHERE EXISTS (SELECT 1 FROM `message` WHERE `message`.`chat_id` = `chat`.`id`);
+
+-- 回答消息经本地日志批量写入，日志条目的唯一键保证崩溃后重放不会重复插入
+ALTER TABLE `message`
+  ADD COLUMN `journal_key` varchar(32) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci NULL DEFAULT NULL AFTER `created_at`,
+  ADD UNIQUE INDEX `journal_key`(`journal_key` ASC) USING BTREE;
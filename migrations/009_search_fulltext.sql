@@ -0,0 +1,12 @@
+-- 会话标题、消息内容和知识库名称/备注的全文索引，使用 ngram 解析器支持中文（按 ngram_token_size 切分，默认 2）
+-- InnoDB 在事务提交时增量维护全文索引，插入和删除不需要额外处理；
+-- 大量删除后可执行 OPTIMIZE TABLE（配合 innodb_optimize_fulltext_only=ON）清理已删除的词条。
+-- 表中第一个全文索引会重建表并添加隐藏列 FTS_DOC_ID，大表请在低峰期执行；InnoDB 每条语句只能添加一个全文索引。
+ALTER TABLE `chat`
+  ADD FULLTEXT INDEX `ft_title`(`title`) WITH PARSER `ngram`;
+
+ALTER TABLE `message`
+  ADD FULLTEXT INDEX `ft_content`(`content`) WITH PARSER `ngram`;
+
+ALTER TABLE `repository`
+  ADD FULLTEXT INDEX `ft_name_remark`(`name`, `remark`) WITH PARSER `ngram`;
@@ -0,0 +1,44 @@
+from app.services.embedding_cache import _DiskStore
+
+
+def _store(tmp_path, max_rows):
+    return _DiskStore(str(tmp_path / "cache.sqlite3"), "bge-m3", max_rows=max_rows)
+
+
+def test_disk_hits_are_kept_on_eviction(tmp_path):
+    store = _store(tmp_path, max_rows=150)
+    for i in range(100):
+        store.put(f"old{i}", [float(i)])
+    # 让旧记录的使用时间按插入顺序递增，old0 最旧
+    conn = store._conn()
+    conn.executemany(f"UPDATE {store.table} SET last_used = ? WHERE key = ?",
+                     [(i, f"old{i}") for i in range(100)])
+    conn.commit()
+
+    assert store.get("old0") == [0.0]
+    assert store.get_many(["old1"]) == {"old1": [1.0]}
+    # 写入新记录触发淘汰：命中过的记录保留，其余旧记录中最久未使用的被删除
+    store.put_many([(f"new{i}", [0.5]) for i in range(100)])
+
+    assert store.get("old0") == [0.0]
+    assert store.get("old1") == [1.0]
+    assert store.get("old2") is None
+    assert store.get("new99") == [0.5]
+    count = conn.execute(f"SELECT COUNT(*) FROM {store.table}").fetchone()[0]
+    assert count == 150
+
+
+def test_touches_are_batched(tmp_path):
+    store = _store(tmp_path, max_rows=100)
+    store.put("k", [1.0])
+    conn = store._conn()
+    conn.execute(f"UPDATE {store.table} SET last_used = 0")
+    conn.commit()
+
+    store.get("k")
+    # 一次命中不立即写库
+    assert conn.execute(f"SELECT last_used FROM {store.table}").fetchone()[0] == 0
+    # 同一个键重复命中只记一次，超过写入间隔后一并写入
+    store._touched_at -= 31
+    store.get("k")
+    assert conn.execute(f"SELECT last_used FROM {store.table}").fetchone()[0] > 0
@@ -0,0 +1,55 @@
+import io
+
+import pytest
+
+from app import create_app, db
+from app.services import identity
+from config import Config
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    class TestConfig(Config):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path / 'test.db'}"
+        JWT_SECRET_KEY = 'test-secret-key-for-identity-tests'
+        INGESTION_ENABLED = False
+        MESSAGE_JOURNAL_ENABLED = False
+        METRICS_ENABLED = False
+        USER_CACHE_TTL = 3600
+
+    # 每个用例使用新的身份缓存，TTL 足够长，读到新值只能是因为缓存被失效
+    monkeypatch.setattr(identity, '_cache', None)
+    app = create_app(TestConfig)
+    app.static_folder = str(tmp_path / 'static')
+    with app.app_context():
+        db.create_all()
+    client = app.test_client()
+    client.post('/auth/register', json={'username': 'u', 'password': 'p', 'password_confirm': 'p'})
+    token = client.post('/auth/login', json={'username': 'u', 'password': 'p'}).json['data']['access_token']
+    client.environ_base['HTTP_AUTHORIZATION'] = f"Bearer {token}"
+    yield client
+    with app.app_context():
+        db.drop_all()
+        db.engine.dispose()
+
+
+def _profile(client):
+    return client.get('/user/profile').json['data']
+
+
+def test_profile_update_is_visible_to_current_user(client):
+    assert _profile(client)['nickname'] != '新昵称'
+    hits = identity.get_identity_cache().hits
+    assert _profile(client)['nickname'] != '新昵称'
+    assert identity.get_identity_cache().hits > hits  # 第二次读取命中缓存
+
+    assert client.put('/user/profile', json={'nickname': '新昵称'}).json['code'] == 200
+    assert _profile(client)['nickname'] == '新昵称'
+
+
+def test_avatar_upload_is_visible_to_current_user(client):
+    assert _profile(client)['avatar'] != '/static/avatars/1_a.png'
+
+    response = client.post('/user/avatar', data={'file': (io.BytesIO(b'png'), 'a.png')})
+    assert response.json['data']['avatar_url'] == '/static/avatars/1_a.png'
+    assert _profile(client)['avatar'] == '/static/avatars/1_a.png'
@@ -0,0 +1,73 @@
+import json
+import os
+
+import pytest
+
+from app.services.lexical_index import LexicalIndex
+
+
+def _add(index, n):
+    index.add(f"f{n}", [f"f{n}-0"], [f"错误码 E-{1000 + n} 的处理办法"])
+
+
+def _segment_dirs(index):
+    return sorted(name for name in os.listdir(index.directory) if name.startswith("seg-"))
+
+
+def _manifest(index):
+    with open(os.path.join(index.directory, "manifest.json"), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def test_compaction_removes_old_segments_after_manifest(tmp_path):
+    index = LexicalIndex(str(tmp_path / "1"), max_segments=2)
+    reader = LexicalIndex(index.directory)
+    for n in range(2):
+        _add(index, n)
+    assert reader.search("E-1000")[0][0][0] == "f0-0"  # 读取方已打开合并前的段
+
+    _add(index, 2)
+    assert _segment_dirs(index) == _manifest(index)["segments"] == ["seg-000004"]
+    assert reader.search("E-1002")[0][0][0] == "f2-0"
+    assert reader.search("E-1000")[0][0][0] == "f0-0"
+
+
+def test_crash_before_removing_old_segments_leaves_a_valid_index(tmp_path, monkeypatch):
+    index = LexicalIndex(str(tmp_path / "1"), max_segments=2)
+    for n in range(2):
+        _add(index, n)
+
+    def crash(manifest):
+        raise OSError("crash")
+
+    with monkeypatch.context() as m:
+        m.setattr(index, "_remove_unreferenced", crash)
+        with pytest.raises(OSError):
+            _add(index, 2)
+    assert _segment_dirs(index) == ["seg-000001", "seg-000002", "seg-000003", "seg-000004"]
+
+    # manifest 已经指向合并后的段，新打开的读取方可以正常检索
+    assert _manifest(index)["segments"] == ["seg-000004"]
+    assert LexicalIndex(index.directory).search("E-1001")[0][0][0] == "f1-0"
+
+    # 下一次合并时清理遗留的旧段目录
+    for n in range(3, 5):
+        _add(index, n)
+    assert _segment_dirs(index) == _manifest(index)["segments"]
+    assert LexicalIndex(index.directory).search("E-1004")[0][0][0] == "f4-0"
+
+
+def test_reader_rereads_manifest_when_segments_were_removed(tmp_path):
+    index = LexicalIndex(str(tmp_path / "1"), max_segments=2)
+    _add(index, 0)
+    stale = json.dumps(_manifest(index))
+    for n in range(1, 3):
+        _add(index, n)
+
+    # 读取方拿到的是合并前的 manifest，打开段时发现旧段已被删除
+    reader = LexicalIndex(index.directory)
+    original = reader._read_manifest
+    responses = [json.loads(stale)]
+    reader._read_manifest = lambda: responses.pop() if responses else original()
+    assert reader.search("E-1000")[0][0][0] == "f0-0"
+    assert not os.path.exists(os.path.join(index.directory, "seg-000001"))
@@ -0,0 +1,101 @@
+import os
+
+import pytest
+
+from app import create_app, db
+from app.models import Message
+from app.services.message_journal import CREATING_SUFFIX, SEGMENT_SUFFIX, MessageJournal
+from config import Config
+
+
+@pytest.fixture
+def app(tmp_path):
+    class TestConfig(Config):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path / 'test.db'}"
+        INGESTION_ENABLED = False
+        MESSAGE_JOURNAL_ENABLED = False
+        METRICS_ENABLED = False
+
+    app = create_app(TestConfig)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+        db.engine.dispose()
+
+
+def _journal(app, tmp_path):
+    # 不启动后台线程，由用例直接调用 flush、sync_chat 和 recover
+    return MessageJournal(app, str(tmp_path / 'journal'))
+
+
+def _contents(chat_id):
+    return sorted(m.content for m in Message.query.filter_by(chat_id=chat_id))
+
+
+def _segments(journal, suffix=SEGMENT_SUFFIX):
+    return sorted(name for name in os.listdir(journal.directory) if name.endswith(suffix))
+
+
+def test_segment_is_locked_before_it_becomes_visible(app, tmp_path):
+    owner, other = _journal(app, tmp_path), _journal(app, tmp_path)
+    owner.append(1, 'assistant', 'a')
+
+    assert _segments(owner, CREATING_SUFFIX) == []
+    assert len(_segments(owner)) == 1
+    # 所属进程还在运行，recover 拿不到锁时跳过，不重放也不删除
+    assert other.recover() == 0
+    assert len(_segments(owner)) == 1
+    assert _contents(1) == []
+
+
+def test_recover_replays_abandoned_segments(app, tmp_path):
+    owner, other = _journal(app, tmp_path), _journal(app, tmp_path)
+    owner.append(1, 'assistant', 'a')
+    owner._segment[1].close()  # 模拟进程退出，锁随之释放
+    owner._segment = None
+    open(os.path.join(owner.directory, f"dead-00000001{SEGMENT_SUFFIX}{CREATING_SUFFIX}"), 'w').close()
+
+    assert other.recover() == 1
+    assert _contents(1) == ['a']
+    assert os.listdir(owner.directory) == []
+
+
+def test_flush_tolerates_segment_removed_by_another_process(app, tmp_path):
+    journal = _journal(app, tmp_path)
+    journal.append(1, 'assistant', 'a')
+    os.remove(journal._segment[0])
+
+    assert journal.flush() == 1
+    assert journal._sealed == []
+    assert journal._unflushed == {}
+
+    journal.append(1, 'assistant', 'b')
+    assert journal.flush() == 1
+    assert _contents(1) == ['a', 'b']
+    assert journal.stats()['pending'] == 0
+
+
+def test_sync_chat_writes_foreign_entries_incrementally(app, tmp_path):
+    owner, reader = _journal(app, tmp_path), _journal(app, tmp_path)
+    owner.append(1, 'assistant', 'a')
+    owner.append(2, 'assistant', 'x')
+
+    reader.sync_chat(1)
+    assert _contents(1) == ['a']
+    assert _contents(2) == []
+
+    owner.append(1, 'assistant', 'b')
+    reader.sync_chat(1)
+    assert _contents(1) == ['a', 'b']
+    # 已写入的条目从索引中移除，索引只保留其他会话的条目
+    (offset, by_chat), = reader._index.values()
+    assert offset == os.path.getsize(owner._segment[0])
+    assert by_chat[1] == [] and len(by_chat[2]) == 1
+
+    # 所属进程写库并删除段文件后，索引随之丢弃
+    assert owner.flush() == 3
+    reader.sync_chat(2)
+    assert reader._index == {}
+    assert _contents(2) == ['x']
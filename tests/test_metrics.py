@@ -0,0 +1,61 @@
+import json
+import os
+
+from app.services.metrics import RETIRED_SNAPSHOT, Registry, family
+
+DEAD_PID = 2 ** 22 + 1  # 超过 Linux 默认 pid_max，不会是存活的进程
+
+
+def _registry(directory, checkouts):
+    registry = Registry()
+    registry.counter("requests_total", "请求数").inc(2)
+    registry.add_collector(lambda: [
+        family("pool_checkouts_total", "取连接次数", checkouts, kind="counter"),
+        family("pool_checked_out", "当前被占用的连接数", 1),
+    ])
+    registry.directory = str(directory)  # 不启动后台线程，render 时写入本进程的快照
+    return registry
+
+
+def _write_dead_snapshot(directory, name, pid=DEAD_PID):
+    registry = _registry(directory, checkouts=5)
+    snapshot = dict(registry.snapshot(), pid=pid)
+    with open(os.path.join(directory, name), "w", encoding="utf-8") as f:
+        json.dump(snapshot, f)
+
+
+def _values(text):
+    return dict(line.rsplit(" ", 1) for line in text.splitlines() if not line.startswith("#"))
+
+
+def test_counters_from_exited_workers_are_retained(tmp_path):
+    registry = _registry(tmp_path, checkouts=3)
+    _write_dead_snapshot(tmp_path, f"{DEAD_PID}.json")
+
+    first = _values(registry.render())
+    assert first == {"pool_checked_out": "1", "pool_checkouts_total": "8", "requests_total": "4"}
+    # 已退出 worker 的快照被合并进 retired.json 后删除，再次导出时计数不回退
+    assert set(os.listdir(tmp_path)) == {f"{os.getpid()}.json", RETIRED_SNAPSHOT, "retired.lock"}
+    assert _values(registry.render()) == first
+
+    _write_dead_snapshot(tmp_path, f"{DEAD_PID + 1}.json", pid=DEAD_PID + 1)
+    assert _values(registry.render())["pool_checkouts_total"] == "13"
+
+
+def test_folded_snapshot_left_behind_is_not_counted_twice(tmp_path):
+    registry = _registry(tmp_path, checkouts=3)
+    _write_dead_snapshot(tmp_path, f"{DEAD_PID}.json")
+    registry.render()
+    # 模拟合并 retired.json 之后、删除快照之前进程崩溃
+    _write_dead_snapshot(tmp_path, f"{DEAD_PID}.json")
+
+    assert _values(registry.render())["pool_checkouts_total"] == "8"
+    assert not os.path.exists(tmp_path / f"{DEAD_PID}.json")
+
+
+def test_start_keeps_snapshot_of_exited_worker_with_same_pid(tmp_path):
+    _write_dead_snapshot(tmp_path, f"{os.getpid()}.json", pid=os.getpid())
+    registry = _registry(tmp_path, checkouts=3)
+    registry.start(str(tmp_path), interval=3600)
+
+    assert _values(registry.render())["pool_checkouts_total"] == "8"
@@ -0,0 +1,27 @@
+import pytest
+
+from app import create_app
+from config import Config
+
+
+@pytest.fixture
+def client(tmp_path):
+    class TestConfig(Config):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path / 'test.db'}"
+        INGESTION_ENABLED = False
+        MESSAGE_JOURNAL_ENABLED = False
+        METRICS_ENABLED = False
+        METRICS_TOKEN = 'secret'
+
+    return create_app(TestConfig).test_client()
+
+
+@pytest.mark.parametrize('path', ['/metrics', '/ops/db-pool'])
+def test_ops_endpoints_require_metrics_token(client, path):
+    assert client.get(path).status_code == 401
+    assert client.get(path, headers={'Authorization': 'Bearer wrong'}).status_code == 401
+    assert client.get(path, headers={'Authorization': 'Bearer secret'}).status_code == 200
+
+
+def test_liveness_is_public(client):
+    assert client.get('/health').status_code == 200
@@ -0,0 +1,118 @@
+from langchain_core.messages import AIMessage, HumanMessage
+
+from app.services.prompt_assembler import assemble_prompt, estimate_tokens, message_tokens, plan_summary
+
+BUDGET = 4000
+WINDOW = 40
+SYSTEM_PROMPT = "你是政务助手"
+
+
+def _rows(pairs, start_id=1, question="问题", answer="回答"):
+    rows = []
+    for i in range(pairs):
+        rows.append((start_id + 2 * i, "user", f"{question}{i}", None))
+        rows.append((start_id + 2 * i + 1, "assistant", f"{answer}{i}", None))
+    return rows
+
+
+def _history(rows):
+    return [(AIMessage if role == "assistant" else HumanMessage)(content=content, id=f"message-{row_id}")
+            for row_id, role, content, _ in rows]
+
+
+def test_plan_summary_keeps_short_history():
+    assert plan_summary(_rows(10), BUDGET, max_rows=WINDOW) == []
+
+
+def test_plan_summary_folds_when_rows_leave_window():
+    # 每轮只有几个 token，远低于预算的水位，但消息条数已经超过历史窗口
+    rows = _rows(WINDOW // 2 + 1)
+    assert sum(estimate_tokens(row[2]) + 4 for row in rows) < BUDGET * 0.75
+
+    folded = plan_summary(rows, BUDGET, max_rows=WINDOW)
+    assert folded
+    assert folded == rows[:len(folded)]
+    # 保留的原文不超过窗口的一半，并且以完整的一轮问答为界
+    assert len(rows) - len(folded) <= WINDOW // 2
+    assert folded[-1][1] == "assistant"
+
+
+def test_plan_summary_folds_when_over_token_budget():
+    rows = _rows(11, answer="需要身份证、户口本和居住证明。" * 20)
+    folded = plan_summary(rows, BUDGET, max_rows=WINDOW)
+    assert folded
+    tail = rows[len(folded):]
+    assert sum(estimate_tokens(row[2]) + 4 for row in tail) <= BUDGET * 0.4
+    assert folded[-1][1] == "assistant"
+
+
+def test_plan_summary_skips_already_summarized_rows():
+    rows = _rows(WINDOW)
+    folded = plan_summary(rows, BUDGET, summary_until_id=rows[9][0], max_rows=WINDOW)
+    assert folded[0][0] == rows[10][0]
+
+
+def test_plan_summary_limits_each_fold_to_budget():
+    # 升级前积压的长会话：一次只并入不超过预算的消息，剩下的之后再并入
+    rows = _rows(300, answer="需要身份证、户口本和居住证明。" * 10)
+    folded = plan_summary(rows, BUDGET, max_rows=WINDOW)
+    assert folded
+    assert sum(estimate_tokens(row[2]) + 4 for row in folded) <= BUDGET + 200
+    assert len(folded) < len(rows) - WINDOW // 2
+
+
+def test_plan_summary_does_not_fold_unanswered_question():
+    # 最新一条回答还在消息日志中，尚未写库
+    rows = _rows(WINDOW)[:-1] + [(1000, "user", "还没有回答的问题", None)]
+    rows = [(row_id, role, "很长的内容" * 400, created_at) for row_id, role, _, created_at in rows]
+    folded = plan_summary(rows, 200, max_rows=4)
+    assert folded
+    assert folded[-1][1] == "assistant"
+
+
+def _simulate(turns, question, answer):
+    """按聊天接口的流程逐轮组装提示词并更新摘要，返回每轮的 (提示词 token 数, 缺失的消息 ID)"""
+    rows, summarized, summary_until_id = [], [], 0
+    results = []
+    next_id = 1
+    for turn in range(turns):
+        content = f"{question}{turn}"
+        # 聊天接口只加载最近 WINDOW 条消息作为历史
+        prompt = assemble_prompt(SYSTEM_PROMPT, _history(rows[-WINDOW:]) + [HumanMessage(content)],
+                                 BUDGET, "摘要" if summarized else None, summary_until_id)
+        prompt_ids = {int(message.id[len("message-"):]) for message in prompt
+                      if (message.id or "").startswith("message-")}
+        missing = [row[0] for row in rows if row[0] > summary_until_id and row[0] not in prompt_ids]
+        results.append((sum(message_tokens(message) for message in prompt), missing))
+
+        rows.append((next_id, "user", content, None))
+        rows.append((next_id + 1, "assistant", f"{answer}{turn}", None))
+        next_id += 2
+        # 摘要规划读取水位之后的全部消息
+        folded = plan_summary([row for row in rows if row[0] > summary_until_id], BUDGET,
+                              summary_until_id, max_rows=WINDOW)
+        if folded:
+            assert folded[0][0] == summary_until_id + 1, "摘要必须从水位之后连续并入"
+            summarized.extend(row[0] for row in folded)
+            summary_until_id = folded[-1][0]
+    return results, summarized, rows
+
+
+def test_short_turns_never_drop_out_of_prompt_and_summary():
+    results, summarized, rows = _simulate(300, "好", "嗯")
+    # 每条消息要么在摘要里，要么原文在提示词里
+    assert all(not missing for _, missing in results)
+    assert summarized == list(range(1, len(summarized) + 1))
+    assert len(rows) - len(summarized) <= WINDOW
+
+
+def test_prompt_stays_bounded_over_hundreds_of_turns():
+    results, summarized, _ = _simulate(
+        300, "请问办理居住证需要准备哪些材料，在哪里办理？" * 2,
+        "需要身份证、户口本和居住证明，到街道便民服务中心办理。" * 6)
+    tokens = [prompt_tokens for prompt_tokens, _ in results]
+    assert max(tokens) <= BUDGET
+    assert all(not missing for _, missing in results)
+    # 提示词大小不随轮数增长
+    assert max(tokens[-50:]) <= max(tokens[:100])
+    assert summarized
@@ -0,0 +1,71 @@
+import numpy as np
+
+from app.services.retrieval import HybridRetriever, rrf_fuse
+
+QUERY = np.asarray([1.0, 0.0, 0.0, 0.0])
+# v1、v2 与查询向量相近；code 是只被关键词命中的块（例如错误码），向量与查询几乎无关
+VECTORS = {
+    "v1": [0.9, 0.44, 0.0, 0.0],
+    "v2": [0.9, 0.0, 0.44, 0.0],
+    "v3": [0.8, 0.0, 0.0, 0.6],
+    "code": [0.05, 0.0, -0.6, 0.8],
+}
+
+
+class FakeEmbeddings:
+    def embed_query(self, query):
+        return QUERY.tolist()
+
+
+class FakeCollection:
+    def query(self, query_embeddings, n_results, include):
+        ids = ["v1", "v2", "v3"][:n_results]
+        return {"ids": [ids], "documents": [ids], "metadatas": [[{} for _ in ids]],
+                "embeddings": [[np.asarray(VECTORS[chunk_id]) for chunk_id in ids]]}
+
+    def get(self, ids, include):
+        return {"ids": ids, "documents": ids, "metadatas": [{} for _ in ids],
+                "embeddings": [np.asarray(VECTORS[chunk_id]) for chunk_id in ids]}
+
+
+class FakeVectorStore:
+    embeddings = FakeEmbeddings()
+    _collection = FakeCollection()
+
+
+class FakeLexicalIndex:
+    def __init__(self, hits, coverage):
+        self.hits, self.coverage = hits, coverage
+
+    def exists(self):
+        return True
+
+    def search(self, query, k):
+        return self.hits[:k], self.coverage
+
+
+def _search(lexical_index):
+    retriever = HybridRetriever(FakeVectorStore(), lexical_index, k=2, fetch_k=10)
+    return [doc.page_content for doc in retriever.search("E-1042 报错")], retriever.last_path
+
+
+def test_lexical_only_match_survives_rerank():
+    docs, path = _search(FakeLexicalIndex([("code", 8.0), ("v1", 2.0)], coverage=0.5))
+    assert path == "hybrid"
+    assert docs == ["v1", "code"]
+
+
+def test_vector_path_ranks_by_cosine():
+    docs, path = _search(None)
+    assert path == "vector"
+    assert docs[0] == "v1" and "code" not in docs
+
+
+def test_lexical_fast_path_skips_embedding():
+    docs, path = _search(FakeLexicalIndex([("code", 8.0), ("v3", 2.0)], coverage=1.0))
+    assert path == "lexical"
+    assert docs[0] == "code"
+
+
+def test_rrf_fuse_prefers_documents_ranked_by_both():
+    assert rrf_fuse([["a", "b", "c"], ["c", "a"]]) == ["a", "c", "b"]
@@ -0,0 +1,129 @@
+import json
+import threading
+import time
+
+from app.services.sse import StreamBuffer, StreamRegistry, iter_frames, parse_event_id
+
+
+def _parse(frame):
+    """解析一个 SSE 帧，返回 (事件 ID, 事件类型, 数据)；心跳返回 None"""
+    if frame.startswith(":"):
+        return None
+    fields = {}
+    for line in frame.strip("\n").split("\n"):
+        name, _, value = line.partition(": ")
+        fields[name] = fields[name] + "\n" + value if name in fields else value
+    return fields.get("id"), fields["event"], json.loads(fields["data"])
+
+
+def _produce(buffer, tokens, delay=0.0, close=True):
+    buffer.append("sources", {"sources": [{"file_id": "f"}]})
+    for token in tokens:
+        buffer.append("token", token)
+        if delay:
+            time.sleep(delay)
+    buffer.append("done", {"completed": True})
+    if close:
+        buffer.close()
+
+
+def _content(events):
+    return "".join(data["content"] for _, event, data in events if event == "token")
+
+
+def test_first_token_is_not_delayed_by_coalescing():
+    buffer = StreamBuffer("s1")
+    frames = iter_frames(buffer, coalesce_chars=1000, coalesce_delay=1.0, heartbeat=60)
+    started = time.monotonic()
+    threading.Timer(0.05, lambda: buffer.append("token", "你")).start()
+    event_id, event, data = _parse(next(frames))
+    elapsed = time.monotonic() - started
+    assert (event, data) == ("token", {"content": "你"})
+    assert event_id == "s1:1"
+    assert elapsed < 0.5
+
+
+def test_tokens_are_coalesced_without_loss():
+    buffer = StreamBuffer("s2")
+    tokens = [f"t{i:03d}" for i in range(200)]
+    _produce(buffer, tokens)
+    events = [_parse(frame) for frame in iter_frames(buffer, coalesce_chars=32, coalesce_delay=0.05)]
+    token_events = [item for item in events if item[1] == "token"]
+
+    assert _content(events) == "".join(tokens)
+    assert len(token_events) < len(tokens) // 4
+    # 除第一帧和最后一帧外，每帧至少 coalesce_chars 个字符
+    assert all(len(data["content"]) >= 32 for _, _, data in token_events[1:-1])
+    assert [event for _, event, _ in events].count("done") == 1
+    assert events[-1][1] == "done"
+    assert events[-1][2]["frames"] == len(events)
+
+
+def test_heartbeat_when_idle():
+    buffer = StreamBuffer("s3")
+    frames = iter_frames(buffer, heartbeat=0.05)
+    started = time.monotonic()
+    assert next(frames) == ": ping\n\n"
+    assert time.monotonic() - started < 1
+    buffer.append("token", "a")
+    assert _parse(next(frames))[1:] == ("token", {"content": "a"})
+
+
+def _read_until(frames, count):
+    events = []
+    for frame in frames:
+        parsed = _parse(frame)
+        if parsed is None:
+            continue
+        events.append(parsed)
+        if len(events) == count:
+            break
+    frames.close()
+    return events
+
+
+def test_resume_with_last_event_id_has_no_gaps_or_duplicates():
+    buffer = StreamBuffer("s4", chat_id=1)
+    tokens = [f"<{i}>" for i in range(300)]
+    producer = threading.Thread(target=_produce, args=(buffer, tokens, 0.001))
+    producer.start()
+
+    received = []
+    last_event_id = None
+    # 多次断线重连，每次只读几帧，按最后收到的事件 ID 续传
+    while not received or received[-1][1] != "done":
+        _, after = parse_event_id(last_event_id)
+        batch = _read_until(iter_frames(buffer, after, coalesce_chars=8, coalesce_delay=0.005), 3)
+        received.extend(batch)
+        last_event_id = batch[-1][0]
+    producer.join()
+
+    sequences = [int(event_id.rpartition(":")[2]) for event_id, _, _ in received]
+    assert sequences == sorted(set(sequences))
+    assert _content(received) == "".join(tokens)
+    assert [event for _, event, _ in received].count("sources") == 1
+    assert [event for _, event, _ in received].count("done") == 1
+
+
+def test_resume_after_stream_finished_replays_the_rest():
+    buffer = StreamBuffer("s5")
+    tokens = [f"{i}," for i in range(50)]
+    _produce(buffer, tokens)
+    first = _read_until(iter_frames(buffer, coalesce_chars=10, coalesce_delay=0), 3)
+    _, after = parse_event_id(first[-1][0])
+    rest = [_parse(frame) for frame in iter_frames(buffer, after, coalesce_chars=10, coalesce_delay=0)]
+    assert _content(first + rest) == "".join(tokens)
+    assert rest[-1][1] == "done"
+
+
+def test_parse_event_id_and_registry():
+    assert parse_event_id("abc:12") == ("abc", 12)
+    assert parse_event_id("bad") == (None, 0)
+    assert parse_event_id("abc:x") == (None, 0)
+    registry = StreamRegistry(ttl=0)
+    old = registry.create("old")
+    old.close()
+    old.closed_at -= 1
+    registry.create("new")
+    assert registry.get("old") is None
+    assert registry.get("new") is not None
@@ -1,9 +1,9 @@
 import {http} from '../utils/http.js'
 import { useUserStore } from '../store/user.js'
 
-// 获取聊天列表
-export const getChats = () => {
-  return http.get('/chat/chats')
+// 获取聊天列表，params: { limit, cursor }
+export const getChats = (params = {}) => {
+  return http.get('/chat/chats', params)
 }
 
 // 创建聊天
@@ -11,9 +11,9 @@ export const createChat = (data) => {
   return http.post('/chat/chats', data)
 }
 
-// 获取聊天消息
-export const getMessages = (chatId) => {
-  return http.get(`/chat/chats/${chatId}/messages`)
+// 获取聊天消息，params: { latest } 或 { before, limit }
+export const getMessages = (chatId, params = {}) => {
+  return http.get(`/chat/chats/${chatId}/messages`, params)
 }
 
 // 发送消息
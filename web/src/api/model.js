@@ -1,13 +1,25 @@
-import {http} from '../utils/http.js'
+import {http, NOT_MODIFIED} from '../utils/http.js'
 
-// 获取模型列表
+// 本地保存的模型列表及其 ETag
+const MODELS_CACHE_KEY = 'model_catalog'
+
+// 获取模型列表：带上次的 ETag 请求，目录未变化时服务端返回 304，直接使用本地保存的列表
 export const getModels = async () => {
   try {
     console.log('发送模型列表请求')
-    const response = await http.get('/model/models')
-    console.log('模型列表响应:', response)
-    if (Array.isArray(response)) {
-      return response
+    const cached = uni.getStorageSync(MODELS_CACHE_KEY) || null
+    const header = cached && cached.etag ? { 'If-None-Match': cached.etag } : {}
+    const { data, header: responseHeader } = await http.get('/model/models', {}, { header, withResponseHeader: true })
+    console.log('模型列表响应:', data)
+    if (data === NOT_MODIFIED && cached) {
+      return cached.models
+    }
+    if (Array.isArray(data)) {
+      const etag = responseHeader.ETag || responseHeader.etag || responseHeader.Etag
+      if (etag) {
+        uni.setStorageSync(MODELS_CACHE_KEY, { etag, models: data })
+      }
+      return data
     }
     throw new Error('获取模型列表失败：响应数据格式错误')
   } catch (error) {
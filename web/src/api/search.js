@@ -0,0 +1,7 @@
+import {http} from '../utils/http.js'
+
+// 搜索会话标题、消息内容和知识库
+// params: { q, type, limit, cursor }，不传 type 时返回 { chats, messages, repositories } 三组第一页结果
+export const search = (params = {}) => {
+  return http.get('/search', params)
+}
@@ -16,14 +16,37 @@ export const useChatStore = defineStore('chat', () => {
   const loading = ref(false)
   // 流式响应状态
   const streaming = ref(false)
+  // 分页游标：会话列表的下一页、当前聊天更早的消息，为 null 表示没有更多
+  const chatsCursor = ref(null)
+  const messagesCursor = ref(null)
+
+  // 每页会话数、打开聊天时先加载的最新消息数
+  const CHATS_PAGE_SIZE = 20
+  const MESSAGES_PAGE_SIZE = 50
 
   const modelStore = useModelStore()
 
-  // 获取聊天列表
+  // 获取聊天列表（第一页）
   const fetchChats = async () => {
     try {
-      const data = await getChats()
-      chats.value = data
+      const data = await getChats({ limit: CHATS_PAGE_SIZE })
+      chats.value = data.items
+      chatsCursor.value = data.next_cursor
+    } catch (error) {
+      console.error('获取聊天列表失败', error)
+      throw error
+    }
+  }
+
+  // 加载下一页会话
+  const fetchMoreChats = async () => {
+    if (!chatsCursor.value) {
+      return
+    }
+    try {
+      const data = await getChats({ limit: CHATS_PAGE_SIZE, cursor: chatsCursor.value })
+      chats.value = chats.value.concat(data.items)
+      chatsCursor.value = data.next_cursor
     } catch (error) {
       console.error('获取聊天列表失败', error)
       throw error
@@ -45,13 +68,14 @@ export const useChatStore = defineStore('chat', () => {
     }
   }
 
-  // 获取聊天消息
+  // 获取聊天消息：先只加载最新的一页
   const fetchMessages = async (chatId) => {
     try {
       loading.value = true
       currentChatId.value = chatId
-      const data = await getMessages(chatId)
-      currentMessages.value = data
+      const data = await getMessages(chatId, { latest: MESSAGES_PAGE_SIZE })
+      currentMessages.value = data.items
+      messagesCursor.value = data.next_cursor
     } catch (error) {
       console.error('获取聊天消息失败：', error)
       throw error
@@ -60,6 +84,26 @@ export const useChatStore = defineStore('chat', () => {
     }
   }
 
+  // 加载更早的消息，插入到列表前面
+  const fetchOlderMessages = async () => {
+    if (!currentChatId.value || !messagesCursor.value) {
+      return
+    }
+    const chatId = currentChatId.value
+    try {
+      const data = await getMessages(chatId, { before: messagesCursor.value, limit: MESSAGES_PAGE_SIZE })
+      // 加载期间切换了聊天，丢弃结果
+      if (chatId !== currentChatId.value) {
+        return
+      }
+      currentMessages.value = data.items.concat(currentMessages.value)
+      messagesCursor.value = data.next_cursor
+    } catch (error) {
+      console.error('获取聊天消息失败：', error)
+      throw error
+    }
+  }
+
   // 发送消息
   const sendChatMessage = async (content, onChunkReceived) => {
     if (!currentChatId.value) {
@@ -124,6 +168,7 @@ export const useChatStore = defineStore('chat', () => {
   const clearCurrentChat = () => {
     currentChatId.value = null
     currentMessages.value = []
+    messagesCursor.value = null
     currentRepository.value = null
   }
 
@@ -166,9 +211,13 @@ export const useChatStore = defineStore('chat', () => {
     currentRepository,
     loading,
     streaming,
+    chatsCursor,
+    messagesCursor,
     fetchChats,
+    fetchMoreChats,
     newChat,
     fetchMessages,
+    fetchOlderMessages,
     sendChatMessage,
     clearCurrentChat,
     removeChat,
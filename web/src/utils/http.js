@@ -38,12 +38,19 @@ const requestInterceptor = (options) => {
   return options;
 };
 
+// 协商缓存命中（304）时请求返回的值，调用方改用本地保存的数据
+export const NOT_MODIFIED = Object.freeze({ notModified: true });
+
 // 响应拦截器
 const responseInterceptor = async (response) => {
   console.log("响应拦截器收到响应:", response);
   // uni.request 的响应结构
   const { statusCode, data } = response;
 
+  if (statusCode === 304) {
+    return NOT_MODIFIED;
+  }
+
   // 请求成功
   if (statusCode >= 200 && statusCode < 300) {
     // 如果后端返回的数据结构是 { code, data, message }
@@ -124,7 +131,8 @@ const request = (options) => {
           // 响应拦截
           const data = await responseInterceptor(res);
           console.log("响应拦截后的数据:", data);
-          resolve(data);
+          // withResponseHeader 为 true 时同时返回响应头（例如读取 ETag）
+          resolve(options.withResponseHeader ? { data, header: res.header || {} } : data);
         } catch (error) {
           reject(error);
         }